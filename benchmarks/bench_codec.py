@@ -0,0 +1,90 @@
+"""
+Compare the available json codecs on large eth_getLogs and
+eth_getBlockByNumber (full transactions) responses.
+
+    python benchmarks/bench_codec.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from empyrean.codecs import available_codecs  # noqa: E402
+
+
+def word(i):
+    return "0x" + format(i, "064x")
+
+
+def address(i):
+    return "0x" + format(i, "040x")
+
+
+def log(i):
+    return {
+        "address": address(i % 50),
+        "topics": [word(i), word(i + 1), word(i + 2)],
+        "data": "0x" + "00" * 64,
+        "blockNumber": hex(1000000 + i // 100),
+        "transactionHash": word(i * 7),
+        "transactionIndex": hex(i % 100),
+        "blockHash": word(i // 100),
+        "logIndex": hex(i % 100),
+        "removed": False,
+    }
+
+
+def transaction(i):
+    return {
+        "hash": word(i),
+        "nonce": hex(i),
+        "blockHash": word(1),
+        "blockNumber": hex(1000000),
+        "transactionIndex": hex(i),
+        "from": address(i),
+        "to": address(i + 1),
+        "value": hex(10 ** 18),
+        "gas": hex(90000),
+        "gasPrice": hex(20 * 10 ** 9),
+        "input": "0x" + "ab" * 68,
+        "v": "0x1b",
+        "r": word(i),
+        "s": word(i + 1),
+    }
+
+
+def response(result):
+    return {"jsonrpc": "2.0", "id": 1, "result": result}
+
+
+PAYLOADS = {
+    "getLogs (20000 logs)": response([log(i) for i in range(20000)]),
+    "getBlock (300 full txs)": response({
+        "number": hex(1000000),
+        "hash": word(1),
+        "parentHash": word(0),
+        "logsBloom": "0x" + "00" * 256,
+        "transactions": [transaction(i) for i in range(300)],
+        "uncles": [],
+    }),
+}
+
+
+def main(number=10):
+    for name, payload in sorted(PAYLOADS.items()):
+        print(name)
+        for codec in available_codecs():
+            encoded = codec.dumps(payload)
+            dumps = timeit.timeit(lambda: codec.dumps(payload),
+                                  number=number) / number
+            loads = timeit.timeit(lambda: codec.loads(encoded),
+                                  number=number) / number
+            print("  {0:8} {1:8.1f} KB  dumps {2:7.2f} ms  "
+                  "loads {3:7.2f} ms".format(codec.name, len(encoded) / 1024,
+                                             dumps * 1000, loads * 1000))
+
+
+if __name__ == '__main__':
+    main()
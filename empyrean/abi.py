@@ -238,6 +238,12 @@ class AddressType(UIntType):
         super().__init__(type)
         self.bits = 160
 
+    def enc(self, i):
+        # also accept addresses the way the json-rpc api writes them
+        if isinstance(i, str):
+            i = int(i, 16)
+        return super().enc(i)
+
 abitypes = dict(
     int=IntType,
     uint=UIntType,
@@ -271,6 +277,23 @@ def enc_method(signature):
     return method
 
 
+def enc_event(signature):
+    """ the first topic of an event's logs: the keccak hash of its
+        canonical signature """
+    return sha3.keccak_256(signature.encode("ascii")).digest()
+
+
+def decode_topic(type, topic):
+    """ decode an indexed event argument. Dynamic types and arrays are
+        stored as the hash of their value, which is returned as is """
+    t = get_type(type)
+    if t.isdynamic or t.isarray:
+        return topic
+    if topic.startswith("0x"):
+        topic = topic[2:]
+    return t.dec_complex(binascii.unhexlify(topic))
+
+
 def get_type(type):
     basetype = re.match("^([a-z]+)(\d+)?", type).group(1)
     t = abitypes.get(basetype)(type)
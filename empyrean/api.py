@@ -1,23 +1,88 @@
 # -*- coding: utf-8 -*-
 
-from .connectors import IPCConnector, HTTPConnector
+import itertools
+
+from .connectors import IPCConnector, HTTPConnector, WebSocketConnector
+from .balancing import MultiConnector
+from .batching import MicroBatcher
+from .cache import request_cacheable, result_cacheable, head_cacheable
+from .cache import cache_key
+from .singleflight import SingleFlight
+from .head import HeadTracker
+from .hedging import HedgedConnector
+from .limiting import AdaptiveLimiter, LimitedConnector
+from .scheduling import PriorityConnector, Scheduler
 
 #   --ipcapi "admin,eth,debug,miner,net,shh,txpool,personal,web3" API's offered over the IPC-RPC interface
 
 
-from .methods import AdminNamespace, EthNamespace
+from .methods import AdminNamespace, DebugNamespace, EthNamespace
 from .methods import MinerNamespace, NetNamespace
 from .methods import ShhNamespace, TxpoolNamespace
 from .methods import PersonalNamespace, Web3Namespace
+from .methods import is_idempotent
 
 
 class API(object):
     connector_class = None
 
-    def __init__(self, connectiondata):
-        self.connector = self.connector_class(connectiondata)
+    def __init__(self, connectiondata, batch_window=None, batch_size=50,
+                 cache=None, block_cache=None, coalesce=False, store=None,
+                 hedge=False, limit=None, rate_limits=None, scheduler=None,
+                 **connector_options):
+        """ If batch_window (in seconds) is given, calls made from
+            different threads within that window are sent to the node as
+            a single batch of at most batch_size calls.
+
+            cache (e.g. an empyrean.cache.LRUCache) holds the results of
+            calls that can't change anymore, block_cache (a BlockCache)
+            those of reads against the latest block.
+
+            With coalesce, identical read calls that are in flight at the
+            same time are sent to the node only once.
+
+            store (an empyrean.store.ChainStore) is consulted for blocks
+            and receipts before the node, and keeps what's fetched
+
+            With hedge, reads that take longer than most are sent a
+            second time, and the first answer is used. See
+            empyrean.hedging
+
+            limit (True or an empyrean.limiting.AdaptiveLimiter) adapts
+            the number of calls in flight to what the node can take,
+            rate_limits caps methods at a number of calls per second,
+            e.g. {"eth_getLogs": 10}
+
+            scheduler (True or an empyrean.scheduling.Scheduler) has
+            calls take turns at the node by priority, see
+            empyrean.scheduling.priority() """
+        self.connector = self.connector_class(connectiondata,
+                                              **connector_options)
+        if limit or rate_limits:
+            if limit is True:
+                limit = AdaptiveLimiter()
+            self.connector = LimitedConnector(self.connector, limit or None,
+                                              rate_limits)
+        if scheduler:
+            if scheduler is True:
+                scheduler = Scheduler()
+            self.connector = PriorityConnector(self.connector, scheduler)
+        if hedge:
+            self.connector = HedgedConnector(self.connector)
+        self._ids = itertools.count(1)
+        self.cache = cache
+        self.block_cache = block_cache
+        self.singleflight = SingleFlight() if coalesce else None
+        self.store = store
+        self.head_tracker = None
+
+        self.batcher = None
+        if batch_window is not None:
+            self.batcher = MicroBatcher(self.connector, window=batch_window,
+                                        max_size=batch_size)
 
         self.admin = AdminNamespace(self)
+        self.debug = DebugNamespace(self)
         self.eth = EthNamespace(self)
         self.miner = MinerNamespace(self)
         self.net = NetNamespace(self)
@@ -26,21 +91,131 @@ class API(object):
         self.personal = PersonalNamespace(self)
         self.web3 = Web3Namespace(self)
 
-    def _call(self, command, *args):
-        # id can be used to match request/response. Makes most sense
-        # in async setup
-        data = dict(jsonrpc='2.0',
+    def _request(self, command, args):
+        # id is used to match request/response in batches
+        return dict(jsonrpc='2.0',
                     method=command,
                     params=args,
-                    id=1)
+                    id=next(self._ids))
+
+    def track_head(self, **options):
+        """ start a HeadTracker (see empyrean.head) that keeps the head
+            up to date for everything using this API. eth_blockNumber is
+            answered from it without a round trip """
+        if self.head_tracker is None:
+            self.head_tracker = HeadTracker(self, **options)
+        return self.head_tracker.start()
+
+    def _call(self, command, *args):
+        tracker = self.head_tracker
+        if command == "eth_blockNumber" and tracker is not None:
+            number = tracker.number
+            if number is not None:
+                return hex(number)
+
+        store = self.store
+        if store is not None and store.handles(command):
+            res = store.lookup(command, args)
+            if res is None:
+                res = self._cached(command, args)
+                store.save(command, args, res)
+            return res
+
+        return self._cached(command, args)
+
+    def _cached(self, command, args):
+        if self.cache is not None and request_cacheable(command, args):
+            key = cache_key(command, args)
+            res = self.cache.get(key)
+            if res is None:
+                res = self._invoke(command, args)
+                if result_cacheable(command, res):
+                    self.cache.set(key, res)
+            return res
+
+        block_cache = self.block_cache
+        if block_cache is not None and head_cacheable(command, args):
+            key = cache_key(command, args)
+            head = block_cache.head
+            res = block_cache.get(key)
+            if res is None:
+                res = self._invoke(command, args)
+                if res is not None:
+                    block_cache.set(key, res, head)
+            return res
+
+        res = self._invoke(command, args)
+        if command == "eth_blockNumber":
+            self._new_head(int(res, 16))
+        return res
+
+    def _new_head(self, number, block_hash=None):
+        """ tell the caches and store about a (possibly) new head """
+        if self.block_cache is not None:
+            self.block_cache.new_head(number, block_hash)
+        if self.store is not None:
+            self.store.new_head(number)
+
+    def _invoke(self, command, args):
+        if self.singleflight is not None and is_idempotent(command):
+            return self.singleflight.do(cache_key(command, args),
+                                        lambda: self._send(command, args))
+        return self._send(command, args)
+
+    def _send(self, command, args):
+        data = self._request(command, args)
+
+        if self.batcher is not None:
+            return self.batcher.submit(data).result()
 
         res = self.connector.invoke(data)
         return res
 
+    def call_batch(self, calls, return_exceptions=False):
+        """ invoke a sequence of (command, args) pairs as one batch
+            request. Returns the results in order, raises the first
+            error encountered unless return_exceptions is set, in which
+            case failed calls get their exception in place of a result """
+        batch = [self._request(command, tuple(args))
+                 for command, args in calls]
+        if not batch:
+            return []
+
+        results = self.connector.invoke_batch(batch)
+        if not return_exceptions:
+            for res in results:
+                if isinstance(res, Exception):
+                    raise res
+        return results
+
+    def _stream(self, command, *args):
+        """ like _call, but returns an iterator over the items of an
+            array result, parsed as they arrive. Bypasses batching """
+        return self.connector.invoke_stream(self._request(command, args))
+
+    def _call_to_file(self, command, *args, file=None):
+        """ like _call, but writes the raw response to `file` (a
+            temporary file by default) and returns a RawResponse """
+        return self.connector.invoke_to_file(self._request(command, args),
+                                             file=file)
+
+    def subscribe(self, kind, *params, **options):
+        """ push notifications for `kind`, see Connector.subscribe. Only
+            IPC and websocket connections support this """
+        return self.connector.subscribe(kind, *params, **options)
+
     def call_ns(self, ns, command, *args):
         nscommand = "{0}_{1}".format(ns.name, command)
         return self._call(nscommand, *args)
 
+    def stream_ns(self, ns, command, *args):
+        nscommand = "{0}_{1}".format(ns.name, command)
+        return self._stream(nscommand, *args)
+
+    def call_ns_to_file(self, ns, command, *args, file=None):
+        nscommand = "{0}_{1}".format(ns.name, command)
+        return self._call_to_file(nscommand, *args, file=file)
+
 
 class IPCAPI(API):
     connector_class = IPCConnector
@@ -48,3 +223,13 @@ class IPCAPI(API):
 
 class HTTPAPI(API):
     connector_class = HTTPConnector
+
+
+class WSAPI(API):
+    connector_class = WebSocketConnector
+
+
+class MultiAPI(API):
+    """ over several nodes, connectiondata is a list of urls, ipc paths
+        or connectors. See empyrean.balancing """
+    connector_class = MultiConnector
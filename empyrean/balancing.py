@@ -0,0 +1,257 @@
+"""
+Spreading calls over several nodes.
+
+A MultiConnector wraps a connector per node and sends each read to the
+node that should answer first: the one with the lowest latency (an
+exponentially weighted moving average) weighed by the number of calls
+it has in flight. Nodes that fail repeatedly, or whose head lags behind
+the others, are ejected for a while. Reads that fail because a node is
+unreachable or slow are retried on another node.
+
+Writes, and reads of the transaction pool ("pending"), stay on one node
+so that transactions and nonces are seen in the order they were sent.
+Nothing with side effects is ever retried.
+"""
+
+import time
+import threading
+
+from .connectors import Connector, TIMEOUTS
+from .connectors import IPCConnector, HTTPConnector, WebSocketConnector
+from .deadlines import expired, DeadlineExceeded
+from .exceptions import JSONRPCException
+from .methods import is_idempotent
+
+# what makes a node worth trying another one for
+FAILURES = (ConnectionError, OSError) + TIMEOUTS
+
+
+def make_connector(endpoint):
+    """ a connector for a url or ipc path """
+    if isinstance(endpoint, Connector):
+        return endpoint
+    if endpoint.startswith(("http://", "https://")):
+        return HTTPConnector(endpoint)
+    if endpoint.startswith(("ws://", "wss://")):
+        return WebSocketConnector(endpoint)
+    return IPCConnector(endpoint)
+
+
+def uses_pending(data):
+    return "pending" in data.get("params", ())
+
+
+class Backend(object):
+
+    def __init__(self, connector, alpha):
+        self.connector = connector
+        self.alpha = alpha
+        self.latency = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = 0
+        # ejected only for being behind, over once it catches up
+        self.lagging = False
+        self.head = None
+
+    def score(self, default_latency):
+        latency = self.latency if self.latency is not None else \
+            default_latency
+        return latency * (self.in_flight + 1)
+
+    def healthy(self, now):
+        return now >= self.ejected_until
+
+    def observe(self, elapsed):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += self.alpha * (elapsed - self.latency)
+
+    def __repr__(self):
+        return "<Backend {0!r} latency={1} in_flight={2}>".format(
+            self.connector, self.latency, self.in_flight)
+
+
+class MultiConnector(Connector):
+
+    def __init__(self, endpoints, alpha=0.2, max_failures=3, eject_time=30,
+                 max_lag=3, retries=2, check_interval=5):
+        """ endpoints are connectors, urls or ipc paths. A node is
+            ejected for eject_time seconds after max_failures failures
+            in a row, or when its head is more than max_lag blocks
+            behind the best one (checked every check_interval seconds,
+            if set) """
+        self.backends = [Backend(make_connector(e), alpha)
+                         for e in endpoints]
+        if not self.backends:
+            raise ValueError("No endpoints")
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.max_lag = max_lag
+        self.retries = retries
+        self.check_interval = check_interval
+
+        self.writer = None
+        self._lock = threading.Lock()
+        self._checker = None
+        self._stop = threading.Event()
+
+    # choosing
+
+    def choose(self, exclude=()):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.healthy(now)]
+            if not healthy:
+                # everything is down, the one back soonest may be up
+                return min(candidates, key=lambda b: b.ejected_until)
+            known = [b.latency for b in healthy if b.latency is not None]
+            # untried nodes look better than the best, so they get tried
+            default = min(known) / 2 if known else 0.001
+            return min(healthy, key=lambda b: b.score(default))
+
+    def sticky(self):
+        """ the node writes go to, kept until it's ejected """
+        now = time.monotonic()
+        with self._lock:
+            writer = self.writer
+            if writer is not None and writer.healthy(now):
+                return writer
+        writer = self.choose()
+        with self._lock:
+            self.writer = writer
+        return writer
+
+    # bookkeeping
+
+    def _begin(self, backend):
+        with self._lock:
+            backend.in_flight += 1
+        return time.monotonic()
+
+    def _end(self, backend, began, failed=False):
+        """ began is None for calls that tell nothing about the node """
+        with self._lock:
+            backend.in_flight -= 1
+            if failed:
+                backend.failures += 1
+                if backend.failures >= self.max_failures:
+                    self.eject(backend)
+            elif began is not None:
+                backend.observe(time.monotonic() - began)
+                backend.failures = 0
+
+    def eject(self, backend, lagging=False):
+        backend.ejected_until = time.monotonic() + self.eject_time
+        backend.lagging = lagging
+        backend.failures = 0
+        if self.writer is backend:
+            self.writer = None
+
+    # health checks
+
+    def check(self):
+        """ ask every node for its head. Unreachable and lagging nodes
+            are ejected, lagging ones are back in once they caught up.
+            Nodes ejected for failing calls sit out their eject_time,
+            answering this one call doesn't make them reliable """
+        for backend in self.backends:
+            try:
+                backend.head = int(self._attempt(backend, lambda c: c.invoke(
+                    dict(jsonrpc="2.0", id=0, method="eth_blockNumber",
+                         params=[]))), 16)
+            except (JSONRPCException,) + FAILURES:
+                backend.head = None
+                with self._lock:
+                    self.eject(backend)
+
+        heads = [b.head for b in self.backends if b.head is not None]
+        best = max(heads) if heads else None
+        with self._lock:
+            for backend in self.backends:
+                if backend.head is None:
+                    continue
+                if backend.head < best - self.max_lag:
+                    self.eject(backend, lagging=True)
+                elif backend.lagging:
+                    backend.ejected_until = 0
+                    backend.lagging = False
+
+    def _check_loop(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def _start_checks(self):
+        if self.check_interval and self._checker is None:
+            with self._lock:
+                if self._checker is None:
+                    self._checker = threading.Thread(target=self._check_loop,
+                                                     daemon=True)
+                    self._checker.start()
+
+    # calls
+
+    def _attempt(self, backend, fn):
+        began = self._begin(backend)
+        try:
+            res = fn(backend.connector)
+        except DeadlineExceeded:
+            self._end(backend, None)
+            raise
+        except FAILURES:
+            if expired():
+                # the caller ran out of time, not the node
+                self._end(backend, None)
+            else:
+                self._end(backend, began, failed=True)
+            raise
+        except Exception:
+            # the node did answer, with an error
+            self._end(backend, began)
+            raise
+        self._end(backend, began)
+        return res
+
+    def _route(self, fn, idempotent, pending=False):
+        self._start_checks()
+        if not idempotent or pending:
+            return self._attempt(self.sticky(), fn)
+
+        tried = []
+        while True:
+            backend = self.choose(exclude=tried)
+            tried.append(backend)
+            try:
+                return self._attempt(backend, fn)
+            except FAILURES:
+                if len(tried) > self.retries or \
+                        len(tried) == len(self.backends) or expired():
+                    raise
+
+    def invoke(self, data):
+        return self._route(lambda c: c.invoke(data),
+                           is_idempotent(data["method"]), uses_pending(data))
+
+    def invoke_batch(self, batch):
+        return self._route(
+            lambda c: c.invoke_batch(batch),
+            all(is_idempotent(d["method"]) for d in batch),
+            any(uses_pending(d) for d in batch))
+
+    def invoke_stream(self, data):
+        # consumed lazily, so it can't be retried or timed
+        return self.choose().connector.invoke_stream(data)
+
+    def invoke_to_file(self, data, file=None):
+        # a failure may leave part of the response in the file
+        return self.choose().connector.invoke_to_file(data, file=file)
+
+    def open_transport(self):
+        return self.sticky().connector.open_transport()
+
+    def close(self):
+        self._stop.set()
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from . import deadlines
+from .scheduling import current_priority, priority
+
+
+class MicroBatcher(object):
+    """ Collects requests submitted by many threads within `window`
+        seconds, or until `max_size` requests are pending, and sends
+        them to the connector as a single json-rpc batch.
+
+        submit() returns a concurrent.futures.Future per request, which
+        asyncio code can await through asyncio.wrap_future(). A batch is
+        sent with the highest priority of its requests. Requests with a
+        deadline are sent on their own, as one caller's deadline would
+        cut the call short for everyone in the batch """
+
+    def __init__(self, connector, window=0.002, max_size=50, workers=4):
+        self.connector = connector
+        self.window = window
+        self.max_size = max_size
+
+        self._pending = []
+        self._deadline = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        # batches are sent from a small pool so a slow batch doesn't
+        # hold up the next window
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, request):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            if not self._pending:
+                self._deadline = time.monotonic() + self.window
+            self._pending.append((request, future,
+                                  (deadlines.current(), current_priority())))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+            while len(self._pending) < self.max_size and not self._closed:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_size]
+            self._pending = self._pending[self.max_size:]
+            # whatever is left over has waited long enough already
+            self._deadline = time.monotonic()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._executor.submit(self._dispatch, batch)
+
+    def _run_batch(self, batch):
+        at = batch[0][2][0]
+        with deadlines.until(at), \
+                priority(min(p for _, _, (_, p) in batch)):
+            self._send(batch)
+
+    def _dispatch(self, batch):
+        groups = [[item] for item in batch if item[2][0] is not None]
+        unbounded = [item for item in batch if item[2][0] is None]
+        if unbounded:
+            groups.append(unbounded)
+        for group in groups[1:]:
+            self._executor.submit(self._run_batch, group)
+        self._run_batch(groups[0])
+
+    def _send(self, batch):
+        if len(batch) == 1:
+            request, future, _ = batch[0]
+            try:
+                future.set_result(self.connector.invoke(request))
+            except Exception as e:
+                future.set_exception(e)
+            return
+
+        try:
+            results = self.connector.invoke_batch([r for r, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), res in zip(batch, results):
+            if isinstance(res, Exception):
+                future.set_exception(res)
+            else:
+                future.set_result(res)
+
+    def close(self):
+        """ send whatever is pending and stop """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown()
@@ -0,0 +1,110 @@
+"""
+Fetching ranges of blocks, with their receipts.
+
+A BlockFetcher fetches blocks in batches of `batch_size`, several
+batches at a time, and yields them in order. Receipts are fetched per
+block with eth_getBlockReceipts; nodes that don't have it get a batch of
+eth_getTransactionReceipt calls instead. Given addresses and / or
+topics, blocks whose bloom can't contain matching logs are skipped
+before their receipts are fetched.
+"""
+
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .bloom import BloomFilter
+from .exceptions import MethodNotFound
+
+
+def tx_hash(tx):
+    return tx if isinstance(tx, str) else tx["hash"]
+
+
+class BlockFetcher(object):
+
+    def __init__(self, api, numbers, full_tx=True, receipts=True,
+                 batch_size=20, workers=4, addresses=None, topics=None):
+        """ numbers is a range or other iterable of block numbers. Yields
+            blocks, or (block, receipts) pairs with receipts """
+        self.api = api
+        self.numbers = numbers
+        self.full_tx = full_tx
+        self.receipts = receipts
+        self.batch_size = batch_size
+        self.workers = workers
+        self.bloom_filter = None
+        if addresses or topics:
+            self.bloom_filter = BloomFilter(addresses, topics)
+        # unknown until the node is asked
+        self.block_receipts = None
+
+    def get_blocks(self, numbers):
+        blocks = self.api.call_batch(
+            [("eth_getBlockByNumber", (hex(n), self.full_tx))
+             for n in numbers])
+        for number, block in zip(numbers, blocks):
+            if block is None:
+                raise LookupError("Block {0} not found".format(number))
+        return blocks
+
+    def get_receipts(self, blocks):
+        """ the receipts of each block, in one batch """
+        if not blocks:
+            return []
+        if self.block_receipts is not False:
+            # by hash, so the receipts are those of these very blocks
+            results = self.api.call_batch(
+                [("eth_getBlockReceipts", (b["hash"],)) for b in blocks],
+                return_exceptions=True)
+            if not any(isinstance(r, MethodNotFound) for r in results):
+                for r in results:
+                    if isinstance(r, Exception):
+                        raise r
+                self.block_receipts = True
+                return results
+            self.block_receipts = False
+
+        hashes = [[tx_hash(tx) for tx in b["transactions"]] for b in blocks]
+        receipts = iter(self.api.call_batch(
+            [("eth_getTransactionReceipt", (h,))
+             for block_hashes in hashes for h in block_hashes]))
+        return [[next(receipts) for h in block_hashes]
+                for block_hashes in hashes]
+
+    def fetch(self, numbers):
+        blocks = self.get_blocks(numbers)
+        if self.bloom_filter is not None:
+            blocks = list(self.bloom_filter.matching_blocks(blocks))
+        if not self.receipts:
+            return blocks
+        return list(zip(blocks, self.get_receipts(blocks)))
+
+    def batches(self):
+        batch = []
+        for number in self.numbers:
+            batch.append(number)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def __iter__(self):
+        batches = self.batches()
+        pending = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while True:
+                    for batch in batches:
+                        pending.append(pool.submit(self.fetch, batch))
+                        if len(pending) >= self.workers:
+                            break
+                    if not pending:
+                        return
+                    for item in pending.popleft().result():
+                        yield item
+            finally:
+                for future in pending:
+                    future.cancel()
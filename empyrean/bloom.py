@@ -0,0 +1,77 @@
+"""
+Matching log blooms locally.
+
+Every block header carries a 2048 bit `logsBloom` in which each log's
+address and topics set three bits. If any bit for a value is unset the
+block certainly has no such log, which lets a BlockFetcher skip
+fetching the receipts of blocks that can't be relevant.
+"""
+
+import binascii
+
+import sha3
+
+
+def unhex(value):
+    if isinstance(value, str):
+        if value.startswith("0x"):
+            value = value[2:]
+        value = binascii.unhexlify(value)
+    return value
+
+
+def bloom_bits(value):
+    """ the bits an address or topic (bytes or hex) sets in a bloom """
+    h = sha3.keccak_256(unhex(value)).digest()
+    return [((h[i] << 8) | h[i + 1]) & 2047 for i in (0, 2, 4)]
+
+
+def bloom_mask(value):
+    mask = 0
+    for bit in bloom_bits(value):
+        mask |= 1 << bit
+    return mask
+
+
+class Bloom(object):
+
+    def __init__(self, logs_bloom):
+        self.value = int.from_bytes(unhex(logs_bloom), "big")
+
+    def __contains__(self, value):
+        mask = bloom_mask(value)
+        return self.value & mask == mask
+
+
+class BloomFilter(object):
+    """ Tests blooms against a log filter: any of `addresses`, and for
+        each position in `topics` either None (anything) or a value or
+        list of values, any of which may match. Masks are computed once
+        so testing a bloom is cheap """
+
+    def __init__(self, addresses=None, topics=None):
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        self.addresses = [bloom_mask(a) for a in addresses or ()]
+        self.topics = []
+        for topic in topics or ():
+            if topic is None:
+                continue
+            if isinstance(topic, str):
+                topic = [topic]
+            self.topics.append([bloom_mask(t) for t in topic])
+
+    def matches(self, logs_bloom):
+        value = Bloom(logs_bloom).value
+
+        def any_of(masks):
+            return not masks or any(value & m == m for m in masks)
+
+        return any_of(self.addresses) and \
+            all(any_of(masks) for masks in self.topics)
+
+    def matching_blocks(self, blocks):
+        """ only the blocks whose bloom may contain matching logs """
+        for block in blocks:
+            if self.matches(block["logsBloom"]):
+                yield block
@@ -0,0 +1,382 @@
+"""
+Caching of RPC results that can't change anymore, and of reads against
+the latest block, which hold until the next block arrives.
+
+Whether a call may be cached is decided per method: a request must be
+pinned to something immutable (a block hash, a block number, a
+transaction hash) and, for some methods, the result must show it's
+final (e.g. a receipt of a mined transaction). Errors and null results
+are never cached.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import collections
+
+from .codecs import default_codec
+
+codec = default_codec()
+
+
+def is_pinned(block):
+    """ a block number or hash, as opposed to a tag like "latest" or
+        "pending". Also accepts EIP-1898 style block objects """
+    if isinstance(block, dict):
+        block = block.get("blockHash") or block.get("blockNumber")
+    return isinstance(block, str) and block.startswith("0x")
+
+
+def always(params):
+    return True
+
+
+def pinned_at(index):
+    def rule(params):
+        return len(params) > index and is_pinned(params[index])
+    return rule
+
+
+def at_latest(index):
+    def rule(params):
+        return len(params) > index and params[index] == "latest"
+    return rule
+
+
+def mined(result):
+    return result.get("blockHash") is not None
+
+
+# method -> whether a request could have an immutable result
+REQUEST_RULES = {
+    "eth_getBlockByHash": always,
+    "eth_getBlockTransactionCountByHash": always,
+    "eth_getTransactionByBlockHashAndIndex": always,
+    "eth_getUncleByBlockHashAndIndex": always,
+    "eth_getTransactionByHash": always,
+    "eth_getTransactionReceipt": always,
+    "eth_getBalance": pinned_at(1),
+    "eth_getCode": pinned_at(1),
+    "eth_getTransactionCount": pinned_at(1),
+    "eth_call": pinned_at(1),
+    "eth_getStorageAt": pinned_at(2),
+    "web3_sha3": always,
+}
+
+# method -> whether an actual result is final
+RESULT_RULES = {
+    "eth_getTransactionByHash": mined,
+    "eth_getTransactionReceipt": mined,
+}
+
+
+# method -> whether a request reads state as of the latest block
+HEAD_RULES = {
+    "eth_gasPrice": always,
+    "eth_getBalance": at_latest(1),
+    "eth_getCode": at_latest(1),
+    "eth_getTransactionCount": at_latest(1),
+    "eth_call": at_latest(1),
+    "eth_getStorageAt": at_latest(2),
+    "eth_getBlockByNumber": at_latest(0),
+}
+
+
+def request_cacheable(method, params):
+    rule = REQUEST_RULES.get(method)
+    return rule is not None and rule(params)
+
+
+def result_cacheable(method, result):
+    if result is None:
+        return False
+    rule = RESULT_RULES.get(method)
+    return rule is None or rule(result)
+
+
+def head_cacheable(method, params):
+    rule = HEAD_RULES.get(method)
+    return rule is not None and rule(params)
+
+
+def cache_key(method, params):
+    return codec.dumps([method, params])
+
+
+class LRUCache(object):
+    """ A thread safe in-memory LRU cache, limited by the (json encoded)
+        size of its values and optionally by the number of entries.
+
+        Values are kept encoded and every get() decodes a fresh copy, so
+        a caller changing a cached block or receipt doesn't change it
+        for everyone after """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ the cached value or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return codec.loads(entry[0])
+
+    def set(self, key, value):
+        data = codec.dumps(value)
+        size = len(key) + len(data)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (data, size)
+            self.size += size
+
+            while (self.size > self.max_bytes or
+                   (self.max_entries is not None and
+                    len(self._entries) > self.max_entries)):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return dict(entries=len(self._entries), bytes=self.size,
+                    hits=self.hits, misses=self.misses,
+                    evictions=self.evictions)
+
+
+class SQLiteCache(object):
+    """ An LRU cache in an sqlite database, shared by all processes on a
+        host that use the same path. It's a drop-in replacement for
+        LRUCache, so the same cacheability rules apply.
+
+        Access times are only updated every `touch_interval` seconds to
+        keep readers from contending for the write lock. Caching is best
+        effort: a database that stays locked for longer than `timeout`
+        results in a miss rather than an error """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            key BLOB PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            used REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS cache_used ON cache (used);
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta VALUES ('size', 0);
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024,
+                 touch_interval=60, timeout=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db.executescript(self.SCHEMA)
+
+    @property
+    def _db(self):
+        """ sqlite connections can't be shared between threads, nor be
+            inherited by forked processes """
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=self.timeout,
+                                       isolation_level=None)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.db.execute("PRAGMA synchronous=NORMAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def _transaction(self):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        return Transaction(db)
+
+    def get(self, key):
+        try:
+            row = self._db.execute(
+                "SELECT value, used FROM cache WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            now = time.time()
+            if now - row[1] > self.touch_interval:
+                self._db.execute("UPDATE cache SET used = ? WHERE key = ?",
+                                 (now, key))
+        except sqlite3.OperationalError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return codec.loads(row[0])
+
+    def set(self, key, value):
+        value = codec.dumps(value)
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+
+        try:
+            with self._transaction() as db:
+                old = db.execute("SELECT size FROM cache WHERE key = ?",
+                                 (key,)).fetchone()
+                db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                           (key, value, size, time.time()))
+                total = self._grow(db, size - (old[0] if old else 0))
+                if total > self.max_bytes:
+                    self._evict(db, total)
+        except sqlite3.OperationalError:
+            pass
+
+    def _grow(self, db, delta):
+        db.execute("UPDATE meta SET value = value + ? WHERE name = 'size'",
+                   (delta,))
+        return db.execute(
+            "SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self, db, total):
+        """ evict the least recently used entries until 10% below the
+            limit, so not every insert has to evict """
+        target = self.max_bytes * 0.9
+        freed = 0
+        keys = []
+        for key, size in db.execute(
+                "SELECT key, size FROM cache ORDER BY used"):
+            if total - freed <= target:
+                break
+            keys.append((key,))
+            freed += size
+        db.executemany("DELETE FROM cache WHERE key = ?", keys)
+        self._grow(db, -freed)
+        self.evictions += len(keys)
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute("DELETE FROM cache")
+            db.execute("UPDATE meta SET value = 0 WHERE name = 'size'")
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self):
+        """ entries and bytes are host wide, the counters per process """
+        size = self._db.execute(
+            "SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+        return dict(entries=len(self), bytes=size, hits=self.hits,
+                    misses=self.misses, evictions=self.evictions)
+
+
+class Transaction(object):
+    """ commit an explicitly started sqlite transaction, or roll it back
+        on errors """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.db.execute("COMMIT")
+        else:
+            self.db.execute("ROLLBACK")
+
+
+class BlockCache(object):
+    """ Caches reads against the latest block until a new head is
+        reported through new_head(). As a safety net for when no head
+        source is running, entries also expire after max_age seconds.
+
+        Like LRUCache, values are kept encoded and get() hands out
+        copies """
+
+    def __init__(self, max_age=1.0, max_entries=100000):
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        self.head = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def new_head(self, number, block_hash=None):
+        """ drop everything if this is a new block. Heads lower than the
+            current one (e.g. from a lagging node) are ignored """
+        with self._lock:
+            if self.head is not None:
+                current, current_hash = self.head
+                if number < current:
+                    return
+                if number == current and (block_hash is None or
+                                          block_hash == current_hash):
+                    return
+            self.head = (number, block_hash)
+            self._entries = {}
+            self.invalidations += 1
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > self.max_age:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return codec.loads(entry[0])
+
+    def set(self, key, value, head):
+        """ store value, read while `head` was the current head. It's
+            discarded if a new head arrived in the mean time """
+        data = codec.dumps(value)
+        with self._lock:
+            if head != self.head:
+                return
+            if len(self._entries) >= self.max_entries:
+                self._entries = {}
+            self._entries[key] = (data, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return dict(entries=len(self._entries), hits=self.hits,
+                    misses=self.misses, invalidations=self.invalidations)
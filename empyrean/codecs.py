@@ -0,0 +1,54 @@
+"""
+JSON serializers for the connectors. A codec turns python objects into
+bytes and bytes back into python objects.
+
+orjson is used when it is installed, the stdlib json module otherwise.
+Note that orjson decodes integers beyond 64 bits as floats; json-rpc
+encodes quantities as hex strings so this doesn't affect regular
+results.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class JSONCodec(object):
+    name = "json"
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf8")
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf8")
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # e.g. integers that don't fit in 64 bits
+            return super().dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+def available_codecs():
+    codecs = [JSONCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    return codecs
+
+
+def default_codec():
+    """ the fastest codec available """
+    return available_codecs()[-1]
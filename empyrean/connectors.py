@@ -1,13 +1,58 @@
 import os
 import socket
-import json
+import tempfile
+import select
+import threading
+import contextlib
+import time
 
 import requests
+import urllib3
 
 from . import exceptions
+from .deadlines import current, expired, remaining, DeadlineExceeded
+from .codecs import default_codec
+from .streaming import ResultStream, RawResponse
+from .subscriptions import Multiplexer
+from .websocket import WebSocket
+
+# what connectors raise when the node doesn't answer in time
+TIMEOUTS = (socket.timeout, requests.exceptions.Timeout)
 
 
 class Connector(object):
+    codec = default_codec()
+    # spilled responses up to this size are checked for errors right
+    # away. json-rpc errors are tiny, so anything larger is a result
+    spill_check_size = 65536
+
+    _subscriber = None
+    _subscriber_lock = threading.Lock()
+
+    def open_transport(self):
+        """ a persistent connection for subscriptions, see
+            subscriptions.Multiplexer """
+        raise NotImplementedError(
+            "{0} doesn't support subscriptions".format(
+                self.__class__.__name__))
+
+    def subscriber(self):
+        """ the multiplexer subscriptions go through, (re)connected when
+            needed. Subscriptions get a connection of their own so that
+            a consumer stalling it can't hold up other calls """
+        with self._subscriber_lock:
+            if self._subscriber is None or self._subscriber.closed:
+                self._subscriber = Multiplexer(self.open_transport(),
+                                               self.codec, self.parse_result)
+            return self._subscriber
+
+    def subscribe(self, kind, *params, callback=None, maxsize=1000,
+                  overflow="block"):
+        """ eth_subscribe to `kind` ("newHeads", "logs" or
+            "newPendingTransactions"). Returns a Subscription """
+        return self.subscriber().subscribe(kind, params, callback=callback,
+                                           maxsize=maxsize,
+                                           overflow=overflow)
 
     def parse_result(self, data):
         # print(data)
@@ -23,40 +68,449 @@ class Connector(object):
 
         return res
 
+    def invoke_stream(self, data):
+        """ connectors that can't stream simply iterate over the whole
+            result """
+        res = self.invoke(data)
+        return iter(res if isinstance(res, list) else [res])
+
+    def iter_result(self, chunks):
+        """ parse a response arriving as an iterable of byte chunks. The
+            items of an array result are yielded as soon as they are
+            complete, any other result is yielded as a single item """
+        stream = ResultStream(self.codec)
+        for chunk in chunks:
+            for item in stream.feed(chunk):
+                yield item
+            if stream.done:
+                break
+
+        envelope = stream.close()
+        if not stream.streamed:
+            yield self.parse_result(envelope)
+        elif 'error' in envelope:
+            self.parse_result(envelope)
+
+    def spill(self, chunks, file=None):
+        """ write the response chunks to `file` (a temporary file by
+            default) and return a RawResponse for it """
+        if file is None:
+            file = tempfile.TemporaryFile()
+        size = 0
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+            file.flush()
+            response = RawResponse(file, size, self)
+            if size <= self.spill_check_size:
+                response.result()
+        except Exception:
+            file.close()
+            raise
+        return response
+
+    def parse_batch(self, batch, responses):
+        """ match batch responses to their requests by id. Returns, in
+            request order, either the result or the exception for each
+            request """
+        if isinstance(responses, dict):
+            # the batch as a whole was rejected
+            self.parse_result(responses)
+
+        byid = dict((r.get('id'), r) for r in responses)
+        res = []
+        for request in batch:
+            response = byid.get(request['id'])
+            if response is None:
+                res.append(exceptions.JSONRPCException(
+                    0, "No response for request {0}".format(request['id'])))
+                continue
+            try:
+                res.append(self.parse_result(response))
+            except exceptions.JSONRPCException as e:
+                res.append(e)
+        return res
+
+
+class IPCConnection(object):
+    """ A single unix socket connection to geth. Not thread safe, use
+        it through an IPCConnectionPool """
+
+    recv_size = 65536
+
+    def __init__(self, path, timeout=2):
+        self.path = path
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.last_used = time.monotonic()
+
+    def is_healthy(self):
+        """ an idle connection should have nothing to read. If it's
+            readable the peer either closed it or left a stray response
+            on it; neither is safe to reuse """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def send(self, payload):
+        self.sock.sendall(payload)
+
+    def message(self):
+        """ yield the raw chunks of a single response. geth terminates
+            every message with a newline, which can't occur inside the
+            (compact) json itself """
+        for chunk in self.chunks():
+            yield chunk
+            if chunk.endswith(b"\n"):
+                return
+
+    def chunks(self):
+        """ yield data as it arrives. The caller decides when the
+            response is complete. Under a deadline every read gets what's
+            left of it, so a node trickling data can't stretch it """
+        while True:
+            if current() is not None:
+                self.sock.settimeout(remaining(self.timeout))
+            try:
+                chunk = self.sock.recv(self.recv_size)
+            except socket.timeout:
+                if expired():
+                    raise DeadlineExceeded("Deadline exceeded")
+                raise
+            if not chunk:
+                raise ConnectionError("IPC connection closed by peer")
+            self.last_used = time.monotonic()
+            yield chunk
+
+    def messages(self):
+        """ yield complete messages, for connections that carry
+            responses and notifications interleaved """
+        parts = []
+        for chunk in self.chunks():
+            while b"\n" in chunk:
+                last, _, chunk = chunk.partition(b"\n")
+                message = b"".join(parts) + last
+                parts = []
+                if message.strip():
+                    yield message
+            if chunk:
+                parts.append(chunk)
+
+    def receive(self, loads):
+        """ read a complete response and return it decoded by `loads`.
+            Chunks are joined once at the end, as growing a buffer with
+            each of them costs quadratic time on large responses """
+        return loads(b"".join(self.message()))
+
+    def close(self):
+        try:
+            # wakes up a thread blocked reading from it
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class IPCConnectionPool(object):
+    """ Lazily opens up to `size` connections and hands them out one
+        caller at a time. Connections idle for longer than
+        `idle_timeout` seconds are closed """
+
+    connection_class = IPCConnection
+
+    def __init__(self, path, size=8, timeout=2, idle_timeout=60):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+
+    def _shrink(self):
+        """ close connections that have been idle too long. Must be
+            called with the lock held """
+        now = time.monotonic()
+        keep = []
+        for conn in self._idle:
+            if now - conn.last_used > self.idle_timeout:
+                self._discard(conn)
+            else:
+                keep.append(conn)
+        self._idle = keep
+
+    def _discard(self, conn):
+        conn.close()
+        self._opened -= 1
+        self._cond.notify()
+
+    def checkout(self):
+        """ a connection, with its timeout set to what's left of the
+            caller's deadline if that's sooner """
+        conn = self._checkout()
+        try:
+            conn.settimeout(remaining(self.timeout))
+        except Exception:
+            self.checkin(conn)
+            raise
+        return conn
+
+    def _checkout(self):
+        with self._cond:
+            self._shrink()
+            while True:
+                # most recently used first, keeps the hot sockets hot and
+                # lets the cold ones expire
+                while self._idle:
+                    conn = self._idle.pop()
+                    if conn.is_healthy():
+                        return conn
+                    self._discard(conn)
+                if self._opened < self.size:
+                    self._opened += 1
+                    break
+                self._cond.wait(remaining())
+
+        try:
+            return self.connection_class(self.path, self.timeout)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, conn, broken=False):
+        with self._cond:
+            if broken:
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        except Exception:
+            # whatever went wrong, the state of the stream is unknown
+            self.checkin(conn, broken=True)
+            raise
+        self.checkin(conn)
+
+    def request(self, payload, loads):
+        """ send payload and return the response parsed by `loads`. If the
+            request could not be sent the connection is replaced and the
+            request is retried once; nothing is retried once it has been
+            sent """
+        for attempt in range(2):
+            conn = self.checkout()
+            try:
+                conn.send(payload)
+            except ConnectionError:
+                self.checkin(conn, broken=True)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.checkin(conn, broken=True)
+                raise
+
+            try:
+                res = conn.receive(loads)
+            except Exception:
+                self.checkin(conn, broken=True)
+                raise
+            self.checkin(conn)
+            return res
+
+    def close(self):
+        """ close all idle connections """
+        with self._cond:
+            for conn in self._idle:
+                self._discard(conn)
+            self._idle = []
+
 
 class IPCConnector(Connector):
 
-    def __init__(self, path=None):
+    def __init__(self, path=None, pool_size=8, timeout=2, idle_timeout=60,
+                 codec=None):
         self.path = path or self.generic_path()
-        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self._connect()
+        if codec is not None:
+            self.codec = codec
+        self.pool = IPCConnectionPool(self.path, size=pool_size,
+                                      timeout=timeout,
+                                      idle_timeout=idle_timeout)
 
     def generic_path(self):
         return os.path.join(os.path.expanduser("~"), ".ethereum", "geth.ipc")
 
-    def _connect(self):
-        self.sock.connect(self.path)
-        self.sock.settimeout(2)
+    def open_transport(self):
+        # no timeout, notifications may take arbitrarily long
+        return IPCConnection(self.path, timeout=None)
 
     def invoke(self, data):
-        serialized = json.dumps(data)
-        self.sock.sendall(serialized.encode("utf8"))
-        res = self.sock.recv(10000)
-        try:
-            parsed_res = json.loads(res.decode("utf8"))
-        except ValueError:
-            raise
+        serialized = self.codec.dumps(data)
+        parsed_res = self.pool.request(serialized, self.codec.loads)
 
         res = self.parse_result(parsed_res)
         return res
 
+    def invoke_batch(self, batch):
+        serialized = self.codec.dumps(batch)
+        parsed_res = self.pool.request(serialized, self.codec.loads)
+        return self.parse_batch(batch, parsed_res)
+
+    def invoke_stream(self, data):
+        """ like invoke, but yields the items of an array result one at
+            a time as they arrive. The connection stays checked out
+            until the generator is exhausted or closed """
+        conn = self.pool.checkout()
+        complete = False
+        try:
+            conn.send(self.codec.dumps(data))
+            for item in self.iter_result(conn.chunks()):
+                yield item
+            complete = True
+        finally:
+            # an abandoned response leaves unread data on the socket
+            self.pool.checkin(conn, broken=not complete)
+
+    def invoke_to_file(self, data, file=None):
+        """ write the raw response to `file` and return a RawResponse,
+            without ever parsing it into memory """
+        with self.pool.connection() as conn:
+            conn.send(self.codec.dumps(data))
+            return self.spill(conn.message(), file)
+
 
 class HTTPConnector(Connector):
+    headers = {"Content-Type": "application/json"}
+    chunk_size = 65536
 
-    def __init__(self, url):
+    def __init__(self, url, codec=None, timeout=None):
         self.url = url
+        self.timeout = timeout
+        if codec is not None:
+            self.codec = codec
+
+    def _post(self, data):
+        r = requests.post(self.url, data=self.codec.dumps(data),
+                          headers=self.headers, stream=True,
+                          timeout=remaining(self.timeout))
+        try:
+            return self.codec.loads(b"".join(self._content(r)))
+        finally:
+            r.close()
+
+    def _content(self, r):
+        """ the body of a streamed response. requests applies its timeout
+            to every read, so under a deadline the socket is given what's
+            left of it before each one """
+        sock = getattr(getattr(r.raw, "connection", None), "sock", None)
+        read1 = getattr(r.raw, "read1", None)
+        if read1 is not None:
+            # whatever has arrived, rather than waiting for a full chunk
+            chunks = iter(lambda: read1(self.chunk_size,
+                                        decode_content=True), b"")
+        else:
+            chunks = r.iter_content(chunk_size=self.chunk_size)
+        while True:
+            if current() is not None:
+                left = remaining(self.timeout)
+                if sock is not None:
+                    sock.settimeout(left)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            except (urllib3.exceptions.ReadTimeoutError,
+                    requests.exceptions.ConnectionError) as e:
+                # how a read timing out is reported
+                if expired():
+                    raise DeadlineExceeded("Deadline exceeded")
+                if isinstance(e, urllib3.exceptions.ReadTimeoutError):
+                    raise requests.exceptions.ReadTimeout(e)
+                raise
+            yield chunk
 
     def invoke(self, data):
-        serialized = json.dumps(data)
-        r = requests.post(self.url, data=serialized)
-        return self.parse_result(r.json())
+        return self.parse_result(self._post(data))
+
+    def invoke_batch(self, batch):
+        return self.parse_batch(batch, self._post(batch))
+
+    def invoke_stream(self, data):
+        """ like invoke, but yields the items of an array result one at
+            a time as they arrive """
+        r = requests.post(self.url, data=self.codec.dumps(data),
+                          headers=self.headers, stream=True,
+                          timeout=remaining(self.timeout))
+        try:
+            for item in self.iter_result(self._content(r)):
+                yield item
+        finally:
+            r.close()
+
+    def invoke_to_file(self, data, file=None):
+        """ write the raw response to `file` and return a RawResponse,
+            without ever parsing it into memory """
+        r = requests.post(self.url, data=self.codec.dumps(data),
+                          headers=self.headers, stream=True,
+                          timeout=remaining(self.timeout))
+        try:
+            return self.spill(self._content(r), file)
+        finally:
+            r.close()
+
+
+class WebSocketConnector(Connector):
+    """ json-rpc over a single websocket, shared by all threads. Calls
+        and subscriptions use separate connections """
+
+    def __init__(self, url, timeout=10, headers=None, codec=None):
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers
+        if codec is not None:
+            self.codec = codec
+        self._calls = None
+        self._calls_lock = threading.Lock()
+
+    def open_transport(self):
+        return WebSocket(self.url, timeout=self.timeout,
+                         headers=self.headers)
+
+    def _multiplexer(self):
+        with self._calls_lock:
+            if self._calls is None or self._calls.closed:
+                self._calls = Multiplexer(self.open_transport(), self.codec,
+                                          self.parse_result, self.timeout)
+            return self._calls
+
+    def invoke(self, data):
+        return self.parse_result(self._multiplexer().request(
+            data, timeout=remaining(self.timeout)))
+
+    def invoke_batch(self, batch):
+        return self.parse_batch(batch, self._multiplexer().request(
+            batch, timeout=remaining(self.timeout)))
+
+    def close(self):
+        for multiplexer in (self._calls, self._subscriber):
+            if multiplexer is not None:
+                multiplexer.close()
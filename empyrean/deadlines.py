@@ -0,0 +1,62 @@
+"""
+Per-call deadlines.
+
+    with deadline(0.25):
+        api.eth.call(...)
+
+bounds everything the calls inside the block do: connectors derive
+their socket and http timeouts from the time that's left, and fail
+with DeadlineExceeded once it's gone. Deadlines nest (the earliest one
+wins) and are per thread; work handed to other threads on a caller's
+behalf carries the caller's deadline along with until().
+"""
+
+import time
+import socket
+import threading
+import contextlib
+
+_local = threading.local()
+
+
+class DeadlineExceeded(socket.timeout):
+    pass
+
+
+def current():
+    """ the deadline in effect (a time.monotonic() value), or None """
+    return getattr(_local, "at", None)
+
+
+@contextlib.contextmanager
+def until(at):
+    """ run with the absolute deadline `at`, None for no deadline """
+    outer = current()
+    if outer is not None and (at is None or outer < at):
+        at = outer
+    _local.at = at
+    try:
+        yield at
+    finally:
+        _local.at = outer
+
+
+def deadline(seconds):
+    return until(time.monotonic() + seconds)
+
+
+def remaining(default=None):
+    """ seconds left until the deadline, at most `default`. Without a
+        deadline that's `default` itself """
+    at = current()
+    if at is None:
+        return default
+    left = at - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return left if default is None else min(left, default)
+
+
+def expired():
+    at = current()
+    return at is not None and time.monotonic() >= at
@@ -0,0 +1,83 @@
+"""
+The same read over many accounts or contracts.
+
+Calls are sent in batches of `batch_size`, `workers` batches at a time,
+and all of them are pinned to a single block so the results form a
+consistent snapshot even if new blocks arrive halfway. Results come
+back in the order of the addresses.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+# kind -> (method, decoder)
+KINDS = {
+    "balance": ("eth_getBalance", lambda r: int(r, 16)),
+    "nonce": ("eth_getTransactionCount", lambda r: int(r, 16)),
+    "code": ("eth_getCode", lambda r: r),
+}
+
+
+def pin(api, block):
+    """ a block number to read at, the current head if None """
+    if block is None:
+        block = api.eth("blockNumber")
+    if isinstance(block, int):
+        block = hex(block)
+    return block
+
+
+def fanout(api, calls, decode=None, batch_size=100, workers=4,
+           return_exceptions=False):
+    """ call_batch over a long list of (method, args) with limited
+        concurrency. Results are passed through decode() if given """
+    batches = [calls[i:i + batch_size]
+               for i in range(0, len(calls), batch_size)]
+
+    def run(batch):
+        results = api.call_batch(batch, return_exceptions=return_exceptions)
+        if decode is None:
+            return results
+        return [r if isinstance(r, Exception) else decode(r)
+                for r in results]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        res = []
+        for results in pool.map(run, batches):
+            res.extend(results)
+        return res
+
+
+def get_many(api, kind, addresses, block=None, **options):
+    """ the balance, nonce or code (`kind`) of each address at one
+        block. See fanout() for the options """
+    try:
+        method, decode = KINDS[kind]
+    except KeyError:
+        raise ValueError("Unknown kind {0}, expected one of {1}".format(
+            kind, ", ".join(sorted(KINDS))))
+    block = pin(api, block)
+    return fanout(api, [(method, (a, block)) for a in addresses], decode,
+                  **options)
+
+
+def contract_fanout(api, signature, targets, args=(), returns=(),
+                    block=None, **options):
+    """ eth_call `signature` with the same args on each target contract
+        at one block, decoding the results as `returns` (a list of abi
+        types). A single return value is unwrapped """
+    # not at the top, abi pulls in rlp which the rest of the api doesn't
+    # need (sha3 is imported anyway, by bloom)
+    from .abi import build_payload, decode_abi
+
+    data = "0x" + build_payload(signature, *args).decode("ascii")
+    block = pin(api, block)
+    returns = list(returns)
+
+    def decode(result):
+        if not returns:
+            return result
+        values = decode_abi(returns, result)
+        return values[0] if len(values) == 1 else values
+
+    return fanout(api, [("eth_call", (dict(to=t, data=data), block))
+                        for t in targets], decode, **options)
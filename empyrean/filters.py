@@ -0,0 +1,179 @@
+"""
+Polling node side filters.
+
+A FilterPoller installs a log, block or pending transaction filter and
+polls it for changes, which is much cheaper for the node than repeating
+range queries. Filters that expired on the node (geth drops filters
+that haven't been polled for a few minutes) are reinstalled, and for
+logs and blocks whatever arrived in between is fetched explicitly. The
+poll interval follows the observed block time.
+"""
+
+import time
+import threading
+
+from .exceptions import JSONRPCException
+
+
+def filter_not_found(exc):
+    return isinstance(exc, JSONRPCException) and \
+        "filter not found" in (exc.message or "").lower()
+
+
+def log_position(log):
+    return int(log["blockNumber"], 16), int(log["logIndex"], 16)
+
+
+class FilterPoller(object):
+    """ kind is "logs" (with a getLogs style filter), "blocks" or
+        "pending". With fetch_bodies the hashes returned for blocks and
+        pending transactions are resolved into the blocks / transactions
+        themselves, in one batch per poll. Blocks missed while a filter
+        was expired can only be recovered with fetch_bodies """
+
+    def __init__(self, api, kind="blocks", filter=None, callback=None,
+                 fetch_bodies=True, full_tx=False, min_interval=0.5,
+                 max_interval=15, block_time=12.0):
+        if kind not in ("logs", "blocks", "pending"):
+            raise ValueError("Unknown filter kind {0}".format(kind))
+        self.api = api
+        self.kind = kind
+        self.filter = filter or {}
+        self.callback = callback
+        self.fetch_bodies = fetch_bodies
+        self.full_tx = full_tx
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.block_time = block_time
+
+        self.filter_id = None
+        self.reinstalls = 0
+        # where we are, to fetch what was missed when reinstalling
+        self.last_log = None
+        self.last_block = None
+        self._last_arrival = None
+        self._stop = threading.Event()
+
+    @property
+    def interval(self):
+        """ poll a few times per block """
+        return max(self.min_interval,
+                   min(self.max_interval, self.block_time / 4))
+
+    def install(self):
+        eth = self.api.eth
+        if self.kind == "logs":
+            self.filter_id = eth.newFilter(self.filter)
+        elif self.kind == "blocks":
+            self.filter_id = eth.newBlockFilter()
+        else:
+            self.filter_id = eth.newPendingTransactionFilter()
+        return self.filter_id
+
+    def uninstall(self):
+        if self.filter_id is not None:
+            try:
+                self.api.eth.uninstallFilter(self.filter_id)
+            except JSONRPCException:
+                pass
+            self.filter_id = None
+
+    def poll(self):
+        """ the changes since the previous poll """
+        if self.filter_id is None:
+            self.install()
+        refetched = False
+        try:
+            changes = self.api.eth.getFilterChanges(self.filter_id)
+        except JSONRPCException as e:
+            if not filter_not_found(e):
+                raise
+            self.install()
+            self.reinstalls += 1
+            changes = self.missed()
+            refetched = True
+
+        if self.kind == "logs":
+            changes = self._new_logs(changes, refetched)
+        elif self.fetch_bodies:
+            changes = self.bodies(changes)
+        if self.kind == "blocks":
+            self._track_blocks(changes)
+        return changes
+
+    def missed(self):
+        """ what arrived between the filter expiring and reinstalling it.
+            Pending transactions are transient, those are simply lost """
+        if self.kind == "logs" and self.last_log is not None:
+            f = dict(self.filter, fromBlock=hex(self.last_log[0]),
+                     toBlock="latest")
+            return self.api.eth.getLogs(f)
+        if self.kind == "blocks" and self.last_block is not None:
+            head = int(self.api.eth("blockNumber"), 16)
+            blocks = self.api.call_batch(
+                [("eth_getBlockByNumber", (hex(n), False))
+                 for n in range(self.last_block + 1, head + 1)])
+            return [b["hash"] for b in blocks if b]
+        return []
+
+    def _new_logs(self, logs, refetched=False):
+        """ track the position of the last log. Logs refetched after
+            reinstalling may have been seen already. Logs that were
+            removed by a reorg move the position back, as the logs
+            replacing them take the same positions """
+        if refetched and self.last_log is not None:
+            logs = [log for log in logs
+                    if log_position(log) > self.last_log]
+        for log in logs:
+            number, index = log_position(log)
+            if log.get("removed"):
+                self.last_log = min(self.last_log or (number, index - 1),
+                                    (number, index - 1))
+            else:
+                self.last_log = max(self.last_log or (0, 0),
+                                    (number, index))
+        if logs:
+            self._arrived()
+        return logs
+
+    def _track_blocks(self, blocks):
+        for block in blocks:
+            if isinstance(block, dict):
+                self.last_block = max(self.last_block or 0,
+                                      int(block["number"], 16))
+        if blocks:
+            self._arrived()
+
+    def _arrived(self):
+        """ estimate the block time from the gaps between polls that
+            returned something """
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            self.block_time = 0.8 * self.block_time + \
+                0.2 * (now - self._last_arrival)
+        self._last_arrival = now
+
+    def bodies(self, hashes):
+        if not hashes:
+            return []
+        if self.kind == "blocks":
+            calls = [("eth_getBlockByHash", (h, self.full_tx))
+                     for h in hashes]
+        else:
+            calls = [("eth_getTransactionByHash", (h,)) for h in hashes]
+        # bodies may be gone already (reorged blocks, dropped txs)
+        return [b for b in self.api.call_batch(calls) if b is not None]
+
+    def run(self):
+        """ poll until stop() is called, passing changes to callback """
+        try:
+            while not self._stop.is_set():
+                changes = self.poll()
+                if changes and self.callback is not None:
+                    self.callback(changes)
+                self._stop.wait(self.interval)
+        finally:
+            self.uninstall()
+
+    def stop(self):
+        self._stop.set()
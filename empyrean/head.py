@@ -0,0 +1,204 @@
+"""
+Following the chain head from a single source.
+
+A HeadTracker keeps the latest block number, hash and timestamp up to
+date so that everything else can read them without a round trip. It
+subscribes to newHeads where the connection supports it and polls
+eth_blockNumber otherwise (or while the subscription is down), at an
+interval that follows the observed block time.
+
+Every new head is passed on to the API's caches and store and to the
+registered callbacks.
+"""
+
+import time
+import queue
+import threading
+
+from .exceptions import JSONRPCException
+
+
+class Head(tuple):
+    """ (number, hash, timestamp) """
+
+    def __new__(cls, number, hash, timestamp):
+        return tuple.__new__(cls, (number, hash, timestamp))
+
+    number = property(lambda self: self[0])
+    hash = property(lambda self: self[1])
+    timestamp = property(lambda self: self[2])
+
+
+class HeadTracker(object):
+
+    def __init__(self, api, subscribe=True, min_interval=0.5,
+                 max_interval=15, block_time=12.0, retry_subscribe=60):
+        self.api = api
+        self.subscribe = subscribe
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.block_time = block_time
+        # how long to poll before trying to subscribe again after a
+        # subscription failed
+        self.retry_subscribe = retry_subscribe
+
+        self.head = None
+        self.subscribed = False
+        self.callback_errors = 0
+        self._callbacks = []
+        self._last_arrival = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def number(self):
+        head = self.head
+        return head and head.number
+
+    @property
+    def hash(self):
+        head = self.head
+        return head and head.hash
+
+    @property
+    def timestamp(self):
+        head = self.head
+        return head and head.timestamp
+
+    @property
+    def interval(self):
+        """ poll a few times per block """
+        return max(self.min_interval,
+                   min(self.max_interval, self.block_time / 4))
+
+    def add_callback(self, callback):
+        """ call `callback(head)` on every new head, from the tracker's
+            thread """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def wait(self, after=None, timeout=None):
+        """ block until there is a head above block `after` (any head if
+            None). Returns the head, or None on timeout """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self.head is not None and
+                (after is None or self.head.number > after), timeout)
+            if self.head is None or (after is not None and
+                                     self.head.number <= after):
+                return None
+            return self.head
+
+    def update(self, number, block_hash=None, timestamp=None):
+        """ record a head. Lower heads (e.g. from a lagging node) are
+            ignored, a different hash at the same height is a reorg """
+        with self._cond:
+            head = self.head
+            if head is not None and (number < head.number or
+                                     (number == head.number and
+                                      block_hash in (None, head.hash))):
+                return False
+            self.head = head = Head(number, block_hash, timestamp)
+            self._arrived()
+            self._cond.notify_all()
+
+        self.api._new_head(number, block_hash)
+        for callback in list(self._callbacks):
+            try:
+                callback(head)
+            except Exception:
+                # a broken consumer mustn't stop the others
+                self.callback_errors += 1
+        return True
+
+    def _arrived(self):
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            self.block_time = 0.8 * self.block_time + \
+                0.2 * (now - self._last_arrival)
+        self._last_arrival = now
+
+    def poll(self):
+        """ check the head once. Only a new block number costs a second
+            call, for its hash and timestamp """
+        number = int(self.api._invoke("eth_blockNumber", ()), 16)
+        if self.head is not None and number <= self.head.number:
+            return False
+        block = self.api._invoke("eth_getBlockByNumber", (hex(number), False))
+        if block is None:
+            return self.update(number)
+        return self.update(number, block["hash"], int(block["timestamp"], 16))
+
+    def follow(self):
+        """ update from a newHeads subscription until it fails or stop()
+            is called """
+        subscription = self.api.subscribe("newHeads", maxsize=16,
+                                          overflow="drop")
+        self.subscribed = True
+        try:
+            # whatever happened before the subscription
+            self.poll()
+            quiet = 0
+            while not self._stop.is_set():
+                try:
+                    header = subscription.get(self.interval)
+                except queue.Empty:
+                    quiet += self.interval
+                    if quiet >= self.max_interval:
+                        # quiet for too long, make sure nothing was missed
+                        self.poll()
+                        quiet = 0
+                    continue
+                if header is None:
+                    return
+                quiet = 0
+                self.update(int(header["number"], 16), header.get("hash"),
+                            int(header["timestamp"], 16))
+        finally:
+            self.subscribed = False
+            try:
+                subscription.unsubscribe()
+            except (ConnectionError, OSError, JSONRPCException):
+                pass
+
+    def run(self):
+        """ track the head until stop() is called """
+        while not self._stop.is_set():
+            if self.subscribe:
+                try:
+                    self.follow()
+                except NotImplementedError:
+                    # this connection can't do subscriptions
+                    self.subscribe = False
+                except (ConnectionError, OSError, JSONRPCException):
+                    pass
+                else:
+                    continue
+            self._poll_for(self.retry_subscribe if self.subscribe else None)
+
+    def _poll_for(self, duration=None):
+        until = duration and time.monotonic() + duration
+        while not self._stop.is_set() and (until is None or
+                                           time.monotonic() < until):
+            try:
+                self.poll()
+            except (ConnectionError, OSError, JSONRPCException):
+                # the node is down or restarting, keep trying
+                pass
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """ run in a background thread """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
@@ -0,0 +1,172 @@
+"""
+Hedged reads.
+
+Most calls are answered quickly, but now and then one gets stuck behind
+a slow query, a busy node or a lost packet. A HedgedConnector keeps the
+recent latencies of the calls it sends, and when a read hasn't been
+answered by the time 95% of reads are (the `quantile`), sends the same
+read again and takes whichever answer comes first. Only one call in
+twenty gets a duplicate, while the slowest ones mostly disappear.
+
+The duplicate goes through the wrapped connector like any other call,
+so it's sent on another pooled connection, or, wrapping a
+MultiConnector, to the node that looks best with the first one busy.
+Only idempotent calls are hedged, not before `min_samples` latencies
+have been seen, and no more than a `budget` share of them, so a node
+that's slow for everyone doesn't get twice the load on top.
+"""
+
+import time
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from . import deadlines
+from .balancing import FAILURES
+from .methods import is_idempotent
+from .scheduling import current_priority, priority
+
+
+class LatencyTracker(object):
+    """ the latencies of the last `window` calls """
+
+    def __init__(self, window=1000, resort=50):
+        self.resort = resort
+        self._samples = collections.deque(maxlen=window)
+        self._sorted = []
+        self._added = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, elapsed):
+        with self._lock:
+            self._samples.append(elapsed)
+            self._added += 1
+
+    def quantile(self, q):
+        """ the latency q of the calls were faster than, None without any
+            samples. Sorted again only every `resort` calls, as quantiles
+            don't move much from one call to the next """
+        with self._lock:
+            if self._added >= min(self.resort, len(self._sorted) or 1):
+                self._sorted = sorted(self._samples)
+                self._added = 0
+            samples = self._sorted
+        if not samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class HedgedConnector(object):
+    """ `budget` is the fraction of calls that may be hedged, with bursts
+        of up to `burst` hedges; `min_delay` the least time a read gets
+        before it's hedged """
+
+    def __init__(self, connector, quantile=0.95, min_samples=20,
+                 min_delay=0.005, budget=0.1, burst=10, window=1000,
+                 workers=256):
+        self.connector = connector
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = budget
+        self.burst = burst
+        self.latencies = LatencyTracker(window)
+        # calls hedged, and how many of those the duplicate answered
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        # a thread per attempt in flight; a call that waits for a worker
+        # isn't hedged for time it spent queueing, but can't be faster
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def __getattr__(self, name):
+        # everything that isn't hedged is the wrapped connector's
+        return getattr(self.connector, name)
+
+    def delay(self):
+        """ how long a read may take before it's hedged, None while there
+            are too few samples """
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.latencies.quantile(self.quantile), self.min_delay)
+
+    def _earn(self):
+        """ every call adds `budget` to what can be spent on hedges, true
+            if there's enough for one """
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.budget)
+            return self._tokens >= 1
+
+    def _spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def _run(self, fn, at=None, level=None, started=None):
+        with deadlines.until(at), priority(level):
+            began = time.monotonic()
+            if started is not None:
+                started.began = began
+                started.set()
+            res = fn(self.connector)
+            self.latencies.add(time.monotonic() - began)
+            return res
+
+    def _hedge(self, fn):
+        delay = self.delay()
+        if not self._earn() or delay is None:
+            # nothing to wait for, stay on the caller's thread
+            return self._run(fn)
+
+        at, level = deadlines.current(), current_priority()
+        started = threading.Event()
+        first = self._executor.submit(self._run, fn, at, level, started)
+        started.wait()
+        # measured from when the call was sent, like the samples
+        try:
+            return first.result(timeout=max(
+                started.began + delay - time.monotonic(), 0))
+        except FutureTimeout:
+            pass
+        if deadlines.expired() or not self._spend():
+            return first.result()
+
+        second = self._executor.submit(self._run, fn, at, level)
+        pending = {first, second}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # an error from the node is an answer too, a failure to get
+            # one leaves it to the other call
+            answered = sorted(
+                (f for f in done if not isinstance(f.exception(), FAILURES)),
+                key=lambda f: f.exception() is not None)
+            if answered:
+                if answered[0] is second and second.exception() is None:
+                    self.hedge_wins += 1
+                return answered[0].result()
+        return first.result()
+
+    def invoke(self, data):
+        if not is_idempotent(data["method"]):
+            return self.connector.invoke(data)
+        return self._hedge(lambda c: c.invoke(data))
+
+    def invoke_batch(self, batch):
+        if not all(is_idempotent(d["method"]) for d in batch):
+            return self.connector.invoke_batch(batch)
+        return self._hedge(lambda c: c.invoke_batch(batch))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        close = getattr(self.connector, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,315 @@
+"""
+A chain following event indexer.
+
+The Indexer fetches the logs of configured contracts in batches of
+blocks, decodes them into events and hands them to a sink. Progress is
+kept in a checkpoint after every batch the sink has accepted. The hashes
+of recently indexed blocks are kept too, so that when the chain reorgs
+the sink can be rolled back to the last block that's still canonical.
+
+Fetching, decoding and writing overlap: batches are fetched by a pool of
+workers ahead of the decoder, and a writer thread feeds the sink.
+"""
+
+import os
+import copy
+import json
+import queue
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .abi import enc_event, decode_topic, decode_abi, tohex
+from .connectors import TIMEOUTS
+from .exceptions import ServerError
+
+
+class IndexerError(Exception):
+    pass
+
+
+class ChainChanging(IndexerError):
+    """ the blocks of a batch kept being replaced while it was fetched """
+
+
+# what the next round may well get past: a node that's down, overloaded
+# or slow, or a chain that's busy reorging
+RECOVERABLE = (ConnectionError, ServerError, ChainChanging) + TIMEOUTS
+
+
+class Event(object):
+    """ An event to index, declared as in solidity, e.g.
+
+        Event("Transfer(address indexed from, address indexed to,
+                        uint256 value)")
+
+        Argument names are optional, unnamed arguments are named by
+        position """
+
+    def __init__(self, declaration):
+        name, _, rest = declaration.partition("(")
+        self.name = name.strip()
+        self.args = []
+        for i, arg in enumerate(a for a in rest.rstrip(") ").split(",")
+                                if a.strip()):
+            parts = arg.split()
+            indexed = "indexed" in parts[1:]
+            names = [p for p in parts[1:] if p != "indexed"]
+            self.args.append((parts[0], indexed,
+                              names[0] if names else str(i)))
+
+        self.signature = "{0}({1})".format(
+            self.name, ",".join(t for t, _, _ in self.args))
+        self.topic = "0x" + tohex(enc_event(self.signature)).decode("ascii")
+
+    def decode(self, log):
+        """ decode a log into a dict with the event name, its arguments
+            and where it was found """
+        topics = iter(log["topics"][1:])
+        data_types = [t for t, indexed, _ in self.args if not indexed]
+        data = iter(decode_abi(data_types, log["data"]) if data_types
+                    else ())
+
+        args = {}
+        for type, indexed, name in self.args:
+            if indexed:
+                args[name] = decode_topic(type, next(topics))
+            else:
+                args[name] = next(data)
+
+        return dict(event=self.name, args=args,
+                    address=log["address"],
+                    blockNumber=int(log["blockNumber"], 16),
+                    blockHash=log["blockHash"],
+                    transactionHash=log["transactionHash"],
+                    logIndex=int(log["logIndex"], 16))
+
+
+class Sink(object):
+    """ Receives decoded events in block order """
+
+    def write(self, events):
+        raise NotImplementedError
+
+    def rollback(self, number):
+        """ forget all events from block `number` on """
+        raise NotImplementedError
+
+
+class MemorySink(Sink):
+
+    def __init__(self):
+        self.events = []
+
+    def write(self, events):
+        self.events.extend(events)
+
+    def rollback(self, number):
+        self.events = [e for e in self.events if e["blockNumber"] < number]
+
+
+class MemoryCheckpoint(object):
+
+    def __init__(self):
+        self.state = None
+
+    def load(self):
+        return self.state
+
+    def save(self, state):
+        self.state = copy.deepcopy(state)
+
+
+class FileCheckpoint(MemoryCheckpoint):
+    """ keeps the indexer state in a json file, replaced atomically """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class Indexer(object):
+
+    def __init__(self, api, contracts, sink, checkpoint=None,
+                 start_block=0, batch_size=1000, confirmations=12,
+                 workers=4, poll_interval=5):
+        """ contracts maps addresses to the Events to index for them """
+        self.api = api
+        self.sink = sink
+        self.checkpoint = checkpoint or MemoryCheckpoint()
+        self.start_block = start_block
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+        self.workers = workers
+        self.poll_interval = poll_interval
+
+        self.events = {}
+        for address, events in contracts.items():
+            for event in events:
+                self.events[(address.lower(), event.topic)] = event
+        self.filter = dict(
+            address=sorted(set(a.lower() for a in contracts)),
+            topics=[sorted(set(e.topic for e in self.events.values()))])
+
+        self.head = None
+        # failed rounds run() got over
+        self.errors = 0
+        self._stop = threading.Event()
+
+    def state(self):
+        state = self.checkpoint.load()
+        if state is None:
+            state = dict(block=self.start_block - 1, recent=[])
+        return state
+
+    def block_hash(self, number):
+        block = self.api._call("eth_getBlockByNumber", hex(number), False)
+        return block and block["hash"]
+
+    def fetch(self, start, end):
+        """ logs for a batch, and the hash of its last block as of when
+            the logs were fetched """
+        for attempt in range(3):
+            end_hash = self.block_hash(end)
+            f = dict(self.filter, fromBlock=hex(start), toBlock=hex(end))
+            logs = self.api.eth.getLogs(f)
+            if self.block_hash(end) == end_hash:
+                return logs, end_hash
+        raise ChainChanging("Chain keeps changing under blocks {0}-{1}"
+                            .format(start, end))
+
+    def decode(self, logs):
+        events = []
+        for log in logs:
+            if log.get("removed"):
+                continue
+            event = self.events.get((log["address"].lower(),
+                                     log["topics"][0] if log["topics"]
+                                     else None))
+            if event is not None:
+                events.append(event.decode(log))
+        return events
+
+    def check_reorg(self, state):
+        """ roll back to the last indexed block before the oldest one
+            that's no longer canonical. Batches are fetched in parallel,
+            so a reorg may have replaced an older batch while a newer one
+            was fetched from the new chain: newer blocks matching says
+            nothing about older ones """
+        recent = state["recent"]
+        for i, (number, block_hash) in enumerate(recent):
+            if self.block_hash(number) == block_hash:
+                continue
+            if i == 0:
+                raise IndexerError("Reorg deeper than {0} blocks".format(
+                    self.confirmations))
+            number = recent[i - 1][0]
+            self.sink.rollback(number + 1)
+            state["block"] = number
+            state["recent"] = recent[:i]
+            self.checkpoint.save(state)
+            return
+
+    def run_once(self):
+        """ index everything up to the current head. Returns the number
+            of blocks indexed """
+        state = self.state()
+        self.check_reorg(state)
+
+        head = self.head = int(self.api.eth("blockNumber"), 16)
+        first = state["block"] + 1
+        if first > head:
+            return 0
+
+        batches = collections.deque(
+            (s, min(s + self.batch_size - 1, head))
+            for s in range(first, head + 1, self.batch_size))
+        writes = queue.Queue(maxsize=self.workers)
+        writer = threading.Thread(target=self._write, args=(state, writes))
+        writer.start()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = collections.deque()
+                while batches or pending:
+                    while batches and len(pending) < self.workers:
+                        start, end = batches.popleft()
+                        pending.append((end, pool.submit(self.fetch,
+                                                         start, end)))
+                    end, future = pending.popleft()
+                    logs, end_hash = future.result()
+                    writes.put((self.decode(logs), end, end_hash))
+                    if self._stop.is_set() or state.get("error"):
+                        break
+        finally:
+            writes.put(None)
+            writer.join()
+
+        if state.get("error"):
+            raise state.pop("error")
+        return state["block"] - first + 1
+
+    def _write(self, state, writes):
+        while True:
+            item = writes.get()
+            if item is None:
+                return
+            if state.get("error"):
+                continue
+            events, end, end_hash = item
+            try:
+                self.sink.write(events)
+                state["block"] = end
+                state["recent"] = self._recent(state["recent"], end,
+                                               end_hash)
+                self.checkpoint.save(dict(block=state["block"],
+                                          recent=state["recent"]))
+            except Exception as e:
+                state["error"] = e
+
+    def _recent(self, recent, end, end_hash):
+        """ keep the hashes of batch ends within the confirmation depth,
+            plus the newest one below it to roll back to """
+        recent = recent + [[end, end_hash]]
+        confirmed = [i for i, (n, _) in enumerate(recent)
+                     if n <= end - self.confirmations]
+        if confirmed:
+            recent = recent[confirmed[-1]:]
+        return recent
+
+    def run(self):
+        """ keep following the head until stop() is called. With a head
+            tracker on the api, a new batch starts as soon as a new head
+            arrives. Failures to reach the node are retried every
+            poll_interval, anything else ends it """
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except RECOVERABLE:
+                self.errors += 1
+                self._stop.wait(self.poll_interval)
+                continue
+            tracker = self.api.head_tracker
+            if tracker is not None and self.head is not None:
+                tracker.wait(after=self.head, timeout=self.poll_interval)
+            else:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
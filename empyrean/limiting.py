@@ -0,0 +1,197 @@
+"""
+Protecting the node from overload.
+
+A node answers faster with a few calls in flight than with one at a
+time, but past some point more concurrency only adds queueing: latency
+climbs, and eventually calls time out or fail with server errors while
+throughput drops. AdaptiveLimiter looks for that point the way TCP
+congestion control does (AIMD). Every call that comes back in time
+raises the limit on calls in flight by 1/limit, so by about one per
+round of calls, as long as at least half the limit is in use. A call
+that times out, fails with a ServerError, or takes more than
+`tolerance` times the no-load latency lowers the limit by `backoff`,
+at most once per round so a burst of slow calls counts as one signal.
+Calls over the limit wait for a slot. Only single calls that succeed
+are timed: a batch takes longer than a call without the node being
+any busier, and an error may come back faster than any result.
+
+The no-load latency is the lowest latency seen, drifting slowly up so
+that a node that got slower for good isn't measured against the past.
+
+TokenBucket caps a method at a fixed number of calls per second, e.g.
+eth_getLogs for a backfill. Both are used through a LimitedConnector.
+"""
+
+import time
+import threading
+
+from .connectors import TIMEOUTS
+from .deadlines import remaining, expired, DeadlineExceeded
+from .exceptions import ServerError
+
+# what tells that the node has too much to do. Not a caller's own
+# deadline running out, which is a timeout too
+OVERLOAD = (ServerError,) + TIMEOUTS
+
+
+def overloaded(error):
+    return isinstance(error, OVERLOAD) and \
+        not isinstance(error, DeadlineExceeded)
+
+
+class TokenBucket(object):
+    """ allows `rate` calls per second, and bursts of up to `burst` """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, n):
+        """ take n tokens, or return how long until they're there """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            # a batch larger than the burst gets through once the bucket
+            # is full, and the calls after it wait for what it overdrew
+            needed = min(n, self.burst)
+            if self._tokens >= needed:
+                self._tokens -= n
+                return 0
+            return (needed - self._tokens) / self.rate
+
+    def acquire(self, n=1):
+        """ wait until n calls may be made, at most until the caller's
+            deadline """
+        while True:
+            wait = self._take(n)
+            if not wait:
+                return
+            left = remaining()
+            if left is not None and left < wait:
+                # won't make it, fail now rather than at the deadline
+                raise DeadlineExceeded("Deadline exceeded")
+            time.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+
+    def __init__(self, initial=8, min_limit=1, max_limit=256, tolerance=2.0,
+                 backoff=0.75, drift=0.01):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.drift = drift
+        self.in_flight = 0
+        self.baseline = None
+        # calls that had to wait for a slot, and times the limit went down
+        self.throttled = 0
+        self.decreases = 0
+
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """ wait for a slot, at most until the caller's deadline """
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                self.throttled += 1
+            while self.in_flight >= int(self.limit):
+                self._cond.wait(remaining())
+            self.in_flight += 1
+
+    def release(self, elapsed=None, overloaded=False):
+        """ give back the slot of a call that took `elapsed` seconds.
+            `overloaded` if it failed in a way that tells the node is
+            overloaded. elapsed is None for calls whose latency says
+            nothing about the load: errors, batches, and calls that ran
+            out of their caller's deadline """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if not overloaded and elapsed is not None:
+                if self.baseline is None or elapsed < self.baseline:
+                    self.baseline = elapsed
+                else:
+                    self.baseline += self.drift * (elapsed - self.baseline)
+                overloaded = elapsed > self.tolerance * self.baseline
+
+            if overloaded:
+                # once per round: calls sent before the last decrease
+                # don't tell anything about the new limit
+                if now - self._last_decrease > (self.baseline or 0) * \
+                        self.tolerance:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif elapsed is not None and \
+                    self.in_flight + 1 >= self.limit / 2:
+                # only a limit that's being used has been shown to work
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class LimitedConnector(object):
+    """ sends calls through `limiter` (an AdaptiveLimiter, or None for no
+        limit on concurrency) and caps the methods in `rates`, a dict of
+        method -> calls per second """
+
+    def __init__(self, connector, limiter=None, rates=None):
+        self.connector = connector
+        self.limiter = limiter
+        self.buckets = dict((method, TokenBucket(rate))
+                            for method, rate in (rates or {}).items())
+
+    def __getattr__(self, name):
+        return getattr(self.connector, name)
+
+    def _throttle(self, methods):
+        counts = {}
+        for method in methods:
+            if method in self.buckets:
+                counts[method] = counts.get(method, 0) + 1
+        for method, n in counts.items():
+            self.buckets[method].acquire(n)
+
+    def _limited(self, fn, check):
+        if self.limiter is None:
+            return fn()
+        self.limiter.acquire()
+        began = time.monotonic()
+        try:
+            res = fn()
+        except OVERLOAD as e:
+            if not overloaded(e) or expired():
+                # the caller ran out of time, not the node
+                self.limiter.release(None)
+            else:
+                self.limiter.release(time.monotonic() - began, True)
+            raise
+        except Exception:
+            # answered, but an error may come back faster than any result
+            self.limiter.release(None)
+            raise
+        self.limiter.release(*check(time.monotonic() - began, res))
+        return res
+
+    def invoke(self, data):
+        self._throttle([data["method"]])
+        return self._limited(lambda: self.connector.invoke(data),
+                             lambda elapsed, res: (elapsed, False))
+
+    def invoke_batch(self, batch):
+        # a batch takes one slot, the node works through it in one go.
+        # Its latency isn't comparable to that of single calls, so only
+        # the errors in it count
+        self._throttle(d["method"] for d in batch)
+        return self._limited(
+            lambda: self.connector.invoke_batch(batch),
+            lambda elapsed, results: (
+                None, any(overloaded(r) for r in results)))
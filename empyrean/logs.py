@@ -0,0 +1,118 @@
+"""
+Fetching logs over large block ranges.
+
+Nodes reject or time out on getLogs queries over large ranges, while
+small ranges waste round trips. LogFetcher splits the range into chunks
+whose size adapts to what the node returns: chunks grow while they
+come back fast and sparse, and shrink (a failing chunk is split in two
+and retried) on "too many results" errors and timeouts. Several chunks
+are fetched concurrently, the logs still come out in block order.
+"""
+
+import time
+import threading
+import collections
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .connectors import TIMEOUTS
+from .deadlines import expired, DeadlineExceeded
+from .exceptions import JSONRPCException
+
+# error messages various node implementations and providers use for
+# queries that are too large
+TOO_LARGE = (
+    "more than",
+    "too many",
+    "too large",
+    "limit exceeded",
+    "size exceeded",
+    "exceed maximum block range",
+    "range is too wide",
+)
+
+
+def too_large(exc):
+    if isinstance(exc, DeadlineExceeded):
+        # the caller's time is up, smaller queries won't get it back
+        return False
+    if isinstance(exc, TIMEOUTS):
+        return True
+    if isinstance(exc, JSONRPCException):
+        message = (exc.message or "").lower()
+        return any(m in message for m in TOO_LARGE)
+    return False
+
+
+class LogFetcher(object):
+
+    def __init__(self, api, filter, from_block, to_block, chunk_size=1000,
+                 min_chunk_size=1, max_chunk_size=100000,
+                 target_results=5000, target_time=2.0, workers=4):
+        self.api = api
+        self.filter = dict((k, v) for k, v in filter.items()
+                           if k not in ("fromBlock", "toBlock"))
+        self.from_block = from_block
+        self.to_block = to_block
+        self.chunk_size = chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_results = target_results
+        self.target_time = target_time
+        self.workers = workers
+
+        self._lock = threading.Lock()
+
+    def get_logs(self, start, end):
+        f = dict(self.filter, fromBlock=hex(start), toBlock=hex(end))
+        return self.api.eth.getLogs(f)
+
+    def fetch(self, start, end):
+        """ logs for a range, split until the node accepts the parts """
+        began = time.monotonic()
+        try:
+            logs = self.get_logs(start, end)
+        except Exception as e:
+            if start == end or not too_large(e) or expired():
+                raise
+            self.adapt(end - start + 1, failed=True)
+            middle = (start + end) // 2
+            return self.fetch(start, middle) + self.fetch(middle + 1, end)
+
+        self.adapt(end - start + 1, len(logs), time.monotonic() - began)
+        return logs
+
+    def adapt(self, size, results=0, elapsed=0, failed=False):
+        with self._lock:
+            if failed:
+                self.chunk_size = min(self.chunk_size, size // 2)
+            elif (results > self.target_results or
+                  elapsed > self.target_time):
+                self.chunk_size = size // 2
+            elif (size >= self.chunk_size and
+                  results < self.target_results / 2 and
+                  elapsed < self.target_time / 2):
+                # only grow on chunks of the current size, results of
+                # older smaller chunks say little about the current one
+                self.chunk_size = size * 2
+            self.chunk_size = max(self.min_chunk_size,
+                                  min(self.chunk_size, self.max_chunk_size))
+
+    def __iter__(self):
+        start = self.from_block
+        pending = collections.deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while start <= self.to_block or pending:
+                    while start <= self.to_block and \
+                            len(pending) < self.workers:
+                        end = min(start + self.chunk_size - 1, self.to_block)
+                        pending.append(pool.submit(self.fetch, start, end))
+                        start = end + 1
+
+                    for log in pending.popleft().result():
+                        yield log
+            finally:
+                for future in pending:
+                    future.cancel()
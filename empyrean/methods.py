@@ -5,6 +5,65 @@
 # Admin:
 # https://github.com/ethereum/go-ethereum/wiki/Management-APIs#personal_listaccounts
 
+from .logs import LogFetcher
+from .blocks import BlockFetcher
+from .timestamps import BlockTimeIndex
+from . import fanout
+
+# calls with side effects (or that use server side state, which lives on
+# one node) that must never be coalesced, cached or retried, and go to
+# the same node as the writes
+NON_IDEMPOTENT_NAMESPACES = ("admin", "debug", "miner", "personal")
+NON_IDEMPOTENT = frozenset([
+    "eth_sendTransaction",
+    "eth_sendRawTransaction",
+    "eth_submitWork",
+    "eth_submitHashrate",
+    "eth_newFilter",
+    "eth_newBlockFilter",
+    "eth_newPendingTransactionFilter",
+    "eth_getFilterChanges",
+    "eth_getFilterLogs",
+    "eth_uninstallFilter",
+    "eth_subscribe",
+    "eth_unsubscribe",
+    "shh_post",
+    "shh_newIdentity",
+    "shh_newGroup",
+    "shh_addToGroup",
+    "shh_newFilter",
+    "shh_uninstallFilter",
+    "shh_getFilterChanges",
+])
+# the reads in those namespaces. debug_ also has calls like setHead
+# that change the node, so only these are
+IDEMPOTENT = frozenset([
+    "debug_traceTransaction",
+    "debug_traceCall",
+    "debug_traceBlock",
+    "debug_traceBlockByNumber",
+    "debug_traceBlockByHash",
+    "debug_getRawBlock",
+    "debug_getRawHeader",
+    "debug_getRawReceipts",
+    "debug_getRawTransaction",
+    "debug_getBadBlocks",
+    "debug_getModifiedAccountsByNumber",
+    "debug_getModifiedAccountsByHash",
+    "debug_storageRangeAt",
+    "debug_accountRange",
+    "debug_dumpBlock",
+    "debug_preimage",
+])
+
+
+def is_idempotent(method):
+    if method in IDEMPOTENT:
+        return True
+    ns = method.split("_", 1)[0]
+    return ns not in NON_IDEMPOTENT_NAMESPACES and \
+        method not in NON_IDEMPOTENT
+
 
 class Namespace(object):
     name = ""
@@ -17,16 +76,32 @@ class Namespace(object):
     def __call__(self, command, *args):
         return self.api.call_ns(self, command, *args)
 
+    def stream(self, command, *args):
+        """ iterate over a large array result item by item, e.g.
+            api.eth.stream("getLogs", filter) """
+        return self.api.stream_ns(self, command, *args)
+
+    def to_file(self, command, *args, file=None):
+        """ store the raw response in a file instead of parsing it, e.g.
+            api.debug.to_file("traceBlockByNumber", "0x10") """
+        return self.api.call_ns_to_file(self, command, *args, file=file)
+
 
 class AdminNamespace(Namespace):
     name = "admin"
 
 
+class DebugNamespace(Namespace):
+    name = "debug"
+
+
 class EthNamespace(Namespace):
     name = "eth"
 
     GAS_DEFAULT = 90000
 
+    time_index = None
+
     def protocolVersion(self):
         return self("protocolVersion")
 
@@ -70,10 +145,37 @@ class EthNamespace(Namespace):
             params['data'] = data
 
         if nonce is not None:
-            params['nonce'] = nonce
+            params['nonce'] = hex(nonce) if isinstance(nonce, int) else nonce
 
         return self("sendTransaction", params)
 
+    def getBlockByNumber(self, qty_or_tag="latest", full_tx=False):
+        if isinstance(qty_or_tag, int):
+            qty_or_tag = hex(qty_or_tag)
+        return self("getBlockByNumber", qty_or_tag, full_tx)
+
+    def getBlockByHash(self, block_hash, full_tx=False):
+        return self("getBlockByHash", block_hash, full_tx)
+
+    def getBlockReceipts(self, block):
+        """ all receipts of a block, by number, tag or hash. Not every
+            node supports this """
+        if isinstance(block, int):
+            block = hex(block)
+        return self("getBlockReceipts", block)
+
+    def block_at_time(self, timestamp):
+        """ the number of the first block at or after a unix timestamp,
+            or None if there's none yet. Headers seen while searching
+            are kept to speed up later lookups, see
+            empyrean.timestamps """
+        if self.time_index is None:
+            self.time_index = BlockTimeIndex(self.api)
+        return self.time_index.block_at(timestamp)
+
+    def getTransactionCount(self, address, tag="latest"):
+        return self("getTransactionCount", address, tag)
+
     def getTransactionReceipt(self, txhash):
         return self("getTransactionReceipt", txhash)
 
@@ -82,7 +184,7 @@ class EthNamespace(Namespace):
              gasPrice=None,
              value=None,
              data=None,
-             qty_or_tag=None):
+             qty_or_tag="latest"):
         params = {}
         params['from'] = _from
 
@@ -101,11 +203,71 @@ class EthNamespace(Namespace):
         if data is not None:
             params['data'] = data
 
-        return self("call", params, "latest")  # , qty_or_tag)
+        if isinstance(qty_or_tag, int):
+            qty_or_tag = hex(qty_or_tag)
+
+        return self("call", params, qty_or_tag)
 
     def getCode(self, address, tag="latest"):
         return self("getCode", address, tag)
 
+    def getLogs(self, filter):
+        """
+            https://github.com/ethereum/wiki/wiki/JSON-RPC#eth_getlogs
+        """
+        return self("getLogs", filter)
+
+    def newFilter(self, filter):
+        return self("newFilter", filter)
+
+    def newBlockFilter(self):
+        return self("newBlockFilter")
+
+    def newPendingTransactionFilter(self):
+        return self("newPendingTransactionFilter")
+
+    def getFilterChanges(self, filter_id):
+        return self("getFilterChanges", filter_id)
+
+    def getFilterLogs(self, filter_id):
+        return self("getFilterLogs", filter_id)
+
+    def uninstallFilter(self, filter_id):
+        return self("uninstallFilter", filter_id)
+
+    def subscribe(self, kind, *params, **options):
+        """ e.g. eth.subscribe("logs", {"address": ...}, callback=f), or
+            iterate over eth.subscribe("newHeads") """
+        return self.api.subscribe(kind, *params, **options)
+
+    def iter_logs(self, filter, from_block, to_block, **options):
+        """ iterate over the logs matching filter between two block
+            numbers (inclusive), fetched in adaptively sized chunks. See
+            empyrean.logs.LogFetcher for the options """
+        return iter(LogFetcher(self.api, filter, from_block, to_block,
+                               **options))
+
+    def get_many(self, kind, addresses, block=None, **options):
+        """ "balance", "nonce" or "code" for many addresses, batched and
+            pinned to one block (the current head by default). See
+            empyrean.fanout """
+        return fanout.get_many(self.api, kind, addresses, block, **options)
+
+    def contract_fanout(self, signature, targets, args=(), returns=(),
+                        block=None, **options):
+        """ the same view call on many contracts, e.g.
+            contract_fanout("balanceOf(address)", tokens, [owner],
+                            returns=["uint256"]) """
+        return fanout.contract_fanout(self.api, signature, targets, args,
+                                      returns, block, **options)
+
+    def fetch_blocks(self, numbers, full_tx=True, receipts=True, **options):
+        """ iterate over the blocks in `numbers` (e.g. a range), as
+            (block, receipts) pairs with receipts. See
+            empyrean.blocks.BlockFetcher for the options """
+        return iter(BlockFetcher(self.api, numbers, full_tx=full_tx,
+                                 receipts=receipts, **options))
+
 
 class MinerNamespace(Namespace):
     name = "miner"
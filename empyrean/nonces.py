@@ -0,0 +1,159 @@
+"""
+Handing out transaction nonces locally.
+
+Letting the node pick nonces serializes senders, and concurrent senders
+picking their own from eth_getTransactionCount collide. A NonceManager
+reads the pending transaction count of an account once and then hands
+out nonces from memory, one per caller, under a per-account lock.
+
+A nonce that turns out not to be used (the transaction was rejected) is
+released and handed out again first, so it doesn't leave a gap that
+would hold up every later transaction. When the node says a nonce is
+too low, someone else used the account: the manager resyncs with the
+node and the transaction is retried with a fresh nonce.
+"""
+
+import threading
+
+from .connectors import TIMEOUTS
+from .exceptions import ServerError
+
+# errors meaning the nonce is already taken, on the chain or in the pool.
+# Note that "already known" is not one of them: that's this very
+# transaction, sent before
+NONCE_TAKEN = (
+    "nonce too low",
+    "nonce is too low",
+    "replacement transaction underpriced",
+)
+
+
+def nonce_taken(exc):
+    return isinstance(exc, ServerError) and \
+        any(m in (exc.message or "").lower() for m in NONCE_TAKEN)
+
+
+class Account(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = None
+        self.released = set()
+        self.in_flight = 0
+
+
+class NonceManager(object):
+
+    def __init__(self, api, retries=3):
+        self.api = api
+        self.retries = retries
+        self.resyncs = 0
+
+        self._accounts = {}
+        self._lock = threading.Lock()
+
+    def _account(self, address):
+        address = address.lower()
+        with self._lock:
+            account = self._accounts.get(address)
+            if account is None:
+                account = self._accounts[address] = Account()
+            return account
+
+    def _pending_count(self, address):
+        return int(self.api.eth.getTransactionCount(address, "pending"), 16)
+
+    def next_nonce(self, address):
+        """ reserve a nonce. It must be passed to release() if it doesn't
+            end up being used """
+        account = self._account(address)
+        with account.lock:
+            if account.next is None:
+                account.next = self._pending_count(address)
+            if account.released:
+                nonce = min(account.released)
+                account.released.remove(nonce)
+            else:
+                nonce = account.next
+                account.next += 1
+            account.in_flight += 1
+            return nonce
+
+    def release(self, address, nonce):
+        """ give back a nonce that wasn't used """
+        account = self._account(address)
+        with account.lock:
+            account.in_flight -= 1
+            if account.next is not None and nonce < account.next:
+                account.released.add(nonce)
+
+    def confirm(self, address, nonce):
+        """ the transaction with `nonce` was accepted by the node """
+        account = self._account(address)
+        with account.lock:
+            account.in_flight -= 1
+
+    def reset(self, address):
+        """ forget what we know, the next nonce is read from the node
+            again """
+        account = self._account(address)
+        with account.lock:
+            account.next = None
+            account.released.clear()
+
+    def resync(self, address):
+        """ reconcile with the node's pending transaction count. If the
+            node is ahead, the account was used elsewhere. If it's
+            behind while nothing is in flight, transactions we sent were
+            dropped and their nonces are gaps to fill first """
+        count = self._pending_count(address)
+        account = self._account(address)
+        with account.lock:
+            self.resyncs += 1
+            if account.next is None or count >= account.next:
+                account.next = count
+                account.released.clear()
+            elif account.in_flight == 0:
+                account.released.update(range(count, account.next))
+            account.released = set(n for n in account.released
+                                   if n >= count)
+            return count
+
+    def gaps(self, address):
+        """ nonces below the next one that aren't in use """
+        account = self._account(address)
+        with account.lock:
+            return sorted(account.released)
+
+    def send(self, address, send):
+        """ call `send(nonce)` with a reserved nonce and return its result,
+            retrying with a fresh nonce if the node says it's taken """
+        for attempt in range(self.retries + 1):
+            nonce = self.next_nonce(address)
+            try:
+                res = send(nonce)
+            except ServerError as e:
+                if not nonce_taken(e):
+                    self.release(address, nonce)
+                    raise
+                self.confirm(address, nonce)
+                if attempt == self.retries:
+                    raise
+                self.resync(address)
+                continue
+            except (ConnectionError,) + TIMEOUTS:
+                # it may or may not have reached the node. Don't hand the
+                # nonce out again, start over from what the node has
+                self.confirm(address, nonce)
+                self.reset(address)
+                raise
+            except Exception:
+                self.release(address, nonce)
+                raise
+            self.confirm(address, nonce)
+            return res
+
+    def sendTransaction(self, _from, **kwargs):
+        """ eth.sendTransaction with a managed nonce """
+        return self.send(_from, lambda nonce: self.api.eth.sendTransaction(
+            _from, nonce=nonce, **kwargs))
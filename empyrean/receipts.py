@@ -0,0 +1,156 @@
+"""
+Waiting for many transactions at once.
+
+Polling every pending transaction for its receipt costs a request per
+transaction per poll. A ReceiptWaiter instead checks all transactions
+it's waiting for once per new block, in batches, and resolves a future
+for each as soon as its receipt is deep enough.
+
+Receipts are fetched again on every block until they are confirmed, so
+a transaction that a reorg moves or drops is tracked correctly.
+"""
+
+import time
+import threading
+
+from concurrent.futures import Future
+
+from .exceptions import JSONRPCException
+
+
+class ReceiptTimeout(Exception):
+    pass
+
+
+class ReceiptWaiter(object):
+
+    def __init__(self, api, confirmations=0, timeout=None, batch_size=500,
+                 poll_interval=1.0):
+        """ A receipt is final once its block is `confirmations` blocks
+            below the head. Transactions not final within `timeout`
+            seconds fail with ReceiptTimeout. The head comes from the
+            api's HeadTracker, which is started if needed """
+        self.api = api
+        self.confirmations = confirmations
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        # tx hash -> (future, confirmations, deadline)
+        self._waiting = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def add(self, tx_hash, callback=None, confirmations=None, timeout=None):
+        """ start waiting for tx_hash. Returns a Future that resolves to
+            the receipt; callback, if given, is called with that future
+            when it's done """
+        if confirmations is None:
+            confirmations = self.confirmations
+        if timeout is None:
+            timeout = self.timeout
+        deadline = timeout and time.monotonic() + timeout
+
+        with self._lock:
+            entry = self._waiting.get(tx_hash)
+            if entry is None:
+                entry = (Future(), confirmations, deadline)
+                self._waiting[tx_hash] = entry
+        if callback is not None:
+            entry[0].add_done_callback(callback)
+        return entry[0]
+
+    def add_many(self, tx_hashes, **options):
+        return [self.add(tx_hash, **options) for tx_hash in tx_hashes]
+
+    def fetch(self, tx_hashes):
+        """ the receipts for tx_hashes, in batches. Receipts that couldn't
+            be fetched are left out, they're tried again next block """
+        receipts = {}
+        for i in range(0, len(tx_hashes), self.batch_size):
+            chunk = tx_hashes[i:i + self.batch_size]
+            try:
+                results = self.api.call_batch(
+                    [("eth_getTransactionReceipt", (h,)) for h in chunk],
+                    return_exceptions=True)
+            except (ConnectionError, OSError, JSONRPCException):
+                continue
+            for tx_hash, receipt in zip(chunk, results):
+                if isinstance(receipt, dict) and receipt.get("blockNumber"):
+                    receipts[tx_hash] = receipt
+        return receipts
+
+    def check(self, head):
+        """ fetch the receipts of everything still waiting and resolve
+            those that are final at block `head`. Returns the number
+            resolved """
+        with self._lock:
+            waiting = list(self._waiting)
+        if not waiting:
+            return 0
+
+        receipts = self.fetch(waiting)
+        now = time.monotonic()
+        done = []
+        with self._lock:
+            for tx_hash in waiting:
+                future, confirmations, deadline = self._waiting[tx_hash]
+                receipt = receipts.get(tx_hash)
+                if receipt is not None and \
+                        int(receipt["blockNumber"], 16) <= \
+                        head - confirmations:
+                    done.append((future, receipt, None))
+                elif deadline and now > deadline:
+                    done.append((future, None, ReceiptTimeout(
+                        "No final receipt for {0}".format(tx_hash))))
+                else:
+                    continue
+                del self._waiting[tx_hash]
+
+        # outside the lock, callbacks may add transactions
+        for future, receipt, error in done:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(receipt)
+        return len(done)
+
+    def expire(self):
+        """ fail everything past its deadline, without fetching """
+        now = time.monotonic()
+        with self._lock:
+            expired = [(tx_hash, entry[0])
+                       for tx_hash, entry in self._waiting.items()
+                       if entry[2] and now > entry[2]]
+            for tx_hash, _ in expired:
+                del self._waiting[tx_hash]
+        for tx_hash, future in expired:
+            future.set_exception(ReceiptTimeout(
+                "No final receipt for {0}".format(tx_hash)))
+
+    def run(self):
+        """ check once per new head until stop() is called """
+        tracker = self.api.track_head()
+        after = None
+        while not self._stop.is_set():
+            head = tracker.wait(after, timeout=self.poll_interval)
+            if head is None:
+                self.expire()
+                continue
+            after = head.number
+            self.check(head.number)
+
+    def start(self):
+        """ run in a background thread """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,173 @@
+"""
+Priority classes.
+
+Calls made inside
+
+    with priority(LOW):
+        backfill()
+
+wait behind HIGH and NORMAL ones for a turn at the node. A
+PriorityConnector lets `slots` calls be in flight at a time (about the
+number of connections the node is given), and hands free slots out to
+the waiting calls of each class in proportion to its weight, so that
+bulk work keeps making progress without getting ahead of interactive
+calls. A share of the slots is reserved for HIGH, so even a node busy
+with backfill has room for them right away.
+
+Large batches are split into chunks that each wait for a slot, so a
+10k call backfill batch takes turns with everything else instead of
+holding the node for its whole length.
+
+Like deadlines, the priority is per thread.
+"""
+
+import math
+import threading
+import contextlib
+import collections
+
+from .deadlines import remaining, DeadlineExceeded
+
+HIGH, NORMAL, LOW = 0, 1, 2
+
+_local = threading.local()
+
+
+def current_priority():
+    return getattr(_local, "priority", NORMAL)
+
+
+@contextlib.contextmanager
+def priority(level):
+    """ run the calls made inside with priority `level`, None keeps the
+        current one """
+    outer = current_priority()
+    _local.priority = outer if level is None else level
+    try:
+        yield
+    finally:
+        _local.priority = outer
+
+
+class Ticket(object):
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class Scheduler(object):
+    """ hands out `slots` slots to callers of acquire(), by priority. Each
+        class gets a share of the slots in proportion to `weights` while
+        it has callers waiting; `reserved` (a fraction of the slots) is
+        left to HIGH """
+
+    def __init__(self, slots=8, weights=None, reserved=0.25):
+        self.slots = slots
+        self.weights = weights or {HIGH: 8, NORMAL: 4, LOW: 1}
+        self.reserved = int(math.ceil(slots * reserved))
+        if self.reserved >= slots:
+            raise ValueError("Nothing left for other than HIGH priority")
+        self.in_use = 0
+        # slots granted per class
+        self.granted = collections.Counter()
+
+        self._queues = dict((level, collections.deque())
+                            for level in self.weights)
+        # stride scheduling: a class is served when its pass is lowest,
+        # and moves 1/weight further each time
+        self._passes = dict((level, 0.0) for level in self.weights)
+        self._vtime = 0.0
+        self._cond = threading.Condition()
+
+    def waiting(self, level=None):
+        with self._cond:
+            if level is not None:
+                return len(self._queues[level])
+            return sum(len(q) for q in self._queues.values())
+
+    def _limit(self, level):
+        return self.slots if level == HIGH else self.slots - self.reserved
+
+    def _dispatch(self):
+        granted = False
+        while self.in_use < self.slots:
+            ready = [level for level, queue in self._queues.items()
+                     if queue and self.in_use < self._limit(level)]
+            if not ready:
+                break
+            level = min(ready, key=lambda c: (self._passes[c], c))
+            self._queues[level].popleft().granted = True
+            self.in_use += 1
+            self.granted[level] += 1
+            self._vtime = self._passes[level]
+            self._passes[level] += 1 / self.weights[level]
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, level=None):
+        """ wait for a slot, at most until the caller's deadline """
+        if level is None:
+            level = current_priority()
+        if level not in self._queues:
+            raise ValueError("Unknown priority {0}".format(level))
+        ticket = Ticket()
+        with self._cond:
+            queue = self._queues[level]
+            if not queue:
+                # a class that was idle doesn't get to catch up on the
+                # turns it didn't use
+                self._passes[level] = max(self._passes[level], self._vtime)
+            queue.append(ticket)
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    self._cond.wait(remaining())
+            except DeadlineExceeded:
+                if ticket.granted:
+                    self._release()
+                else:
+                    queue.remove(ticket)
+                raise
+
+    def _release(self):
+        self.in_use -= 1
+        self._dispatch()
+
+    def release(self):
+        with self._cond:
+            self._release()
+
+    @contextlib.contextmanager
+    def slot(self, level=None):
+        self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class PriorityConnector(object):
+    """ sends calls through a Scheduler, splitting batches larger than
+        `chunk_size` """
+
+    def __init__(self, connector, scheduler=None, chunk_size=100):
+        self.connector = connector
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.chunk_size = chunk_size
+
+    def __getattr__(self, name):
+        return getattr(self.connector, name)
+
+    def invoke(self, data):
+        with self.scheduler.slot():
+            return self.connector.invoke(data)
+
+    def invoke_batch(self, batch):
+        res = []
+        for i in range(0, len(batch), self.chunk_size):
+            with self.scheduler.slot():
+                res.extend(self.connector.invoke_batch(
+                    batch[i:i + self.chunk_size]))
+        return res
@@ -0,0 +1,61 @@
+import threading
+
+from concurrent.futures import Future, wait
+
+from .deadlines import remaining, expired, DeadlineExceeded
+
+
+class SingleFlight(object):
+    """ Coalesces identical concurrent calls. The first caller for a key
+        performs the call; callers arriving while it's in flight wait
+        for and share its result or exception. Once it completes the
+        next caller starts a fresh call, so nothing is served stale.
+
+        Waiting callers keep to their own deadline. When the first
+        caller runs out of its deadline, they make the call themselves.
+
+        Note that waiting callers get the very same result object """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            done, _ = wait([future], remaining())
+            if not done:
+                raise DeadlineExceeded("Deadline exceeded")
+            if not isinstance(future.exception(), DeadlineExceeded):
+                return future.result()
+            # the call ran out of someone else's time, try again
+
+        try:
+            res = fn()
+        except BaseException as e:
+            self._done(key)
+            # a failure past the deadline is likely down to the deadline,
+            # which the others needn't share
+            future.set_exception(DeadlineExceeded("Deadline exceeded")
+                                 if expired() else e)
+            raise
+        self._done(key)
+        future.set_result(res)
+        return res
+
+    def _done(self, key):
+        with self._lock:
+            del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,285 @@
+"""
+A persistent local store of chain data.
+
+Blocks are stored by hash, which never goes stale. A separate canonical
+index maps numbers to hashes; it's only trusted for blocks at least
+`confirmations` below the highest head seen, and it's rolled back as
+soon as a block arrives that doesn't fit on the stored chain.
+
+Receipts are stored by transaction hash and only served if their block
+is still canonical (or deep enough to be considered final).
+
+eth_getLogs answers are stored by filter, for block ranges that are
+already final when they're fetched, and served while they still are.
+
+The store is a best effort, like SQLiteCache: a locked or broken
+database makes for a fetch from the node, never a failed call.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+
+from .cache import Transaction
+from .codecs import default_codec
+
+codec = default_codec()
+
+
+def quantity(value):
+    return int(value, 16) if isinstance(value, str) else value
+
+
+class ChainStore(object):
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS blocks (
+            hash TEXT NOT NULL,
+            full INTEGER NOT NULL,
+            number INTEGER NOT NULL,
+            parent TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (hash, full));
+        CREATE TABLE IF NOT EXISTS canonical (
+            number INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS receipts (
+            tx_hash TEXT PRIMARY KEY,
+            block_hash TEXT NOT NULL,
+            number INTEGER NOT NULL,
+            data BLOB NOT NULL);
+        CREATE INDEX IF NOT EXISTS receipts_number ON receipts (number);
+        CREATE TABLE IF NOT EXISTS logs (
+            filter TEXT PRIMARY KEY,
+            last INTEGER NOT NULL,
+            data BLOB NOT NULL);
+        CREATE INDEX IF NOT EXISTS logs_last ON logs (last);
+        CREATE TABLE IF NOT EXISTS meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta VALUES ('head', -1);
+    """
+
+    # methods served from the store
+    methods = ("eth_getBlockByHash", "eth_getBlockByNumber",
+               "eth_getTransactionReceipt", "eth_getLogs")
+
+    def __init__(self, path, confirmations=12, timeout=5.0):
+        self.path = path
+        self.confirmations = confirmations
+        self.timeout = timeout
+        self.reorgs = 0
+        self._local = threading.local()
+        self._db.executescript(self.SCHEMA)
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.db = sqlite3.connect(self.path, timeout=self.timeout,
+                                       isolation_level=None)
+            local.db.execute("PRAGMA journal_mode=WAL")
+            local.pid = os.getpid()
+        return local.db
+
+    def _transaction(self):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        return Transaction(db)
+
+    @property
+    def head(self):
+        """ the highest block number seen, or None """
+        head = self._db.execute(
+            "SELECT value FROM meta WHERE name = 'head'").fetchone()[0]
+        return None if head < 0 else head
+
+    def new_head(self, number):
+        self._db.execute(
+            "UPDATE meta SET value = MAX(value, ?) WHERE name = 'head'",
+            (number,))
+
+    def final(self, number):
+        """ whether a block is deep enough to trust the canonical index
+            for it """
+        head = self.head
+        return head is not None and number <= head - self.confirmations
+
+    # blocks
+
+    def add_block(self, block, full=False, canonical=True):
+        """ store a block. Unless it was fetched by hash (and might be an
+            uncle or orphan), it's also added to the canonical index,
+            rolling back whatever doesn't fit on it """
+        number = quantity(block["number"])
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)",
+                       (block["hash"], int(full), number,
+                        block["parentHash"], codec.dumps(block)))
+            if not canonical:
+                return
+
+            stale = self._stale_from(db, number, block)
+            if stale is not None:
+                self._rollback(db, stale)
+            db.execute("INSERT OR REPLACE INTO canonical VALUES (?, ?)",
+                       (number, block["hash"]))
+            db.execute(
+                "UPDATE meta SET value = MAX(value, ?) WHERE name = 'head'",
+                (number,))
+
+    def _stale_from(self, db, number, block):
+        """ the lowest block number the new canonical block contradicts,
+            if any """
+        def stored(n):
+            row = db.execute("SELECT hash FROM canonical WHERE number = ?",
+                             (n,)).fetchone()
+            return row and row[0]
+
+        parent = stored(number - 1)
+        if parent and parent != block["parentHash"]:
+            return number - 1
+
+        current = stored(number)
+        if current and current != block["hash"]:
+            return number
+
+        child = db.execute(
+            "SELECT b.parent FROM canonical c JOIN blocks b "
+            "ON b.hash = c.hash WHERE c.number = ?",
+            (number + 1,)).fetchone()
+        if child and child[0] != block["hash"]:
+            return number + 1
+        return None
+
+    def rollback(self, number):
+        """ forget the canonical chain from block `number` on """
+        with self._transaction() as db:
+            self._rollback(db, number)
+
+    def _rollback(self, db, number):
+        db.execute("DELETE FROM canonical WHERE number >= ?", (number,))
+        db.execute("DELETE FROM receipts WHERE number >= ?", (number,))
+        db.execute("DELETE FROM logs WHERE last >= ?", (number,))
+        self.reorgs += 1
+
+    def canonical_hash(self, number):
+        row = self._db.execute("SELECT hash FROM canonical WHERE number = ?",
+                               (number,)).fetchone()
+        return row and row[0]
+
+    def block_by_hash(self, block_hash, full=False):
+        row = self._db.execute(
+            "SELECT data FROM blocks WHERE hash = ? AND full = ?",
+            (block_hash, int(full))).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def block_by_number(self, number, full=False):
+        if not self.final(number):
+            return None
+        block_hash = self.canonical_hash(number)
+        return block_hash and self.block_by_hash(block_hash, full)
+
+    # receipts
+
+    def add_receipt(self, receipt):
+        self._db.execute("INSERT OR REPLACE INTO receipts VALUES (?, ?, ?, ?)",
+                         (receipt["transactionHash"], receipt["blockHash"],
+                          quantity(receipt["blockNumber"]),
+                          codec.dumps(receipt)))
+
+    def receipt(self, tx_hash):
+        row = self._db.execute(
+            "SELECT block_hash, number, data FROM receipts "
+            "WHERE tx_hash = ?", (tx_hash,)).fetchone()
+        if row is None:
+            return None
+        block_hash, number, data = row
+        canonical = self.canonical_hash(number)
+        if canonical != block_hash and not (canonical is None and
+                                            self.final(number)):
+            return None
+        return codec.loads(data)
+
+    # logs
+
+    @staticmethod
+    def _log_range(log_filter):
+        """ the key and last block of a filter over a range of numbered
+            blocks, None for "latest", block hashes and the like """
+        if not isinstance(log_filter, dict):
+            return None
+        first, last = log_filter.get("fromBlock"), log_filter.get("toBlock")
+        if not all(isinstance(n, str) and n.startswith("0x")
+                   for n in (first, last)):
+            return None
+        return json.dumps(log_filter, sort_keys=True), quantity(last)
+
+    def add_logs(self, log_filter, logs):
+        """ store the logs of a filter, if its whole range is final """
+        log_range = self._log_range(log_filter)
+        if log_range is None or not self.final(log_range[1]):
+            return
+        self._db.execute("INSERT OR REPLACE INTO logs VALUES (?, ?, ?)",
+                         log_range + (codec.dumps(logs),))
+
+    def logs(self, log_filter):
+        log_range = self._log_range(log_filter)
+        if log_range is None or not self.final(log_range[1]):
+            return None
+        row = self._db.execute("SELECT data FROM logs WHERE filter = ?",
+                               (log_range[0],)).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    # read-through for API
+
+    def handles(self, method):
+        return method in self.methods
+
+    def lookup(self, method, params):
+        """ the stored result of a call, None if there's none to serve """
+        try:
+            return self._lookup(method, params)
+        except sqlite3.OperationalError:
+            return None
+
+    def _lookup(self, method, params):
+        if method == "eth_getBlockByHash":
+            return self.block_by_hash(params[0], bool(params[1:2] and
+                                                      params[1]))
+        if method == "eth_getBlockByNumber":
+            if not isinstance(params[0], str) or \
+                    not params[0].startswith("0x"):
+                return None
+            return self.block_by_number(quantity(params[0]),
+                                        bool(params[1:2] and params[1]))
+        if method == "eth_getTransactionReceipt":
+            return self.receipt(params[0])
+        if method == "eth_getLogs":
+            return self.logs(params[0] if params else None)
+        return None
+
+    def save(self, method, params, result):
+        """ store what a call returned, if it's worth keeping. Failing to
+            must not fail the call that fetched it """
+        try:
+            self._save(method, params, result)
+        except sqlite3.OperationalError:
+            pass
+
+    def _save(self, method, params, result):
+        if result is None:
+            return
+        full = bool(params[1:2] and params[1])
+        if method == "eth_getBlockByHash":
+            self.add_block(result, full, canonical=False)
+        elif method == "eth_getBlockByNumber":
+            # "latest" and "pending" still tell us about the head
+            if result.get("hash") is not None:
+                self.add_block(result, full)
+        elif method == "eth_getTransactionReceipt":
+            if result.get("blockHash") is not None:
+                self.add_receipt(result)
+        elif method == "eth_getLogs":
+            self.add_logs(params[0] if params else None, result)
@@ -0,0 +1,250 @@
+"""
+Incremental parsing of json-rpc responses.
+
+A ResultStream is fed the response in chunks as they arrive and hands
+out the items of a `result` array as soon as each one is complete, so
+only one item (plus whatever is still unparsed) is held in memory at a
+time. Everything else in the response envelope (id, error, a result
+that isn't an array) is small and parsed as a whole.
+"""
+
+import re
+import json
+import mmap
+
+# a structural character, or a whole string. The closing quote group is
+# empty if the string continues in the next chunk
+TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\],:]')
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# what may still follow the digits a number was decoded from
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+NON_ASCII = re.compile(rb'[\x80-\xff]')
+
+QUOTE = ord('"')
+OPEN = (ord('{'), ord('['))
+CLOSE = (ord('}'), ord(']'))
+COMMA = ord(',')
+COLON = ord(':')
+OPEN_ARRAY = ord('[')
+CLOSE_ARRAY = ord(']')
+
+
+class ResultStream(object):
+    # items that are still incomplete after this many bytes are parsed
+    # token by token instead of being retried with every chunk
+    fast_limit = 1024 * 1024
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.done = False
+        # True once the result turned out to be an array and its items
+        # have been handed out through feed()
+        self.streamed = False
+
+        self._buf = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_array = False
+        self._key = None
+        self._values = {}
+        # start of the current key or value at depth 1
+        self._seg = 0
+        # start of the current array item
+        self._sep = 0
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk):
+        """ add a chunk of the response, return the result items that
+            are now complete """
+        if self.done:
+            return []
+        self._buf += chunk
+        items = []
+        self._scan(items)
+
+        keep = self._sep if self._in_array else self._seg
+        if keep:
+            del self._buf[:keep]
+            self._pos -= keep
+            self._seg -= keep
+            self._sep -= keep
+        return items
+
+    def close(self):
+        """ return the response without the streamed result """
+        if not self.done:
+            raise ValueError("Incomplete json-rpc response")
+        return self._values
+
+    def _scan(self, items):
+        buf = self._buf
+        pos = self._pos
+
+        while not self.done:
+            if self._in_array and self._depth == 2 and pos == self._sep:
+                pos, wait = self._fast_items(pos, items)
+                if wait:
+                    break
+
+            m = TOKEN.search(buf, pos)
+            if m is None:
+                pos = len(buf)
+                break
+            pos = m.start()
+            c = buf[pos]
+
+            if c == QUOTE:
+                if m.group(1) is None:
+                    # rescan the string once more data has arrived
+                    break
+                pos = m.end()
+                continue
+            elif c in OPEN:
+                self._open(c, pos)
+            elif c in CLOSE:
+                self._close(c, pos, items)
+            elif c == COLON and self._depth == 1:
+                self._key = self.codec.loads(buf[self._seg:pos])
+                self._seg = pos + 1
+            elif c == COMMA and self._depth == 1:
+                self._value(buf[self._seg:pos])
+                self._seg = pos + 1
+            elif c == COMMA and self._depth == 2 and self._in_array:
+                self._item(buf[self._sep:pos], items)
+                self._sep = pos + 1
+            pos += 1
+
+        self._pos = pos
+
+    def _fast_items(self, pos, items):
+        """ decode whole array items at once, which is much faster than
+            scanning them token by token. A latin-1 view of the buffer
+            maps bytes 1:1 to characters so offsets carry over; items
+            with non-ascii data are decoded again from their bytes.
+
+            Returns the position to continue scanning from and whether
+            more data is needed first """
+        text = self._buf.decode("latin-1")
+        size = len(text)
+
+        while True:
+            start = WHITESPACE.match(text, pos).end()
+            if start == size:
+                return pos, True
+            if text[start] in "],":
+                return start, False
+
+            try:
+                value, end = self._decoder.raw_decode(text, start)
+            except ValueError as e:
+                if e.pos < size or size - start > self.fast_limit:
+                    # invalid or very large, leave it to the scanner
+                    return start, False
+                return pos, True
+            if isinstance(value, (int, float)) and \
+                    not isinstance(value, bool):
+                # "1" may be "12", "0." "0.5" and "1e" "1e3" once the
+                # next chunk arrives
+                tail = NUMBER_TAIL.match(text, end).end()
+                if tail == size:
+                    return pos, True
+                if tail != end:
+                    # not a valid number, leave it to the scanner
+                    return start, False
+
+            segment = self._buf[start:end]
+            if NON_ASCII.search(segment):
+                value = self.codec.loads(segment)
+            items.append(value)
+
+            pos = WHITESPACE.match(text, end).end()
+            if pos == size:
+                self._sep = end
+                return end, True
+            if text[pos] != ",":
+                self._sep = pos
+                return pos, False
+            pos += 1
+            self._sep = pos
+
+    def _open(self, c, pos):
+        self._depth += 1
+        if self._depth == 1:
+            if c == OPEN_ARRAY:
+                raise ValueError("Batch responses can't be streamed")
+            self._seg = pos + 1
+        elif (self._depth == 2 and c == OPEN_ARRAY and
+              self._key == "result" and
+              not self._buf[self._seg:pos].strip()):
+            self._in_array = True
+            self._sep = pos + 1
+
+    def _close(self, c, pos, items):
+        if self._depth == 2 and self._in_array and c == CLOSE_ARRAY:
+            self._item(self._buf[self._sep:pos], items)
+            self._in_array = False
+            self.streamed = True
+            self._seg = pos + 1
+        elif self._depth == 1:
+            self._value(self._buf[self._seg:pos])
+            self.done = True
+        self._depth -= 1
+
+    def _value(self, segment):
+        if self._key is None:
+            return
+        if self._key == "result" and self.streamed:
+            return
+        self._values[self._key] = self.codec.loads(segment)
+        self._key = None
+
+    def _item(self, segment, items):
+        segment = segment.strip()
+        if segment:
+            items.append(self.codec.loads(segment))
+
+
+class RawResponse(object):
+    """ A response body stored in a file rather than in memory. Nothing
+        is parsed until asked for. `connector` supplies the codec and
+        the error handling """
+
+    chunk_size = 65536
+
+    def __init__(self, file, size, connector):
+        self.file = file
+        self.size = size
+        self.connector = connector
+
+    def chunks(self):
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def mmap(self):
+        """ a read only memory map of the raw body """
+        return mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def iter_result(self):
+        """ iterate over the items of an array result, see
+            Connector.iter_result """
+        return self.connector.iter_result(self.chunks())
+
+    def result(self):
+        """ parse the whole response into memory """
+        self.file.seek(0)
+        data = self.connector.codec.loads(self.file.read())
+        return self.connector.parse_result(data)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,263 @@
+"""
+Push subscriptions over persistent connections.
+
+Over websockets and IPC a node can push notifications for `eth_subscribe`
+subscriptions (newHeads, logs, newPendingTransactions) instead of being
+polled. A Multiplexer owns such a connection: a reader thread matches
+responses to the requests waiting for them by id, and hands
+notifications to their Subscription.
+
+Each Subscription buffers at most `maxsize` notifications. With
+overflow="block" a full buffer stalls the reader, so a slow consumer
+pushes back on the node rather than growing memory; with "drop" the
+oldest notification is discarded instead (and counted in `dropped`).
+"""
+
+import queue
+import socket
+import asyncio
+import itertools
+import threading
+import collections
+
+from concurrent.futures import Future, TimeoutError
+
+
+class Subscription(object):
+    """ Iterate over it (also with `async for`), or pass a callback which
+        is called with every notification from a thread of its own.
+        Iteration ends after unsubscribe() and raises if the connection
+        was lost. A callback that raises is counted in `callback_errors`
+        and keeps getting the notifications that follow """
+
+    def __init__(self, multiplexer, kind, callback=None, maxsize=1000,
+                 overflow="block"):
+        if overflow not in ("block", "drop"):
+            raise ValueError("Unknown overflow policy {0}".format(overflow))
+        self.multiplexer = multiplexer
+        self.kind = kind
+        self.callback = callback
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.id = None
+        self.dropped = 0
+        self.callback_errors = 0
+        self.error = None
+
+        self._items = collections.deque()
+        self._ended = False
+        self._cond = threading.Condition()
+
+    def start(self, id):
+        self.id = id
+        if self.callback is not None:
+            thread = threading.Thread(target=self._dispatch, daemon=True)
+            thread.start()
+
+    def _dispatch(self):
+        try:
+            for item in self:
+                try:
+                    self.callback(item)
+                except Exception:
+                    # one bad notification mustn't end the subscription
+                    self.callback_errors += 1
+        except ConnectionError:
+            pass
+
+    def put(self, item):
+        with self._cond:
+            while len(self._items) >= self.maxsize and not self._ended and \
+                    self.overflow == "block":
+                self._cond.wait()
+            if self._ended:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """ the next notification. Raises queue.Empty on timeout, returns
+            None once the subscription has ended """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._ended,
+                                       timeout):
+                raise queue.Empty
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            if self.error is not None:
+                raise self.error
+            return None
+
+    def end(self, error=None):
+        """ stop delivering. Pending notifications can still be read """
+        with self._cond:
+            if not self._ended:
+                self._ended = True
+                self.error = error
+            self._cond.notify_all()
+
+    @property
+    def active(self):
+        return not self._ended
+
+    def unsubscribe(self):
+        if self._ended:
+            return
+        self.end()
+        self.multiplexer.unsubscribe(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.get()
+        if item is None:
+            raise StopIteration
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_event_loop()
+        item = await loop.run_in_executor(None, self.get)
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unsubscribe()
+
+
+class Multiplexer(object):
+    """ Concurrent requests and subscriptions over a single connection.
+        `transport` needs send(bytes), messages() and close(). Request
+        ids are replaced by the multiplexer's own so that they can't
+        collide, responses get the original ids back """
+
+    subscription_class = Subscription
+
+    def __init__(self, transport, codec, parse_result, timeout=None):
+        self.transport = transport
+        self.codec = codec
+        self.parse_result = parse_result
+        self.timeout = timeout
+        self.subscriptions = {}
+        self.closed = False
+
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        error = ConnectionError("Connection closed")
+        try:
+            for message in self.transport.messages():
+                self._dispatch(self.codec.loads(message))
+        except Exception as e:
+            error = e if isinstance(e, ConnectionError) else \
+                ConnectionError(str(e))
+        self._close(error)
+
+    def _dispatch(self, message):
+        if isinstance(message, dict) and \
+                message.get("method", "").endswith("_subscription"):
+            params = message["params"]
+            subscription = self.subscriptions.get(params["subscription"])
+            if subscription is not None:
+                subscription.put(params["result"])
+            return
+
+        responses = message if isinstance(message, list) else [message]
+        with self._lock:
+            entry = None
+            for response in responses:
+                entry = self._pending.pop(response.get("id"), None) or entry
+        if entry is None:
+            return
+        future, subscription = entry
+        if subscription is not None and "result" in message:
+            # registered before anyone can wait for the subscription,
+            # notifications may follow the response immediately
+            self.subscriptions[message["result"]] = subscription
+            subscription.start(message["result"])
+        future.set_result(message)
+
+    def request(self, data, subscription=None, timeout=None):
+        """ send a request or batch and return the raw response """
+        batch = data if isinstance(data, list) else [data]
+        originals = {}
+        renumbered = []
+        for request in batch:
+            id = next(self._ids)
+            originals[id] = request.get("id")
+            renumbered.append(dict(request, id=id))
+
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise ConnectionError("Connection closed")
+            for id in originals:
+                self._pending[id] = (future, subscription)
+        try:
+            self.transport.send(self.codec.dumps(
+                renumbered if isinstance(data, list) else renumbered[0]))
+            response = future.result(
+                timeout if timeout is not None else self.timeout)
+        except TimeoutError:
+            raise socket.timeout("No response within {0}s".format(
+                timeout if timeout is not None else self.timeout))
+        finally:
+            with self._lock:
+                for id in originals:
+                    self._pending.pop(id, None)
+
+        for r in response if isinstance(response, list) else [response]:
+            r["id"] = originals.get(r.get("id"))
+        return response
+
+    def subscribe(self, kind, params=(), **options):
+        subscription = self.subscription_class(self, kind, **options)
+        response = self.request(
+            dict(jsonrpc="2.0", method="eth_subscribe",
+                 params=[kind] + list(params)), subscription=subscription)
+        self.parse_result(response)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.pop(subscription.id, None)
+        if self.closed:
+            return
+        response = self.request(dict(jsonrpc="2.0", method="eth_unsubscribe",
+                                     params=[subscription.id]))
+        self.parse_result(response)
+
+    def _close(self, error):
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        for subscription in list(self.subscriptions.values()):
+            subscription.end(error)
+        self.subscriptions = {}
+
+    def close(self):
+        """ close the connection. Active subscriptions end without an
+            error """
+        for subscription in list(self.subscriptions.values()):
+            subscription.end()
+        self.subscriptions = {}
+        self.transport.close()
+        self._reader.join(1)
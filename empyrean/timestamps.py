@@ -0,0 +1,104 @@
+"""
+Finding blocks by time.
+
+BlockTimeIndex answers "the first block at or after timestamp T" by
+searching block headers. Each step guesses the block by interpolating
+between the closest known blocks on either side, which converges in a
+few steps as block times are fairly regular; a step that doesn't at
+least halve the range is followed by plain bisection, which bounds the
+worst case.
+
+The timestamp of every header looked at is kept in a compact sorted
+cache, so later searches start from a narrow range and usually need
+only one or two calls.
+"""
+
+import array
+import bisect
+import threading
+
+
+class BlockTimeIndex(object):
+
+    def __init__(self, api, max_entries=100000):
+        self.api = api
+        self.max_entries = max_entries
+        self.fetches = 0
+
+        self._numbers = array.array("q")
+        self._times = array.array("q")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def add(self, number, timestamp):
+        with self._lock:
+            i = bisect.bisect_left(self._numbers, number)
+            if i < len(self._numbers) and self._numbers[i] == number:
+                return
+            self._numbers.insert(i, number)
+            self._times.insert(i, timestamp)
+            if len(self._numbers) > self.max_entries:
+                # thin out evenly, which keeps every range bracketed
+                self._numbers = self._numbers[::2]
+                self._times = self._times[::2]
+
+    def timestamp(self, number):
+        """ the timestamp of block `number`, or None if there's no such
+            block yet """
+        with self._lock:
+            i = bisect.bisect_left(self._numbers, number)
+            if i < len(self._numbers) and self._numbers[i] == number:
+                return self._times[i]
+        block = self.api.eth.getBlockByNumber(number)
+        self.fetches += 1
+        if block is None:
+            return None
+        timestamp = int(block["timestamp"], 16)
+        self.add(number, timestamp)
+        return timestamp
+
+    def _bracket(self, timestamp):
+        """ the closest known blocks before and at / after timestamp. As
+            block times only go up, timestamps are sorted too """
+        with self._lock:
+            i = bisect.bisect_left(self._times, timestamp)
+            below = i > 0 and (self._numbers[i - 1], self._times[i - 1])
+            above = i < len(self._times) and (self._numbers[i],
+                                              self._times[i])
+        return below or None, above or None
+
+    def block_at(self, timestamp):
+        """ the number of the first block with a timestamp at or after
+            `timestamp`, or None if the chain hasn't got there yet """
+        below, above = self._bracket(timestamp)
+        if above is None:
+            head = int(self.api.eth("blockNumber"), 16)
+            head_time = self.timestamp(head)
+            if head_time is None or head_time < timestamp:
+                return None
+            above = (head, head_time)
+        if below is None:
+            genesis = self.timestamp(0)
+            if genesis >= timestamp:
+                return 0
+            below = (0, genesis)
+
+        (lo, lo_time), (hi, hi_time) = below, above
+        bisect_next = False
+        while hi - lo > 1:
+            if bisect_next:
+                guess = (lo + hi) // 2
+            else:
+                guess = lo + (timestamp - lo_time) * (hi - lo) // \
+                    max(hi_time - lo_time, 1)
+                guess = min(max(guess, lo + 1), hi - 1)
+            size = hi - lo
+            guess_time = self.timestamp(guess)
+            if guess_time >= timestamp:
+                hi, hi_time = guess, guess_time
+            else:
+                lo, lo_time = guess, guess_time
+            bisect_next = not bisect_next and hi - lo > size // 2
+        return hi
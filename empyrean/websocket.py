@@ -0,0 +1,221 @@
+"""
+A minimal RFC 6455 websocket client.
+
+Just enough of the protocol to talk json-rpc to a node: the opening
+handshake, masked text frames, fragmented messages, ping / pong and the
+closing handshake. Extensions and subprotocols aren't supported.
+"""
+
+import os
+import ssl
+import base64
+import socket
+import struct
+import hashlib
+import threading
+
+from urllib.parse import urlsplit
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def accept_key(key):
+    """ the Sec-WebSocket-Accept a server answers `key` with """
+    return base64.b64encode(hashlib.sha1(key + GUID).digest())
+
+
+def frame(opcode, payload, mask=True, fin=True):
+    """ encode a single frame. Clients must mask what they send, servers
+        must not """
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    size = len(payload)
+    bit = 0x80 if mask else 0
+    if size < 126:
+        header.append(bit | size)
+    elif size < 65536:
+        header.append(bit | 126)
+        header += struct.pack("!H", size)
+    else:
+        header.append(bit | 127)
+        header += struct.pack("!Q", size)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    return bytes(header) + key + apply_mask(key, payload)
+
+
+def apply_mask(key, data):
+    """ xor data with the 4 byte key, a whole int at a time """
+    if not data:
+        return data
+    repeated = (key * (len(data) // 4 + 1))[:len(data)]
+    masked = int.from_bytes(data, "big") ^ int.from_bytes(repeated, "big")
+    return masked.to_bytes(len(data), "big")
+
+
+def read_frame(read):
+    """ read a single frame using `read(n)`, which must return exactly n
+        bytes. Returns (fin, opcode, payload) """
+    first, second = read(2)
+    size = second & 0x7F
+    if size == 126:
+        size = struct.unpack("!H", read(2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", read(8))[0]
+    key = read(4) if second & 0x80 else None
+    payload = read(size) if size else b""
+    if key is not None:
+        payload = apply_mask(key, payload)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+class WebSocket(object):
+    """ A client connection. send() may be called from any thread, only
+        one thread should receive """
+
+    recv_size = 65536
+
+    def __init__(self, url, timeout=10, headers=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("ws", "wss"):
+            raise ValueError("Not a websocket url: {0}".format(url))
+        secure = parts.scheme == "wss"
+        host = parts.hostname
+        port = parts.port or (443 if secure else 80)
+
+        self.sock = socket.create_connection((host, port), timeout)
+        try:
+            if secure:
+                context = ssl.create_default_context()
+                self.sock = context.wrap_socket(self.sock,
+                                                server_hostname=host)
+            # received data, of which everything before _pos is read
+            self._buf = bytearray()
+            self._pos = 0
+            self._handshake(parts, headers or {})
+        except Exception:
+            self.sock.close()
+            raise
+        # reads block until a message arrives, notifications may take
+        # arbitrarily long
+        self.sock.settimeout(None)
+        self._send_lock = threading.Lock()
+        self.closed = False
+
+    def _handshake(self, parts, headers):
+        key = base64.b64encode(os.urandom(16))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        lines = ["GET {0} HTTP/1.1".format(path),
+                 "Host: {0}".format(parts.netloc),
+                 "Upgrade: websocket",
+                 "Connection: Upgrade",
+                 "Sec-WebSocket-Key: {0}".format(key.decode("ascii")),
+                 "Sec-WebSocket-Version: 13"]
+        lines.extend("{0}: {1}".format(k, v) for k, v in headers.items())
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+
+        while b"\r\n\r\n" not in self._buf:
+            self._fill()
+        head, rest = bytes(self._buf).split(b"\r\n\r\n", 1)
+        self._buf = bytearray(rest)
+        status, *fields = head.decode("latin-1").split("\r\n")
+        if status.split()[1:2] != ["101"]:
+            raise ConnectionError("Websocket handshake failed: " + status)
+        fields = dict((k.strip().lower(), v.strip()) for k, _, v in
+                      (f.partition(":") for f in fields))
+        if fields.get("sec-websocket-accept", "").encode("ascii") != \
+                accept_key(key):
+            raise ConnectionError("Websocket handshake failed: bad accept")
+
+    def _fill(self):
+        chunk = self.sock.recv(self.recv_size)
+        if not chunk:
+            raise ConnectionError("Websocket closed by peer")
+        if self._pos > len(self._buf) // 2:
+            # drop what's been read once it's most of the buffer, which
+            # keeps the copying linear
+            del self._buf[:self._pos]
+            self._pos = 0
+        self._buf += chunk
+
+    def _read(self, size):
+        if len(self._buf) - self._pos < size and size > self.recv_size:
+            return self._read_large(size)
+        while len(self._buf) - self._pos < size:
+            self._fill()
+        data = bytes(self._buf[self._pos:self._pos + size])
+        self._pos += size
+        return data
+
+    def _read_large(self, size):
+        """ a large payload is received straight into a buffer of its
+            size """
+        data = bytearray(size)
+        got = len(self._buf) - self._pos
+        data[:got] = self._buf[self._pos:]
+        self._buf = bytearray()
+        self._pos = 0
+        view = memoryview(data)
+        while got < size:
+            n = self.sock.recv_into(view[got:])
+            if not n:
+                raise ConnectionError("Websocket closed by peer")
+            got += n
+        return bytes(data)
+
+    def _send_frame(self, opcode, payload):
+        data = frame(opcode, payload)
+        with self._send_lock:
+            self.sock.sendall(data)
+
+    def send(self, payload):
+        """ send a text message """
+        self._send_frame(TEXT, payload)
+
+    def recv(self):
+        """ the next complete data message, answering pings on the way """
+        parts = []
+        while True:
+            fin, opcode, payload = read_frame(self._read)
+            if opcode == PING:
+                self._send_frame(PONG, payload)
+                continue
+            if opcode == PONG:
+                continue
+            if opcode == CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    try:
+                        self._send_frame(CLOSE, payload[:2])
+                    except OSError:
+                        pass
+                raise ConnectionError("Websocket closed by peer")
+            parts.append(payload)
+            if fin:
+                return b"".join(parts)
+
+    def messages(self):
+        while True:
+            yield self.recv()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self._send_frame(CLOSE, struct.pack("!H", 1000))
+            except OSError:
+                pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -33,6 +33,10 @@ setup(
                  'empyrean'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require={
+        # a faster json codec, used when it's installed
+        "orjson": ["orjson"],
+    },
     license="BSD license",
     zip_safe=False,
     keywords='empyrean',
@@ -0,0 +1,67 @@
+"""
+An in-memory connector and API for testing without a node
+"""
+
+import threading
+
+from empyrean.api import API
+from empyrean.connectors import Connector
+
+
+def echo(method, params):
+    return [method, list(params)]
+
+
+class DummyConnector(Connector):
+    """ answers requests by calling `handler(method, params)`. The
+        handler may raise to simulate errors. All requests and batches
+        are recorded """
+
+    def __init__(self, handler=echo):
+        self.handler = handler
+        self.invocations = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def _respond(self, data):
+        try:
+            res = self.handler(data['method'], data['params'])
+        except Exception as e:
+            return e
+        return res
+
+    def invoke(self, data):
+        with self._lock:
+            self.invocations.append(data)
+        res = self._respond(data)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    def invoke_batch(self, batch):
+        with self._lock:
+            self.batches.append(batch)
+        return [self._respond(data) for data in batch]
+
+    @property
+    def calls(self):
+        """ (method, params) of every request seen, batched or not """
+        res = [(d['method'], list(d['params'])) for d in self.invocations]
+        for batch in self.batches:
+            res.extend((d['method'], list(d['params'])) for d in batch)
+        return res
+
+
+class DummyAPI(API):
+    connector_class = DummyConnector
+
+
+def wait_for(condition, timeout=2):
+    """ wait until condition() holds, for things happening in other
+        threads """
+    event = threading.Event()
+    for i in range(int(timeout / 0.005)):
+        if condition():
+            return
+        event.wait(0.005)
+    raise AssertionError("timed out")
@@ -0,0 +1,204 @@
+"""
+Local stand-in servers for testing connectors without a running node
+"""
+
+import os
+import json
+import socket
+import tempfile
+import threading
+
+from empyrean import websocket
+
+
+def echo_handler(request):
+    """ answer every request with its own method and params """
+    return dict(jsonrpc="2.0", id=request.get("id"),
+                result=[request["method"], request["params"]])
+
+
+class FakeIPCServer(object):
+    """ A unix socket server that answers json-rpc requests using
+        `handler`, one thread per connection """
+
+    def __init__(self, handler=echo_handler):
+        self.handler = handler
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "geth.ipc")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(64)
+        self.connections = []
+        self.requests = []
+        # subscription id -> (kind, connection)
+        self.subscriptions = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections.append(conn)
+            thread = threading.Thread(target=self._serve, args=(conn,),
+                                      daemon=True)
+            thread.start()
+
+    def _serve(self, conn):
+        decoder = json.JSONDecoder()
+        buf = ""
+        while True:
+            try:
+                chunk = conn.recv(65536)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buf += chunk.decode("utf8")
+            while buf.strip():
+                try:
+                    request, end = decoder.raw_decode(buf.lstrip())
+                except ValueError:
+                    break
+                buf = buf.lstrip()[end:]
+                if not self._handle(conn, request):
+                    return
+
+    def _handle(self, conn, request):
+        with self._lock:
+            self.requests.append(request)
+        if isinstance(request, list):
+            response = [self.handler(r) for r in request]
+        elif request.get("method") == "eth_subscribe":
+            response = self.subscribe(conn, request)
+        elif request.get("method") == "eth_unsubscribe":
+            with self._lock:
+                found = self.subscriptions.pop(request["params"][0], None)
+            response = dict(jsonrpc="2.0", id=request["id"],
+                            result=found is not None)
+        else:
+            response = self.handler(request)
+        if response is None:
+            return True
+        try:
+            self._write(conn, json.dumps(response).encode("utf8"))
+        except OSError:
+            return False
+        return True
+
+    def _write(self, conn, data):
+        with self._send_lock:
+            conn.sendall(data + b"\n")
+
+    def subscribe(self, conn, request):
+        with self._lock:
+            id = hex(len(self.subscriptions) + 1000)
+            self.subscriptions[id] = (request["params"][0], conn)
+        return dict(jsonrpc="2.0", id=request["id"], result=id)
+
+    def notify(self, kind, result):
+        """ push `result` to all subscriptions for `kind` """
+        with self._lock:
+            targets = [(id, conn) for id, (k, conn)
+                       in self.subscriptions.items() if k == kind]
+        for id, conn in targets:
+            notification = dict(jsonrpc="2.0", method="eth_subscription",
+                                params=dict(subscription=id, result=result))
+            try:
+                self._write(conn, json.dumps(notification).encode("utf8"))
+            except OSError:
+                pass
+
+    def drop_connections(self):
+        """ close all server side connections, as a restarting node
+            would """
+        with self._lock:
+            for conn in self.connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                conn.close()
+            self.connections = []
+
+    def close(self):
+        self._closed = True
+        self.drop_connections()
+        self.sock.close()
+        os.unlink(self.path)
+        os.rmdir(self.dir)
+
+
+class FakeWSServer(FakeIPCServer):
+    """ The same, over websockets on a local tcp port """
+
+    def __init__(self, handler=echo_handler):
+        self.handler = handler
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(64)
+        self.url = "ws://127.0.0.1:{0}/".format(self.sock.getsockname()[1])
+        self.connections = []
+        self.requests = []
+        self.subscriptions = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = False
+
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+
+    def _serve(self, conn):
+        buf = [b""]
+
+        def read(size):
+            while len(buf[0]) < size:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    raise OSError("closed")
+                buf[0] += chunk
+            data, buf[0] = buf[0][:size], buf[0][size:]
+            return data
+
+        try:
+            while b"\r\n\r\n" not in buf[0]:
+                buf[0] += conn.recv(65536)
+            head, buf[0] = buf[0].split(b"\r\n\r\n", 1)
+            key = [line.split(b":", 1)[1].strip()
+                   for line in head.split(b"\r\n")
+                   if line.lower().startswith(b"sec-websocket-key")][0]
+            conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\n"
+                         b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " +
+                         websocket.accept_key(key) + b"\r\n\r\n")
+            while True:
+                fin, opcode, payload = websocket.read_frame(read)
+                if opcode == websocket.CLOSE:
+                    self._send(conn, websocket.CLOSE, payload)
+                    return
+                if opcode == websocket.PING:
+                    self._send(conn, websocket.PONG, payload)
+                    continue
+                if not self._handle(conn, json.loads(payload.decode("utf8"))):
+                    return
+        except (OSError, ValueError):
+            return
+
+    def _send(self, conn, opcode, payload):
+        with self._send_lock:
+            conn.sendall(websocket.frame(opcode, payload, mask=False))
+
+    def _write(self, conn, data):
+        self._send(conn, websocket.TEXT, data)
+
+    def close(self):
+        self._closed = True
+        self.drop_connections()
+        self.sock.close()
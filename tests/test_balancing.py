@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_balancing
+----------------------------------
+
+Tests for `empyrean.balancing` module.
+"""
+
+import time
+import socket
+
+import pytest
+
+from empyrean.api import MultiAPI
+from empyrean.balancing import MultiConnector, make_connector
+from empyrean.connectors import HTTPConnector, IPCConnector
+from empyrean.connectors import WebSocketConnector
+from empyrean.deadlines import deadline, remaining
+from empyrean.exceptions import MethodNotFound
+
+from .dummy import DummyConnector
+
+
+class Node(object):
+
+    def __init__(self, name, head=100, delay=0, down=False):
+        self.name = name
+        self.head = head
+        self.delay = delay
+        self.down = down
+
+    def __call__(self, method, params):
+        if self.down:
+            raise ConnectionError("down")
+        time.sleep(self.delay)
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_unknown":
+            raise MethodNotFound(-32601, "not found")
+        return self.name
+
+
+class DownConnector(DummyConnector):
+    """ fails to send anything, as a node that's gone does """
+
+    def invoke(self, data):
+        raise ConnectionError("down")
+
+    def invoke_batch(self, batch):
+        raise ConnectionError("down")
+
+
+def multi(*nodes, **options):
+    options.setdefault("check_interval", None)
+    connector = MultiConnector([DummyConnector(n) for n in nodes],
+                               **options)
+    return connector
+
+
+def call(connector, method="eth_getBalance", *params):
+    return connector.invoke(dict(jsonrpc="2.0", id=1, method=method,
+                                 params=list(params)))
+
+
+class TestMultiConnector:
+
+    def test_endpoints(self):
+        assert isinstance(make_connector("http://localhost:8545"),
+                          HTTPConnector)
+        assert isinstance(make_connector("ws://localhost:8546"),
+                          WebSocketConnector)
+        assert isinstance(make_connector("/tmp/geth.ipc"), IPCConnector)
+        connector = DummyConnector()
+        assert make_connector(connector) is connector
+        with pytest.raises(ValueError):
+            MultiConnector([])
+
+    def test_prefers_fast(self):
+        connector = multi(Node("slow", delay=0.02), Node("fast"))
+        results = [call(connector) for i in range(10)]
+        assert results.count("fast") >= 8
+
+    def test_in_flight(self):
+        connector = multi(Node("a"), Node("b"))
+        for backend in connector.backends:
+            backend.latency = 0.01
+        connector.backends[0].in_flight = 5
+        assert connector.choose() is connector.backends[1]
+
+    def test_retry_elsewhere(self):
+        connector = multi(Node("down", down=True), Node("up", delay=0.01))
+        connector.backends[0].latency = 0.0001
+        connector.backends[1].latency = 0.01
+        assert call(connector) == "up"
+
+    def test_gives_up(self):
+        connector = multi(Node("a", down=True), Node("b", down=True))
+        with pytest.raises(ConnectionError):
+            call(connector)
+
+    def test_errors_not_retried(self):
+        connector = multi(Node("a"), Node("b"))
+        with pytest.raises(MethodNotFound):
+            call(connector, "eth_unknown")
+        assert sum(len(b.connector.invocations)
+                   for b in connector.backends) == 1
+        assert all(b.in_flight == 0 for b in connector.backends)
+
+    def test_eject(self):
+        node = Node("flaky", down=True)
+        connector = multi(node, Node("ok", delay=0.01), max_failures=2)
+        connector.backends[0].latency = 0.0001
+        connector.backends[1].latency = 0.01
+        call(connector)
+        call(connector)
+        assert not connector.backends[0].healthy(time.monotonic())
+        node.down = False
+        # not tried while ejected
+        assert [call(connector) for i in range(3)] == ["ok"] * 3
+
+    def test_writes_sticky(self):
+        connector = multi(Node("a"), Node("b"))
+        results = set()
+        for i in range(5):
+            results.add(call(connector, "eth_sendTransaction", {}))
+            # make the other one look better
+            connector.backends[0].latency, connector.backends[1].latency = \
+                connector.backends[1].latency, connector.backends[0].latency
+        assert len(results) == 1
+
+    def test_pending_sticky(self):
+        connector = multi(Node("a"), Node("b"))
+        writer = call(connector, "eth_sendTransaction", {})
+        assert call(connector, "eth_getTransactionCount", "0x1",
+                    "pending") == writer
+
+    def test_writes_not_retried(self):
+        connector = multi(Node("a", down=True), Node("b", down=True))
+        with pytest.raises(ConnectionError):
+            call(connector, "eth_sendTransaction", {})
+        assert sum(len(b.connector.invocations)
+                   for b in connector.backends) == 1
+
+    def test_writer_moves_when_ejected(self):
+        connector = multi(Node("a"), Node("b"), max_failures=1)
+        first = call(connector, "eth_sendTransaction", {})
+        down = connector.writer
+        down.connector.handler.down = True
+        with pytest.raises(ConnectionError):
+            call(connector, "eth_sendTransaction", {})
+        assert call(connector, "eth_sendTransaction", {}) != first
+
+    def test_lagging(self):
+        connector = multi(Node("a", head=100), Node("b", head=90),
+                          max_lag=3)
+        connector.check()
+        now = time.monotonic()
+        assert connector.backends[0].healthy(now)
+        assert not connector.backends[1].healthy(now)
+        connector.backends[1].connector.handler.head = 99
+        connector.check()
+        assert connector.backends[1].healthy(time.monotonic())
+
+    def test_check_keeps_failed_out(self):
+        node = Node("flaky", down=True)
+        connector = multi(node, Node("ok"), max_failures=1)
+        connector.backends[0].latency = 0.0001
+        connector.backends[1].latency = 0.01
+        call(connector)
+        node.down = False
+        connector.check()
+        assert not connector.backends[0].healthy(time.monotonic())
+
+    def test_filters_sticky(self):
+        connector = multi(Node("a"), Node("b"))
+        writer = call(connector, "eth_newFilter", {})
+        for i in range(3):
+            connector.backends[0].latency, connector.backends[1].latency = \
+                connector.backends[1].latency, connector.backends[0].latency
+            assert call(connector, "eth_getFilterLogs", "0x1") == writer
+            assert call(connector, "eth_getFilterChanges", "0x1") == writer
+
+    def test_check_unreachable(self):
+        connector = multi(Node("a"), Node("b", down=True))
+        connector.check()
+        assert not connector.backends[1].healthy(time.monotonic())
+
+    def test_batch(self):
+        connector = MultiConnector([DownConnector(), DummyConnector(
+            Node("up"))], check_interval=None)
+        connector.backends[0].latency = 0.0001
+        connector.backends[1].latency = 0.01
+        batch = [dict(jsonrpc="2.0", id=1, method="eth_getBalance",
+                      params=[])]
+        assert connector.invoke_batch(batch) == ["up"]
+
+    def test_timeouts_retried(self):
+        def slow(method, params):
+            raise socket.timeout()
+        connector = MultiConnector([DummyConnector(slow),
+                                    DummyConnector(Node("ok"))],
+                                   check_interval=None)
+        connector.backends[0].latency = 0.0001
+        connector.backends[1].latency = 0.01
+        assert call(connector) == "ok"
+
+    def test_deadline_not_a_failure(self):
+        def slow(method, params):
+            time.sleep(0.002)
+            remaining()
+
+        def timeout(method, params):
+            time.sleep(0.002)
+            raise socket.timeout()
+        connector = MultiConnector([DummyConnector(slow),
+                                    DummyConnector(timeout)],
+                                   check_interval=None, max_failures=2)
+        for i in range(6):
+            with pytest.raises(socket.timeout):
+                with deadline(0.001):
+                    call(connector)
+        now = time.monotonic()
+        for backend in connector.backends:
+            assert backend.healthy(now)
+            assert backend.failures == 0
+            assert backend.in_flight == 0
+
+    def test_api(self):
+        api = MultiAPI([DummyConnector(Node("a")),
+                        DummyConnector(Node("b"))], check_interval=None)
+        assert api.eth("getBalance", "0x1") in ("a", "b")
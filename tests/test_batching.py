@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_batching
+----------------------------------
+
+Tests for `empyrean.batching` module and batch calls on the API.
+"""
+
+import threading
+
+import pytest
+
+from empyrean.batching import MicroBatcher
+from empyrean.exceptions import ServerError, JSONRPCException
+
+from .dummy import DummyAPI, DummyConnector
+
+
+def failing(method, params):
+    if method == "fail":
+        raise ServerError(-32000, "failed")
+    return method
+
+
+class TestCallBatch:
+
+    def test_results_in_order(self):
+        api = DummyAPI(failing)
+        res = api.call_batch([("a", ()), ("b", ())])
+        assert res == ["a", "b"]
+        assert len(api.connector.batches) == 1
+
+    def test_unique_ids(self):
+        api = DummyAPI(failing)
+        api.call_batch([("a", ()), ("b", ())])
+        ids = [d['id'] for d in api.connector.batches[0]]
+        assert len(set(ids)) == 2
+
+    def test_raises(self):
+        api = DummyAPI(failing)
+        with pytest.raises(ServerError):
+            api.call_batch([("a", ()), ("fail", ())])
+
+    def test_empty(self):
+        api = DummyAPI(failing)
+        assert api.call_batch([]) == []
+        assert api.connector.batches == []
+
+
+class TestParseBatch:
+
+    def test_match_by_id(self):
+        connector = DummyConnector()
+        batch = [dict(id=1), dict(id=2)]
+        responses = [dict(id=2, result="two"), dict(id=1, result="one")]
+        assert connector.parse_batch(batch, responses) == ["one", "two"]
+
+    def test_missing(self):
+        connector = DummyConnector()
+        res = connector.parse_batch([dict(id=1)], [])
+        assert isinstance(res[0], JSONRPCException)
+
+    def test_rejected(self):
+        connector = DummyConnector()
+        with pytest.raises(JSONRPCException):
+            connector.parse_batch([dict(id=1)], dict(
+                id=None, error=dict(code=-32600, message="invalid")))
+
+
+class TestMicroBatcher:
+
+    def test_collects(self):
+        connector = DummyConnector(failing)
+        batcher = MicroBatcher(connector, window=0.05)
+        futures = [batcher.submit(dict(id=i, method="m{0}".format(i),
+                                       params=()))
+                   for i in range(5)]
+        assert [f.result(1) for f in futures] == \
+            ["m{0}".format(i) for i in range(5)]
+        assert len(connector.batches) == 1
+        batcher.close()
+
+    def test_max_size(self):
+        connector = DummyConnector(failing)
+        batcher = MicroBatcher(connector, window=10, max_size=2)
+        futures = [batcher.submit(dict(id=i, method="m", params=()))
+                   for i in range(4)]
+        for f in futures:
+            f.result(1)
+        assert [len(b) for b in connector.batches] == [2, 2]
+        batcher.close()
+
+    def test_single(self):
+        connector = DummyConnector(failing)
+        batcher = MicroBatcher(connector, window=0)
+        assert batcher.submit(dict(id=1, method="m", params=())).result(1) \
+            == "m"
+        assert connector.batches == []
+        batcher.close()
+
+    def test_errors_per_call(self):
+        connector = DummyConnector(failing)
+        batcher = MicroBatcher(connector, window=0.05)
+        ok = batcher.submit(dict(id=1, method="m", params=()))
+        bad = batcher.submit(dict(id=2, method="fail", params=()))
+        assert ok.result(1) == "m"
+        with pytest.raises(ServerError):
+            bad.result(1)
+        batcher.close()
+
+    def test_close_flushes(self):
+        connector = DummyConnector(failing)
+        batcher = MicroBatcher(connector, window=10)
+        future = batcher.submit(dict(id=1, method="m", params=()))
+        batcher.close()
+        assert future.result(1) == "m"
+
+
+class TestAPIBatching:
+
+    def test_threads(self):
+        api = DummyAPI(failing, batch_window=0.05)
+        results = {}
+
+        def worker(i):
+            results[i] = api._call("m{0}".format(i))
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == dict((i, "m{0}".format(i)) for i in range(10))
+        assert api.connector.invocations == []
+        assert sum(len(b) for b in api.connector.batches) == 10
+
+    def test_disabled(self):
+        api = DummyAPI(failing)
+        assert api._call("m") == "m"
+        assert len(api.connector.invocations) == 1
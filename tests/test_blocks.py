@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_blocks
+----------------------------------
+
+Tests for `empyrean.blocks` module.
+"""
+
+import pytest
+
+from empyrean.bloom import bloom_mask
+from empyrean.exceptions import MethodNotFound
+
+from .dummy import DummyAPI, echo
+
+ADDRESS = "0x" + "11" * 20
+EMPTY_BLOOM = "0x" + "00" * 256
+
+
+class Chain(object):
+    """ block n has n % 3 transactions. Blocks divisible by 5 have a log
+        of ADDRESS in their bloom """
+
+    def __init__(self, head=100, block_receipts=True):
+        self.head = head
+        self.block_receipts = block_receipts
+
+    def txs(self, number):
+        return ["0x{0}t{1}".format(number, i) for i in range(number % 3)]
+
+    def block(self, number, full):
+        bloom = EMPTY_BLOOM
+        if number % 5 == 0:
+            bloom = "0x" + format(bloom_mask(ADDRESS), "0512x")
+        txs = self.txs(number)
+        if full:
+            txs = [dict(hash=h) for h in txs]
+        return dict(number=hex(number), hash="0xb{0}".format(number),
+                    logsBloom=bloom, transactions=txs)
+
+    def receipt(self, tx_hash):
+        number = int(tx_hash[2:].split("t")[0])
+        return dict(transactionHash=tx_hash,
+                    blockHash="0xb{0}".format(number))
+
+    def __call__(self, method, params):
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            if number > self.head:
+                return None
+            return self.block(number, params[1])
+        if method == "eth_getBlockReceipts":
+            if not self.block_receipts:
+                raise MethodNotFound(-32601, "method not found")
+            number = int(params[0][3:])
+            return [self.receipt(h) for h in self.txs(number)]
+        if method == "eth_getTransactionReceipt":
+            return self.receipt(params[0])
+        raise AssertionError(method)
+
+
+class TestBlockFetcher:
+
+    def test_in_order(self):
+        api = DummyAPI(Chain())
+        res = list(api.eth.fetch_blocks(range(10, 60), receipts=False,
+                                        batch_size=7))
+        assert [int(b["number"], 16) for b in res] == list(range(10, 60))
+
+    def test_receipts(self):
+        api = DummyAPI(Chain())
+        for block, receipts in api.eth.fetch_blocks(range(0, 10)):
+            assert [r["transactionHash"] for r in receipts] == \
+                [tx["hash"] for tx in block["transactions"]]
+
+    def test_batched(self):
+        api = DummyAPI(Chain())
+        list(api.eth.fetch_blocks(range(0, 40), batch_size=20))
+        # blocks and receipts for each batch
+        assert len(api.connector.batches) == 4
+        assert api.connector.invocations == []
+
+    def test_fallback(self):
+        chain = Chain(block_receipts=False)
+        api = DummyAPI(chain)
+        res = list(api.eth.fetch_blocks(range(0, 12), batch_size=6,
+                                        workers=1))
+        assert [len(receipts) for block, receipts in res] == \
+            [n % 3 for n in range(12)]
+        methods = [m for m, p in api.connector.calls]
+        # only asked once, then per transaction
+        assert methods.count("eth_getBlockReceipts") == 6
+        assert "eth_getTransactionReceipt" in methods
+
+    def test_hashes_only(self):
+        api = DummyAPI(Chain(block_receipts=False))
+        res = list(api.eth.fetch_blocks(range(5, 6), full_tx=False))
+        assert res[0][1] == [dict(transactionHash="0x5t0",
+                                  blockHash="0xb5"),
+                             dict(transactionHash="0x5t1",
+                                  blockHash="0xb5")]
+
+    def test_bloom(self):
+        api = DummyAPI(Chain())
+        res = list(api.eth.fetch_blocks(range(0, 30), addresses=ADDRESS))
+        assert [int(b["number"], 16) for b, r in res] == [0, 5, 10, 15,
+                                                          20, 25]
+        fetched = [p[0] for m, p in api.connector.calls
+                   if m == "eth_getBlockReceipts"]
+        assert len(fetched) == 6
+
+    def test_missing_block(self):
+        api = DummyAPI(Chain(head=5))
+        with pytest.raises(LookupError):
+            list(api.eth.fetch_blocks(range(0, 10)))
+
+    def test_other_errors(self):
+        def handler(method, params):
+            if method == "eth_getBlockReceipts":
+                raise ValueError("boom")
+            return Chain()(method, params)
+
+        with pytest.raises(ValueError):
+            list(DummyAPI(handler).eth.fetch_blocks(range(0, 3)))
+
+
+class TestBlockMethods:
+
+    def test_methods(self):
+        api = DummyAPI(echo)
+        assert api.eth.getBlockByNumber(16) == ["eth_getBlockByNumber",
+                                                ["0x10", False]]
+        assert api.eth.getBlockByNumber() == ["eth_getBlockByNumber",
+                                              ["latest", False]]
+        assert api.eth.getBlockByHash("0xab", True) == \
+            ["eth_getBlockByHash", ["0xab", True]]
+        assert api.eth.getBlockReceipts(1) == ["eth_getBlockReceipts",
+                                               ["0x1"]]
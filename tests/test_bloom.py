@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_bloom
+----------------------------------
+
+Tests for `empyrean.bloom` module.
+"""
+
+from empyrean.bloom import Bloom, BloomFilter, bloom_bits, bloom_mask
+
+ADDRESS = "0x" + "11" * 20
+OTHER = "0x" + "22" * 20
+TOPIC = "0x" + "ab" * 32
+
+
+def make_bloom(*values):
+    value = 0
+    for v in values:
+        value |= bloom_mask(v)
+    return "0x" + format(value, "0512x")
+
+
+class TestBloom:
+
+    def test_bits(self):
+        bits = bloom_bits(ADDRESS)
+        assert len(bits) == 3
+        assert all(0 <= b < 2048 for b in bits)
+        assert bloom_bits(ADDRESS) == bloom_bits(bytes.fromhex("11" * 20))
+
+    def test_byte_layout(self):
+        # set the bits the way geth's bloomValues does: bit b lives in
+        # byte 255 - b / 8 of the 256 byte bloom
+        raw = bytearray(256)
+        for bit in bloom_bits(ADDRESS):
+            raw[255 - (bit >> 3)] |= 1 << (bit & 7)
+        bloom = Bloom("0x" + bytes(raw).hex())
+        assert ADDRESS in bloom
+        assert OTHER not in bloom
+
+    def test_contains(self):
+        bloom = Bloom(make_bloom(ADDRESS, TOPIC))
+        assert ADDRESS in bloom
+        assert TOPIC in bloom
+        assert OTHER not in bloom
+
+    def test_empty(self):
+        assert ADDRESS not in Bloom("0x" + "00" * 256)
+
+
+class TestBloomFilter:
+
+    def test_address(self):
+        f = BloomFilter(ADDRESS)
+        assert f.matches(make_bloom(ADDRESS))
+        assert not f.matches(make_bloom(OTHER))
+
+    def test_any_address(self):
+        f = BloomFilter([OTHER, ADDRESS])
+        assert f.matches(make_bloom(ADDRESS))
+
+    def test_topics(self):
+        f = BloomFilter(ADDRESS, [TOPIC])
+        assert f.matches(make_bloom(ADDRESS, TOPIC))
+        assert not f.matches(make_bloom(ADDRESS))
+
+    def test_topic_wildcards(self):
+        f = BloomFilter(None, [None, [OTHER, TOPIC]])
+        assert f.matches(make_bloom(TOPIC))
+        assert not f.matches(make_bloom(ADDRESS))
+
+    def test_nothing(self):
+        assert BloomFilter().matches("0x" + "00" * 256)
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cache
+----------------------------------
+
+Tests for `empyrean.cache` module.
+"""
+
+import os
+import threading
+
+import pytest
+
+from empyrean.cache import LRUCache, request_cacheable, result_cacheable
+from empyrean.cache import is_pinned, BlockCache, SQLiteCache
+from empyrean.exceptions import ServerError
+
+from .dummy import DummyAPI
+
+HASH = "0x" + "ab" * 32
+
+
+def chain(method, params):
+    if method == "eth_getTransactionReceipt":
+        if params[0] == "0xpending":
+            return None
+        return dict(transactionHash=params[0], blockHash=HASH)
+    if method == "eth_getTransactionByHash":
+        return dict(hash=params[0], blockHash=None)
+    if method == "eth_getCode":
+        if params[0] == "0xfail":
+            raise ServerError(-32000, "failed")
+        return "0x6060"
+    return method
+
+
+class TestRules:
+
+    @pytest.mark.parametrize("block,expect", [
+        ("latest", False),
+        ("pending", False),
+        ("0x10", True),
+        (HASH, True),
+        ({"blockHash": HASH}, True),
+        ({"blockNumber": "0x10"}, True),
+        (16, False),
+    ])
+    def test_pinned(self, block, expect):
+        assert is_pinned(block) is expect
+
+    def test_requests(self):
+        assert request_cacheable("eth_getBlockByHash", (HASH, False))
+        assert request_cacheable("eth_getCode", ("0x1", HASH))
+        assert not request_cacheable("eth_getCode", ("0x1", "latest"))
+        assert not request_cacheable("eth_getCode", ("0x1",))
+        assert request_cacheable("eth_call", ({}, "0x10"))
+        assert not request_cacheable("eth_call", ({}, "pending"))
+        assert request_cacheable("eth_getStorageAt", ("0x1", "0x0", "0x1"))
+        assert not request_cacheable("eth_blockNumber", ())
+        assert not request_cacheable("eth_sendTransaction", ({},))
+
+    def test_results(self):
+        assert not result_cacheable("eth_getCode", None)
+        assert result_cacheable("eth_getCode", "0x")
+        assert result_cacheable("eth_getTransactionReceipt",
+                                dict(blockHash=HASH))
+        assert not result_cacheable("eth_getTransactionReceipt",
+                                    dict(blockHash=None))
+
+
+class TestLRUCache:
+
+    def test_get_set(self):
+        cache = LRUCache()
+        assert cache.get(b"a") is None
+        cache.set(b"a", [1, 2])
+        assert cache.get(b"a") == [1, 2]
+        assert cache.stats() == dict(entries=1, bytes=6, hits=1, misses=1,
+                                     evictions=0)
+
+    def test_max_entries(self):
+        cache = LRUCache(max_entries=2)
+        cache.set(b"a", 1)
+        cache.set(b"b", 2)
+        cache.get(b"a")
+        cache.set(b"c", 3)
+        assert cache.get(b"b") is None
+        assert cache.get(b"a") == 1
+        assert cache.evictions == 1
+
+    def test_max_bytes(self):
+        cache = LRUCache(max_bytes=20)
+        cache.set(b"a", "x" * 8)
+        cache.set(b"b", "y" * 8)
+        assert len(cache) == 1
+        assert cache.size == 11
+        cache.set(b"c", "z" * 100)
+        assert cache.get(b"c") is None
+        assert cache.get(b"b") == "y" * 8
+
+    def test_copies(self):
+        cache = LRUCache()
+        cache.set(b"a", dict(hash="0x1", logs=[]))
+        cache.get(b"a")["logs"].append("changed")
+        assert cache.get(b"a") == dict(hash="0x1", logs=[])
+
+    def test_replace(self):
+        cache = LRUCache()
+        cache.set(b"a", "xx")
+        cache.set(b"a", "x")
+        assert cache.size == 4
+        assert len(cache) == 1
+
+
+class TestAPICache:
+
+    def api(self):
+        return DummyAPI(chain, cache=LRUCache())
+
+    def test_mined_receipt(self):
+        api = self.api()
+        for i in range(3):
+            assert api.eth.getTransactionReceipt("0x1")["blockHash"] == HASH
+        assert len(api.connector.calls) == 1
+
+    def test_pending_receipt(self):
+        api = self.api()
+        assert api.eth.getTransactionReceipt("0xpending") is None
+        assert api.eth.getTransactionReceipt("0xpending") is None
+        assert len(api.connector.calls) == 2
+
+    def test_unmined_transaction(self):
+        api = self.api()
+        api._call("eth_getTransactionByHash", "0x1")
+        api._call("eth_getTransactionByHash", "0x1")
+        assert len(api.connector.calls) == 2
+
+    def test_pinned_code(self):
+        api = self.api()
+        api.eth.getCode("0x1", HASH)
+        api.eth.getCode("0x1", HASH)
+        api.eth.getCode("0x2", HASH)
+        assert len(api.connector.calls) == 2
+
+    def test_latest_code(self):
+        api = self.api()
+        api.eth.getCode("0x1")
+        api.eth.getCode("0x1")
+        assert len(api.connector.calls) == 2
+
+    def test_errors(self):
+        api = self.api()
+        for i in range(2):
+            with pytest.raises(ServerError):
+                api.eth.getCode("0xfail", HASH)
+        assert len(api.connector.calls) == 2
+
+    def test_pinned_call(self):
+        api = self.api()
+        api.eth.call("0x1", to="0x2", data="0x", qty_or_tag=16)
+        api.eth.call("0x1", to="0x2", data="0x", qty_or_tag=16)
+        assert api.connector.calls == [
+            ("eth_call", [{"from": "0x1", "to": "0x2", "data": "0x"},
+                          "0x10"])]
+
+
+class Chain(object):
+    """ a node whose state changes with every block """
+
+    def __init__(self):
+        self.number = 1
+
+    def __call__(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.number)
+        return "{0}@{1}".format(method, self.number)
+
+
+class TestBlockCache:
+
+    def test_new_head(self):
+        cache = BlockCache()
+        cache.new_head(1)
+        cache.set(b"a", 1, cache.head)
+        assert cache.get(b"a") == 1
+        cache.new_head(1)
+        assert cache.get(b"a") == 1
+        cache.new_head(0)
+        assert cache.get(b"a") == 1
+        cache.new_head(2)
+        assert cache.get(b"a") is None
+        assert cache.stats()["invalidations"] == 2
+
+    def test_same_height_reorg(self):
+        cache = BlockCache()
+        cache.new_head(1, "0xa")
+        cache.set(b"a", 1, cache.head)
+        cache.new_head(1, "0xb")
+        assert cache.get(b"a") is None
+
+    def test_stale_set(self):
+        cache = BlockCache()
+        cache.new_head(1)
+        head = cache.head
+        cache.new_head(2)
+        cache.set(b"a", 1, head)
+        assert cache.get(b"a") is None
+
+    def test_copies(self):
+        cache = BlockCache()
+        cache.set(b"a", dict(hash="0x1", logs=[]), cache.head)
+        cache.get(b"a")["logs"].append("changed")
+        assert cache.get(b"a") == dict(hash="0x1", logs=[])
+
+    def test_max_age(self):
+        cache = BlockCache(max_age=0)
+        cache.set(b"a", 1, cache.head)
+        assert cache.get(b"a") is None
+
+
+class TestAPIBlockCache:
+
+    def test_latest(self):
+        chain = Chain()
+        api = DummyAPI(chain, block_cache=BlockCache(max_age=60))
+        assert api.eth.gasPrice() == "eth_gasPrice@1"
+        api.eth.getCode("0x1")
+        api.eth.gasPrice()
+        api.eth.getCode("0x1")
+        assert len(api.connector.calls) == 2
+
+        chain.number = 2
+        assert api.eth.gasPrice() == "eth_gasPrice@1"
+        api._call("eth_blockNumber")
+        assert api.eth.gasPrice() == "eth_gasPrice@2"
+
+    def test_pending(self):
+        api = DummyAPI(Chain(), block_cache=BlockCache(max_age=60))
+        api.eth.getCode("0x1", "pending")
+        api.eth.getCode("0x1", "pending")
+        assert len(api.connector.calls) == 2
+
+
+class TestSQLiteCache:
+
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join("cache.db"))
+
+    def test_get_set(self, path):
+        cache = SQLiteCache(path)
+        assert cache.get(b"a") is None
+        cache.set(b"a", {"blockHash": HASH})
+        assert cache.get(b"a") == {"blockHash": HASH}
+        stats = cache.stats()
+        assert stats["entries"] == 1
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_shared(self, path):
+        SQLiteCache(path).set(b"a", [1])
+        assert SQLiteCache(path).get(b"a") == [1]
+
+    def test_replace(self, path):
+        cache = SQLiteCache(path)
+        cache.set(b"a", "xx")
+        cache.set(b"a", "x")
+        assert cache.stats()["bytes"] == 4
+        assert len(cache) == 1
+
+    def test_evict(self, path):
+        cache = SQLiteCache(path, max_bytes=120, touch_interval=0)
+        for i in range(10):
+            cache.set(str(i).encode("ascii"), "x" * 8)
+        cache.get(b"0")
+        cache.set(b"a", "x" * 8)
+        assert cache.get(b"0") == "x" * 8
+        assert cache.get(b"1") is None
+        assert cache.stats()["bytes"] == 99
+        assert cache.evictions == 2
+
+    def test_threads(self, path):
+        cache = SQLiteCache(path)
+        cache.set(b"a", 1)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.get(b"a"))) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [1] * 4
+
+    def test_processes(self, path):
+        cache = SQLiteCache(path)
+        cache.get(b"a")
+        pid = os.fork()
+        if pid == 0:
+            try:
+                cache.set(b"a", "child")
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        assert cache.get(b"a") == "child"
+
+    def test_api(self, path):
+        api = DummyAPI(chain, cache=SQLiteCache(path))
+        api.eth.getTransactionReceipt("0x1")
+        other = DummyAPI(chain, cache=SQLiteCache(path))
+        assert other.eth.getTransactionReceipt("0x1")["blockHash"] == HASH
+        assert other.connector.calls == []
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_codecs
+----------------------------------
+
+Tests for `empyrean.codecs` module.
+"""
+
+import pytest
+
+from empyrean.codecs import JSONCodec, available_codecs, default_codec
+from empyrean.connectors import IPCConnector
+
+from .servers import FakeIPCServer
+
+
+@pytest.fixture(params=available_codecs(), ids=lambda c: c.name)
+def codec(request):
+    return request.param
+
+
+class TestCodecs:
+
+    def test_roundtrip(self, codec):
+        data = dict(jsonrpc="2.0", method="eth_call",
+                    params=[{"to": "0x00"}, "latest"], id=1)
+        encoded = codec.dumps(data)
+        assert isinstance(encoded, bytes)
+        assert codec.loads(encoded) == data
+
+    def test_tuple_params(self, codec):
+        assert codec.loads(codec.dumps(dict(params=(1, "a")))) == \
+            dict(params=[1, "a"])
+
+    def test_unicode(self, codec):
+        assert codec.loads(codec.dumps(["€"])) == ["€"]
+
+    def test_big_int(self, codec):
+        assert JSONCodec().loads(codec.dumps([2 ** 70])) == [2 ** 70]
+
+    def test_invalid(self, codec):
+        with pytest.raises(ValueError):
+            codec.loads(b'{"a": ')
+
+    def test_default(self):
+        assert default_codec().name == available_codecs()[-1].name
+
+
+class TestConnectorCodec:
+
+    def test_ipc(self, codec):
+        server = FakeIPCServer()
+        try:
+            connector = IPCConnector(server.path, codec=codec)
+            assert connector.codec is codec
+            assert connector.invoke(dict(jsonrpc="2.0", method="m",
+                                         params=["€"], id=1)) == \
+                ["m", ["€"]]
+        finally:
+            server.close()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_connectors
+----------------------------------
+
+Tests for `empyrean.connectors` module.
+"""
+
+import json
+import time
+import threading
+
+import pytest
+
+from empyrean.connectors import IPCConnector, IPCConnectionPool
+from empyrean.exceptions import MethodNotFound
+
+from .servers import FakeIPCServer
+
+
+@pytest.fixture
+def server(request):
+    server = FakeIPCServer()
+    request.addfinalizer(server.close)
+    return server
+
+
+class TestIPCConnectionPool:
+
+    def test_lazy(self, server):
+        pool = IPCConnectionPool(server.path, size=4)
+        assert pool._opened == 0
+        assert server.connections == []
+
+    def test_reuse(self, server):
+        pool = IPCConnectionPool(server.path, size=4)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        assert pool.checkout() is conn
+
+    def test_limit(self, server):
+        pool = IPCConnectionPool(server.path, size=2)
+        first = pool.checkout()
+        pool.checkout()
+        got = []
+
+        thread = threading.Thread(target=lambda: got.append(pool.checkout()))
+        thread.start()
+        thread.join(0.1)
+        assert got == []
+
+        pool.checkin(first)
+        thread.join(1)
+        assert got == [first]
+
+    def test_broken_is_replaced(self, server):
+        pool = IPCConnectionPool(server.path, size=1)
+        conn = pool.checkout()
+        pool.checkin(conn, broken=True)
+        assert pool._opened == 0
+        assert pool.checkout() is not conn
+
+    def test_shrink_idle(self, server):
+        pool = IPCConnectionPool(server.path, size=2, idle_timeout=0.01)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        time.sleep(0.02)
+        assert pool.checkout() is not conn
+        assert pool._opened == 1
+
+    def test_reconnect_after_peer_close(self, server):
+        pool = IPCConnectionPool(server.path, size=1)
+        assert pool.request(b'{"id": 1, "method": "a", "params": []}',
+                            json.loads)
+        server.drop_connections()
+        time.sleep(0.05)
+        res = pool.request(b'{"id": 2, "method": "b", "params": []}',
+                           json.loads)
+        assert res["result"] == ["b", []]
+
+
+class TestIPCConnector:
+
+    def test_invoke(self, server):
+        connector = IPCConnector(server.path)
+        res = connector.invoke(dict(jsonrpc="2.0", method="eth_gasPrice",
+                                    params=[], id=1))
+        assert res == ["eth_gasPrice", []]
+
+    def test_large_response(self):
+        def handler(request):
+            return dict(jsonrpc="2.0", id=request["id"],
+                        result=["0x" + "ab" * 64] * 40000)
+        server = FakeIPCServer(handler)
+        try:
+            connector = IPCConnector(server.path)
+            began = time.monotonic()
+            res = connector.invoke(dict(jsonrpc="2.0", method="eth_getLogs",
+                                        params=[], id=1))
+            assert len(res) == 40000
+            # about 5MB, read in linear time
+            assert time.monotonic() - began < 1
+        finally:
+            server.close()
+
+    def test_error(self):
+        def handler(request):
+            return dict(jsonrpc="2.0", id=request["id"],
+                        error=dict(code=-32601, message="no such method"))
+        server = FakeIPCServer(handler)
+        try:
+            connector = IPCConnector(server.path)
+            with pytest.raises(MethodNotFound):
+                connector.invoke(dict(jsonrpc="2.0", method="x",
+                                      params=[], id=1))
+        finally:
+            server.close()
+
+    def test_threads(self, server):
+        connector = IPCConnector(server.path, pool_size=4)
+        results = {}
+
+        def worker(i):
+            results[i] = connector.invoke(dict(jsonrpc="2.0", method="m",
+                                               params=[i], id=i))
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(32)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == dict((i, ["m", [i]]) for i in range(32))
+        assert connector.pool._opened <= 4
+
+    def test_invoke_batch(self, server):
+        connector = IPCConnector(server.path)
+        res = connector.invoke_batch([
+            dict(jsonrpc="2.0", method="a", params=[], id=1),
+            dict(jsonrpc="2.0", method="b", params=[1], id=2)])
+        assert res == [["a", []], ["b", [1]]]
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_deadlines
+----------------------------------
+
+Tests for `empyrean.deadlines` module.
+"""
+
+import time
+import socket
+import threading
+import http.server
+
+import pytest
+
+from empyrean import deadlines
+from empyrean.balancing import MultiConnector
+from empyrean.batching import MicroBatcher
+from empyrean.connectors import IPCConnector, IPCConnectionPool, \
+    HTTPConnector
+from empyrean.deadlines import deadline, remaining, DeadlineExceeded
+
+from .dummy import DummyConnector, echo
+from .servers import FakeIPCServer, echo_handler
+
+
+def call(connector, method="eth_getBalance"):
+    return connector.invoke(dict(jsonrpc="2.0", id=1, method=method,
+                                 params=[]))
+
+
+class TestDeadlines:
+
+    def test_none(self):
+        assert deadlines.current() is None
+        assert remaining() is None
+        assert remaining(5) == 5
+        assert not deadlines.expired()
+
+    def test_remaining(self):
+        with deadline(10):
+            assert 9 < remaining() <= 10
+            assert remaining(2) == 2
+        assert deadlines.current() is None
+
+    def test_earliest_wins(self):
+        with deadline(1) as outer:
+            with deadline(10) as inner:
+                assert inner == outer
+            with deadline(0.5) as inner:
+                assert inner < outer
+            assert deadlines.current() == outer
+
+    def test_expired(self):
+        with deadline(0.01):
+            time.sleep(0.02)
+            assert deadlines.expired()
+            with pytest.raises(DeadlineExceeded):
+                remaining()
+
+    def test_per_thread(self):
+        seen = []
+        with deadline(1):
+            thread = threading.Thread(
+                target=lambda: seen.append(deadlines.current()))
+            thread.start()
+            thread.join()
+        assert seen == [None]
+
+    def test_is_timeout(self):
+        assert issubclass(DeadlineExceeded, socket.timeout)
+
+
+class TestConnectorDeadlines:
+
+    def test_ipc(self):
+        def handler(request):
+            if request["method"] == "eth_slow":
+                return None
+            return echo_handler(request)
+        server = FakeIPCServer(handler)
+        try:
+            connector = IPCConnector(server.path, timeout=5)
+            began = time.monotonic()
+            with pytest.raises(socket.timeout):
+                with deadline(0.1):
+                    call(connector, "eth_slow")
+            assert time.monotonic() - began < 1
+            # the connection is back at its own timeout afterwards
+            assert call(connector) == ["eth_getBalance", []]
+        finally:
+            server.close()
+
+    def test_ipc_trickle(self):
+        # a response that keeps coming, just too slowly
+        class Trickle(FakeIPCServer):
+            def _write(self, conn, data):
+                for i in range(len(data)):
+                    conn.sendall(data[i:i + 1])
+                    time.sleep(0.02)
+        server = Trickle()
+        try:
+            connector = IPCConnector(server.path, timeout=5)
+            began = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                with deadline(0.2):
+                    call(connector)
+            assert time.monotonic() - began < 0.5
+        finally:
+            server.close()
+
+    def test_http_trickle(self):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = b'{"jsonrpc": "2.0", "id": 1, "result": "0x1"}'
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    for i in range(len(body)):
+                        self.wfile.write(body[i:i + 1])
+                        self.wfile.flush()
+                        time.sleep(0.02)
+                except OSError:
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connector = HTTPConnector("http://127.0.0.1:{0}/".format(
+                server.server_address[1]), timeout=5)
+            assert call(connector) == "0x1"
+            began = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                with deadline(0.2):
+                    call(connector)
+            assert time.monotonic() - began < 0.5
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_ipc_pool_wait(self):
+        server = FakeIPCServer()
+        try:
+            pool = IPCConnectionPool(server.path, size=1)
+            conn = pool.checkout()
+            with pytest.raises(DeadlineExceeded):
+                with deadline(0.05):
+                    pool.checkout()
+            pool.checkin(conn)
+        finally:
+            server.close()
+
+    def test_no_retries_past_deadline(self):
+        def slow(method, params):
+            time.sleep(0.03)
+            raise socket.timeout()
+        connector = MultiConnector([DummyConnector(slow),
+                                    DummyConnector(slow),
+                                    DummyConnector(echo)],
+                                   check_interval=None, retries=5)
+        for i, backend in enumerate(connector.backends):
+            backend.latency = 0.001 * (i + 1)
+        with pytest.raises(socket.timeout):
+            with deadline(0.02):
+                call(connector)
+        assert len(connector.backends[1].connector.invocations) == 0
+
+    def test_batcher(self):
+        seen = []
+
+        def handler(method, params):
+            seen.append(deadlines.current())
+            return method
+        batcher = MicroBatcher(DummyConnector(handler), window=0.01)
+        with deadline(5) as at:
+            assert batcher.submit(dict(jsonrpc="2.0", id=1,
+                                       method="eth_a",
+                                       params=[])).result() == "eth_a"
+        assert seen == [at]
+        batcher.close()
+
+    def test_batcher_keeps_deadlines_apart(self):
+        def handler(method, params):
+            time.sleep(0.1)
+            remaining()
+            return method
+        dummy = DummyConnector(handler)
+        batcher = MicroBatcher(dummy, window=0.05)
+        request = dict(jsonrpc="2.0", id=1, method="eth_a", params=[])
+        with deadline(0.05):
+            tight = batcher.submit(request)
+        loose = [batcher.submit(dict(request, id=i)) for i in (2, 3)]
+        assert [f.result() for f in loose] == ["eth_a"] * 2
+        with pytest.raises(DeadlineExceeded):
+            tight.result()
+        # the two without a deadline still went together
+        assert [len(b) for b in dummy.batches] == [2]
+        batcher.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fanout
+----------------------------------
+
+Tests for `empyrean.fanout` module.
+"""
+
+import pytest
+
+from empyrean.abi import build_payload
+from empyrean.exceptions import ServerError
+
+from .dummy import DummyAPI
+
+OWNER = "0x" + "ab" * 20
+
+
+def address(i):
+    return "0x{0:040x}".format(i)
+
+
+class Node(object):
+
+    head = 100
+
+    def __call__(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method in ("eth_getBalance", "eth_getTransactionCount"):
+            return hex(int(params[0], 16) * 10)
+        if method == "eth_getCode":
+            return "0x60"
+        if method == "eth_call":
+            target = int(params[0]["to"], 16)
+            if target == 13:
+                raise ServerError(-32000, "execution reverted")
+            assert params[0]["data"] == "0x" + build_payload(
+                "balanceOf(address)", OWNER).decode("ascii")
+            return "0x{0:064x}{1:064x}".format(target, target + 1)
+        raise AssertionError(method)
+
+
+class TestGetMany:
+
+    def test_balances(self):
+        api = DummyAPI(Node())
+        addresses = [address(i) for i in range(250)]
+        assert api.eth.get_many("balance", addresses, block=50,
+                                batch_size=100) == \
+            [i * 10 for i in range(250)]
+        assert len(api.connector.batches) == 3
+
+    def test_pinned(self):
+        node = Node()
+        api = DummyAPI(node)
+        api.eth.get_many("nonce", [address(i) for i in range(30)],
+                         batch_size=10)
+        blocks = set(p[1] for m, p in api.connector.calls
+                     if m == "eth_getTransactionCount")
+        assert blocks == {"0x64"}
+
+    def test_code(self):
+        api = DummyAPI(Node())
+        assert api.eth.get_many("code", [address(1)], block="0x10") == \
+            ["0x60"]
+
+    def test_unknown_kind(self):
+        with pytest.raises(ValueError):
+            DummyAPI(Node()).eth.get_many("storage", [address(1)])
+
+
+class TestContractFanout:
+
+    def test_decoded(self):
+        api = DummyAPI(Node())
+        targets = [address(i) for i in range(1, 5)]
+        assert api.eth.contract_fanout(
+            "balanceOf(address)", targets, [OWNER],
+            returns=["uint256", "uint256"], block=7) == \
+            [[i, i + 1] for i in range(1, 5)]
+
+    def test_single_unwrapped(self):
+        api = DummyAPI(Node())
+        assert api.eth.contract_fanout(
+            "balanceOf(address)", [address(2)], [OWNER],
+            returns=["uint256"], block=7) == [2]
+
+    def test_raw(self):
+        api = DummyAPI(Node())
+        res = api.eth.contract_fanout("balanceOf(address)", [address(2)],
+                                      [OWNER], block=7)
+        assert res[0].startswith("0x")
+
+    def test_errors(self):
+        api = DummyAPI(Node())
+        targets = [address(12), address(13)]
+        with pytest.raises(ServerError):
+            api.eth.contract_fanout("balanceOf(address)", targets, [OWNER],
+                                    returns=["uint256"], block=7)
+        res = api.eth.contract_fanout("balanceOf(address)", targets,
+                                      [OWNER], returns=["uint256"], block=7,
+                                      return_exceptions=True)
+        assert res[0] == 12
+        assert isinstance(res[1], ServerError)
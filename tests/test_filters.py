@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_filters
+----------------------------------
+
+Tests for `empyrean.filters` module.
+"""
+
+import threading
+
+import pytest
+
+from empyrean.exceptions import ServerError
+from empyrean.filters import FilterPoller
+
+from .dummy import DummyAPI
+
+
+class Node(object):
+    """ a node with filters. Every mine() adds a block with one log and
+        one pending transaction """
+
+    def __init__(self):
+        self.head = 0
+        self.filters = {}
+        self.ids = 0
+
+    def block(self, number):
+        return dict(number=hex(number), hash="0xb{0}".format(number))
+
+    def log(self, number):
+        return dict(blockNumber=hex(number), logIndex="0x0",
+                    blockHash="0xb{0}".format(number))
+
+    def mine(self):
+        self.head += 1
+        for f in self.filters.values():
+            if f["kind"] == "logs":
+                f["changes"].append(self.log(self.head))
+            elif f["kind"] == "blocks":
+                f["changes"].append("0xb{0}".format(self.head))
+            else:
+                f["changes"].append("0xt{0}".format(self.head))
+
+    def expire(self):
+        self.filters = {}
+
+    def install(self, kind):
+        self.ids += 1
+        self.filters[hex(self.ids)] = dict(kind=kind, changes=[])
+        return hex(self.ids)
+
+    def __call__(self, method, params):
+        if method == "eth_newFilter":
+            return self.install("logs")
+        if method == "eth_newBlockFilter":
+            return self.install("blocks")
+        if method == "eth_newPendingTransactionFilter":
+            return self.install("pending")
+        if method == "eth_getFilterChanges":
+            if params[0] not in self.filters:
+                raise ServerError(-32000, "filter not found")
+            changes = self.filters[params[0]]["changes"]
+            self.filters[params[0]]["changes"] = []
+            return changes
+        if method == "eth_uninstallFilter":
+            return self.filters.pop(params[0], None) is not None
+        if method == "eth_getBlockByHash":
+            return self.block(int(params[0][3:]))
+        if method == "eth_getBlockByNumber":
+            return self.block(int(params[0], 16))
+        if method == "eth_getTransactionByHash":
+            return dict(hash=params[0])
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getLogs":
+            start = int(params[0]["fromBlock"], 16)
+            return [self.log(n) for n in range(start, self.head + 1)]
+        raise AssertionError(method)
+
+
+class TestFilterPoller:
+
+    def test_blocks(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node))
+        assert poller.poll() == []
+        node.mine()
+        node.mine()
+        assert [b["number"] for b in poller.poll()] == ["0x1", "0x2"]
+        assert poller.poll() == []
+
+    def test_hashes_only(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node), fetch_bodies=False)
+        poller.poll()
+        node.mine()
+        assert poller.poll() == ["0xb1"]
+
+    def test_pending(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node), "pending")
+        poller.poll()
+        node.mine()
+        assert poller.poll() == [dict(hash="0xt1")]
+
+    def test_bodies_batched(self):
+        node = Node()
+        api = DummyAPI(node)
+        poller = FilterPoller(api)
+        poller.poll()
+        for i in range(5):
+            node.mine()
+        poller.poll()
+        assert len(api.connector.batches) == 1
+
+    def test_reinstall_blocks(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node))
+        poller.poll()
+        node.mine()
+        poller.poll()
+        node.mine()
+        node.mine()
+        node.expire()
+        assert [b["number"] for b in poller.poll()] == ["0x2", "0x3"]
+        assert poller.reinstalls == 1
+        node.mine()
+        assert [b["number"] for b in poller.poll()] == ["0x4"]
+
+    def test_reinstall_logs(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node), "logs", {"address": "0x1"})
+        poller.poll()
+        node.mine()
+        assert len(poller.poll()) == 1
+        node.mine()
+        node.expire()
+        assert [log["blockNumber"] for log in poller.poll()] == ["0x2"]
+
+    def test_reorged_logs(self):
+        node = Node()
+        poller = FilterPoller(DummyAPI(node), "logs", {"address": "0x1"})
+        poller.poll()
+        node.mine()
+        assert len(poller.poll()) == 1
+        changes = node.filters[poller.filter_id]["changes"]
+        changes.append(dict(node.log(1), removed=True))
+        changes.append(dict(node.log(1), blockHash="0xc1"))
+        logs = poller.poll()
+        assert [(log.get("removed", False), log["blockHash"])
+                for log in logs] == [(True, "0xb1"), (False, "0xc1")]
+        assert poller.last_log == (1, 0)
+        # refetched after an expiry, what's been seen isn't repeated
+        node.mine()
+        node.expire()
+        assert [log["blockNumber"] for log in poller.poll()] == ["0x2"]
+
+    def test_other_errors(self):
+        def handler(method, params):
+            if method == "eth_getFilterChanges":
+                raise ServerError(-32000, "boom")
+            return "0x1"
+        poller = FilterPoller(DummyAPI(handler))
+        with pytest.raises(ServerError):
+            poller.poll()
+
+    def test_unknown_kind(self):
+        with pytest.raises(ValueError):
+            FilterPoller(DummyAPI(Node()), "uncles")
+
+    def test_interval(self):
+        poller = FilterPoller(DummyAPI(Node()), min_interval=1,
+                              max_interval=10, block_time=12)
+        assert poller.interval == 3
+        poller.block_time = 0.1
+        assert poller.interval == 1
+
+    def test_run(self):
+        node = Node()
+        seen = []
+        poller = FilterPoller(DummyAPI(node), callback=seen.extend,
+                              min_interval=0.01, block_time=0.01)
+        thread = threading.Thread(target=poller.run)
+        thread.start()
+        while poller.filter_id is None:
+            threading.Event().wait(0.001)
+        node.mine()
+        while not seen:
+            threading.Event().wait(0.001)
+        poller.stop()
+        thread.join()
+        assert seen[0]["number"] == "0x1"
+        assert node.filters == {}
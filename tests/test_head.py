@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_head
+----------------------------------
+
+Tests for `empyrean.head` module.
+"""
+
+import threading
+
+from empyrean.api import IPCAPI
+from empyrean.cache import BlockCache
+from empyrean.head import HeadTracker
+
+from .dummy import DummyAPI, wait_for
+from .servers import FakeIPCServer
+
+
+class Chain(object):
+
+    def __init__(self, head=10):
+        self.head = head
+
+    def block(self, number):
+        return dict(number=hex(number), hash="0xb{0}".format(number),
+                    timestamp=hex(1000 + number * 12))
+
+    def __call__(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            return self.block(int(params[0], 16))
+        raise AssertionError(method)
+
+    def handler(self, request):
+        return dict(jsonrpc="2.0", id=request["id"],
+                    result=self(request["method"], request["params"]))
+
+
+class TestHeadTracker:
+
+    def test_poll(self):
+        chain = Chain()
+        tracker = HeadTracker(DummyAPI(chain))
+        assert tracker.head is None
+        assert tracker.poll()
+        assert tracker.head == (10, "0xb10", 1120)
+        assert tracker.number == 10
+        assert tracker.hash == "0xb10"
+        assert tracker.timestamp == 1120
+
+    def test_poll_unchanged(self):
+        chain = Chain()
+        api = DummyAPI(chain)
+        tracker = HeadTracker(api)
+        tracker.poll()
+        assert not tracker.poll()
+        # only the block number for an unchanged head
+        assert [m for m, p in api.connector.calls] == \
+            ["eth_blockNumber", "eth_getBlockByNumber", "eth_blockNumber"]
+
+    def test_lower_ignored(self):
+        tracker = HeadTracker(DummyAPI(Chain()))
+        tracker.update(10, "0xa")
+        assert not tracker.update(9, "0xb")
+        assert not tracker.update(10, "0xa")
+        assert tracker.number == 10
+
+    def test_reorg(self):
+        tracker = HeadTracker(DummyAPI(Chain()))
+        tracker.update(10, "0xa")
+        assert tracker.update(10, "0xb")
+        assert tracker.hash == "0xb"
+
+    def test_invalidates_caches(self):
+        api = DummyAPI(Chain(), block_cache=BlockCache())
+        tracker = HeadTracker(api)
+        tracker.update(10, "0xa")
+        assert api.block_cache.head == (10, "0xa")
+
+    def test_callbacks(self):
+        tracker = HeadTracker(DummyAPI(Chain()))
+        seen = []
+
+        def broken(head):
+            raise ValueError()
+
+        tracker.add_callback(broken)
+        tracker.add_callback(seen.append)
+        tracker.update(1, "0x1", 5)
+        assert seen == [(1, "0x1", 5)]
+        assert tracker.callback_errors == 1
+        tracker.remove_callback(seen.append)
+        tracker.update(2)
+        assert len(seen) == 1
+
+    def test_wait(self):
+        tracker = HeadTracker(DummyAPI(Chain()))
+        tracker.update(5)
+        assert tracker.wait(after=4).number == 5
+        assert tracker.wait(after=5, timeout=0.01) is None
+
+        thread = threading.Timer(0.01, tracker.update, (6,))
+        thread.start()
+        assert tracker.wait(after=5, timeout=2).number == 6
+
+    def test_interval(self):
+        tracker = HeadTracker(DummyAPI(Chain()), min_interval=1,
+                              max_interval=10, block_time=12)
+        assert tracker.interval == 3
+
+    def test_polling_fallback(self):
+        chain = Chain()
+        api = DummyAPI(chain)
+        tracker = HeadTracker(api, min_interval=0.001, block_time=0.001)
+        tracker.start()
+        try:
+            wait_for(lambda: tracker.number == 10)
+            assert not tracker.subscribe
+            chain.head = 11
+            wait_for(lambda: tracker.number == 11)
+        finally:
+            tracker.stop()
+
+
+class TestTrackHead:
+
+    def test_block_number_without_io(self):
+        api = DummyAPI(Chain())
+        tracker = api.track_head(min_interval=0.001, block_time=0.001)
+        try:
+            wait_for(lambda: tracker.number is not None)
+            calls = len(api.connector.calls)
+            assert api.eth("blockNumber") == "0xa"
+            assert len(api.connector.calls) == calls
+        finally:
+            tracker.stop()
+        assert api.track_head() is tracker
+
+    def test_subscription(self):
+        chain = Chain()
+        server = FakeIPCServer(chain.handler)
+        api = IPCAPI(server.path)
+        tracker = api.track_head(min_interval=0.001, block_time=0.001)
+        try:
+            wait_for(lambda: tracker.subscribed and tracker.number == 10)
+            server.notify("newHeads", chain.block(11))
+            wait_for(lambda: tracker.number == 11)
+            assert tracker.hash == "0xb11"
+            # heads are pushed, no polling while subscribed
+            assert len([r for r in server.requests
+                        if r["method"] == "eth_blockNumber"]) == 1
+        finally:
+            tracker.stop()
+            server.close()
+
+    def test_resubscribe(self):
+        chain = Chain()
+        server = FakeIPCServer(chain.handler)
+        api = IPCAPI(server.path)
+        tracker = api.track_head(min_interval=0.001, block_time=0.001,
+                                 retry_subscribe=0.01)
+        try:
+            wait_for(lambda: tracker.subscribed)
+            server.drop_connections()
+            chain.head = 12
+            wait_for(lambda: tracker.number == 12)
+            wait_for(lambda: tracker.subscribed and
+                     len(server.subscriptions) == 2)
+        finally:
+            tracker.stop()
+            server.close()
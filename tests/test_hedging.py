@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_hedging
+----------------------------------
+
+Tests for `empyrean.hedging` module.
+"""
+
+import time
+import threading
+
+from empyrean.hedging import HedgedConnector, LatencyTracker
+
+from .dummy import DummyAPI, DummyConnector, echo
+
+
+class Stall(object):
+    """ answers after `delay`, except that the calls in `slow` take
+        `slow_delay` """
+
+    def __init__(self, delay=0.001, slow=(), slow_delay=1):
+        self.delay = delay
+        self.slow = set(slow)
+        self.slow_delay = slow_delay
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, method, params):
+        with self._lock:
+            self.count += 1
+            n = self.count
+        time.sleep(self.slow_delay if n in self.slow else self.delay)
+        return n
+
+
+def call(connector, method="eth_getBalance"):
+    return connector.invoke(dict(jsonrpc="2.0", id=1, method=method,
+                                 params=[]))
+
+
+def warm(connector, n=20):
+    for i in range(n):
+        call(connector)
+
+
+class TestLatencyTracker:
+
+    def test_quantile(self):
+        tracker = LatencyTracker()
+        assert tracker.quantile(0.95) is None
+        for i in range(100):
+            tracker.add(i / 100)
+        assert tracker.quantile(0.95) == 0.95
+        assert tracker.quantile(0.5) == 0.5
+
+    def test_window(self):
+        tracker = LatencyTracker(window=10)
+        for i in range(100):
+            tracker.add(i)
+        assert len(tracker) == 10
+        assert tracker.quantile(0) == 90
+
+
+class TestHedgedConnector:
+
+    def test_hedges_slow_read(self):
+        stall = Stall(slow=[21])
+        connector = HedgedConnector(DummyConnector(stall))
+        warm(connector)
+        began = time.monotonic()
+        assert call(connector) == 22
+        assert time.monotonic() - began < 0.5
+        assert connector.hedged == 1
+        assert connector.hedge_wins == 1
+
+    def test_hedge_rate(self):
+        # one read in 25 is slow, the duplicate of a read never is
+        seen = set()
+
+        def handler(method, params):
+            n = params[0]
+            slow = n % 25 == 0 and n not in seen
+            seen.add(n)
+            time.sleep(0.05 if slow else 0.001)
+            return n
+        connector = HedgedConnector(DummyConnector(handler),
+                                    min_delay=0.015)
+        for i in range(1, 201):
+            assert connector.invoke(dict(jsonrpc="2.0", id=1,
+                                         method="eth_getBalance",
+                                         params=[i])) == i
+        # the slow ones, past the quantile, and nothing else
+        assert connector.hedged == 8
+        assert connector.hedge_wins == 8
+        assert len(connector.connector.invocations) == 208
+
+    def test_hedge_rate_concurrent(self):
+        def handler(method, params):
+            time.sleep(0.005)
+            return method
+        connector = HedgedConnector(DummyConnector(handler))
+        threads = [threading.Thread(target=warm, args=(connector, 10))
+                   for i in range(32)]
+        began = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - began < 0.5
+        # waiting for a thread isn't taken for a slow node
+        assert connector.hedged <= 0.1 * 320
+        assert len(connector.connector.invocations) == \
+            320 + connector.hedged
+
+    def test_budget(self):
+        # every other read is slow, more than the budget allows to hedge
+        seen = set()
+
+        def handler(method, params):
+            n = params[0]
+            slow = n % 2 == 0 and n not in seen
+            seen.add(n)
+            time.sleep(0.02 if slow else 0.001)
+            return n
+        connector = HedgedConnector(DummyConnector(handler), quantile=0.3,
+                                    min_delay=0.01, budget=0.1)
+        for i in range(100):
+            connector.invoke(dict(jsonrpc="2.0", id=1,
+                                  method="eth_getBalance", params=[i]))
+        assert 9 <= connector.hedged <= 10
+
+    def test_min_delay(self):
+        connector = HedgedConnector(DummyConnector(Stall()), min_delay=0.1)
+        warm(connector, 20)
+        assert connector.delay() == 0.1
+
+    def test_needs_samples(self):
+        stall = Stall(slow=[5], slow_delay=0.05)
+        connector = HedgedConnector(DummyConnector(stall), min_samples=20)
+        warm(connector, 10)
+        assert connector.hedged == 0
+
+    def test_writes_not_hedged(self):
+        stall = Stall(slow=[21], slow_delay=0.05)
+        connector = HedgedConnector(DummyConnector(stall))
+        warm(connector)
+        assert call(connector, "eth_sendTransaction") == 21
+        assert connector.hedged == 0
+        assert len(connector.connector.invocations) == 21
+
+    def test_failure_left_to_other(self):
+        calls = []
+
+        def handler(method, params):
+            calls.append(method)
+            if len(calls) == 21:
+                time.sleep(0.05)
+                raise ConnectionError("lost")
+            time.sleep(0.001)
+            return len(calls)
+        connector = HedgedConnector(DummyConnector(handler))
+        warm(connector)
+        assert call(connector) == 22
+
+    def test_errors_are_answers(self):
+        def handler(method, params):
+            raise ValueError("bad")
+        connector = HedgedConnector(DummyConnector(handler), min_samples=0)
+        connector.latencies.add(0.001)
+        try:
+            call(connector)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("no error")
+
+    def test_batch(self):
+        connector = HedgedConnector(DummyConnector(echo))
+        batch = [dict(jsonrpc="2.0", id=1, method="eth_getBalance",
+                      params=[])]
+        assert connector.invoke_batch(batch) == [["eth_getBalance", []]]
+
+    def test_api(self):
+        api = DummyAPI(echo, hedge=True)
+        assert isinstance(api.connector, HedgedConnector)
+        assert api.eth("getBalance", "0x1") == ["eth_getBalance", ["0x1"]]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_indexer
+----------------------------------
+
+Tests for `empyrean.indexer` module.
+"""
+
+import threading
+
+import pytest
+
+from empyrean.abi import encode_abi, tohex
+from empyrean.indexer import Event, Indexer, MemorySink, FileCheckpoint
+from empyrean.indexer import MemoryCheckpoint, IndexerError
+
+from .dummy import DummyAPI, wait_for
+
+TRANSFER = Event("Transfer(address indexed from, address indexed to, "
+                 "uint256 value)")
+TOKEN = "0x" + "11" * 20
+OTHER = "0x" + "22" * 20
+
+
+def word(i):
+    return "0x" + format(i, "064x")
+
+
+class Chain(object):
+    """ a node with one Transfer in every block. `fork_from` changes the
+        hashes of blocks from a given height on, `forked` those of the
+        blocks in it """
+
+    def __init__(self, head):
+        self.head = head
+        self.fork_from = None
+        self.forked = set()
+        self.calls = []
+
+    def block_hash(self, number):
+        fork = "b" if self.fork_from is not None and \
+            number >= self.fork_from or number in self.forked else "a"
+        return "0x{0}{1}".format(fork, number)
+
+    def log(self, number, address=TOKEN):
+        return {
+            "address": address,
+            "topics": [TRANSFER.topic, word(1), word(number)],
+            "data": "0x" + tohex(encode_abi(["uint256"], [number]))
+            .decode("ascii"),
+            "blockNumber": hex(number),
+            "blockHash": self.block_hash(number),
+            "transactionHash": word(number),
+            "logIndex": "0x0",
+        }
+
+    def __call__(self, method, params):
+        self.calls.append(method)
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            return dict(hash=self.block_hash(int(params[0], 16)))
+        if method == "eth_getLogs":
+            f = params[0]
+            assert f["address"] == [TOKEN]
+            assert f["topics"] == [[TRANSFER.topic]]
+            start = int(f["fromBlock"], 16)
+            end = int(f["toBlock"], 16)
+            return [self.log(n) for n in range(start, end + 1)] + \
+                [self.log(start, OTHER)]
+
+
+class TestEvent:
+
+    def test_signature(self):
+        assert TRANSFER.signature == "Transfer(address,address,uint256)"
+        assert TRANSFER.topic == "0xddf252ad1be2c89b69c2b068fc378daa952ba7" \
+                                 "f163c4a11628f55a4df523b3ef"
+
+    def test_unnamed(self):
+        event = Event("Ping(uint8 indexed, bool)")
+        assert event.args == [("uint8", True, "0"), ("bool", False, "1")]
+
+    def test_decode(self):
+        event = Chain(1).log(5)
+        decoded = TRANSFER.decode(event)
+        assert decoded["args"] == {"from": 1, "to": 5, "value": 5}
+        assert decoded["blockNumber"] == 5
+        assert decoded["event"] == "Transfer"
+
+
+class TestIndexer:
+
+    def indexer(self, chain, **kw):
+        kw.setdefault("batch_size", 3)
+        kw.setdefault("confirmations", 4)
+        return Indexer(DummyAPI(chain), {TOKEN: [TRANSFER]}, MemorySink(),
+                       **kw)
+
+    def test_index(self):
+        indexer = self.indexer(Chain(10), start_block=1)
+        assert indexer.run_once() == 10
+        assert [e["blockNumber"] for e in indexer.sink.events] == \
+            list(range(1, 11))
+        assert indexer.checkpoint.load()["block"] == 10
+        assert indexer.run_once() == 0
+
+    def test_follow(self):
+        chain = Chain(5)
+        indexer = self.indexer(chain)
+        indexer.run_once()
+        chain.head = 8
+        assert indexer.run_once() == 3
+        assert [e["blockNumber"] for e in indexer.sink.events] == \
+            list(range(0, 9))
+
+    def test_reorg(self):
+        chain = Chain(10)
+        indexer = self.indexer(chain, batch_size=1)
+        indexer.run_once()
+        chain.fork_from = 8
+        indexer.run_once()
+        events = indexer.sink.events
+        assert [e["blockNumber"] for e in events] == list(range(0, 11))
+        assert [e["blockHash"][2] for e in events[-3:]] == ["b"] * 3
+        assert indexer.checkpoint.load()["recent"][-1] == [10, "0xb10"]
+
+    def test_reorg_behind_canonical_batch(self):
+        # block 8 was replaced after its batch was fetched, while the
+        # batches after it were fetched from the new chain
+        chain = Chain(10)
+        indexer = self.indexer(chain, batch_size=1)
+        indexer.run_once()
+        chain.forked = {8}
+        indexer.run_once()
+        events = indexer.sink.events
+        assert [e["blockNumber"] for e in events] == list(range(0, 11))
+        assert [e["blockHash"] for e in events[-3:]] == \
+            ["0xb8", "0xa9", "0xa10"]
+
+    def test_deep_reorg(self):
+        chain = Chain(20)
+        indexer = self.indexer(chain, batch_size=1)
+        indexer.run_once()
+        chain.fork_from = 2
+        with pytest.raises(IndexerError):
+            indexer.run_once()
+
+    def test_checkpoint_file(self, tmpdir):
+        path = str(tmpdir.join("checkpoint.json"))
+        chain = Chain(5)
+        self.indexer(chain, checkpoint=FileCheckpoint(path)).run_once()
+        indexer = self.indexer(chain, checkpoint=FileCheckpoint(path))
+        chain.head = 6
+        assert indexer.run_once() == 1
+        assert [e["blockNumber"] for e in indexer.sink.events] == [6]
+
+    def test_sink_error(self):
+        class Broken(MemorySink):
+            def write(self, events):
+                raise IOError("disk full")
+
+        indexer = Indexer(DummyAPI(Chain(10)), {TOKEN: [TRANSFER]},
+                          Broken(), checkpoint=MemoryCheckpoint(),
+                          batch_size=2)
+        with pytest.raises(IOError):
+            indexer.run_once()
+        assert indexer.checkpoint.load() is None
+
+    def test_run_recovers(self):
+        class Flaky(Chain):
+            failures = 2
+
+            def __call__(self, method, params):
+                if method == "eth_getLogs" and self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("node restarting")
+                return super().__call__(method, params)
+
+        indexer = self.indexer(Flaky(10), workers=1, poll_interval=0.01)
+        thread = threading.Thread(target=indexer.run)
+        thread.start()
+        try:
+            wait_for(lambda: len(indexer.sink.events) == 11)
+        finally:
+            indexer.stop()
+            thread.join()
+        assert indexer.errors == 2
+
+    def test_run_ends_on_deep_reorg(self):
+        chain = Chain(20)
+        indexer = self.indexer(chain, batch_size=1, poll_interval=0.01)
+        indexer.run_once()
+        chain.fork_from = 2
+        with pytest.raises(IndexerError):
+            indexer.run()
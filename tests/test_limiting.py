@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_limiting
+----------------------------------
+
+Tests for `empyrean.limiting` module.
+"""
+
+import time
+import socket
+import threading
+
+import pytest
+
+from empyrean.deadlines import deadline, remaining, DeadlineExceeded
+from empyrean.exceptions import ServerError, MethodNotFound
+from empyrean.limiting import AdaptiveLimiter, LimitedConnector, TokenBucket
+
+from .dummy import DummyAPI, DummyConnector, echo, wait_for
+
+
+def request(method="eth_getBalance"):
+    return dict(jsonrpc="2.0", id=1, method=method, params=[])
+
+
+class TestTokenBucket:
+
+    def test_burst(self):
+        bucket = TokenBucket(100, burst=5)
+        began = time.monotonic()
+        for i in range(5):
+            bucket.acquire()
+        assert time.monotonic() - began < 0.01
+        bucket.acquire()
+        assert time.monotonic() - began >= 0.009
+
+    def test_rate(self):
+        bucket = TokenBucket(200, burst=1)
+        began = time.monotonic()
+        for i in range(11):
+            bucket.acquire()
+        assert time.monotonic() - began >= 0.045
+
+    def test_overdraw(self):
+        bucket = TokenBucket(100, burst=2)
+        bucket.acquire(10)
+        began = time.monotonic()
+        bucket.acquire()
+        assert time.monotonic() - began >= 0.08
+
+    def test_deadline(self):
+        bucket = TokenBucket(1, burst=1)
+        bucket.acquire()
+        began = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.05):
+                bucket.acquire()
+        assert time.monotonic() - began < 0.05
+
+
+class TestAdaptiveLimiter:
+
+    def test_grows_when_used(self):
+        limiter = AdaptiveLimiter(initial=2)
+        for i in range(20):
+            limiter.acquire()
+            limiter.acquire()
+            limiter.release(0.01)
+            limiter.release(0.01)
+        # up to where two calls in flight are half the limit
+        assert 3.5 < limiter.limit < 4.5
+
+    def test_idle_doesnt_grow(self):
+        limiter = AdaptiveLimiter(initial=8)
+        for i in range(50):
+            limiter.acquire()
+            limiter.release(0.01)
+        assert limiter.limit == 8
+
+    def test_backs_off_on_latency(self):
+        limiter = AdaptiveLimiter(initial=8)
+        limiter.acquire()
+        limiter.release(0.01)
+        limiter.acquire()
+        limiter.release(0.1)
+        assert limiter.limit == 6
+        assert limiter.decreases == 1
+
+    def test_backs_off_once_per_round(self):
+        limiter = AdaptiveLimiter(initial=8)
+        limiter.acquire()
+        limiter.release(0.01)
+        for i in range(4):
+            limiter.acquire()
+        for i in range(4):
+            limiter.release(0.1)
+        assert limiter.decreases == 1
+
+    def test_floor(self):
+        limiter = AdaptiveLimiter(initial=2, min_limit=1)
+        for i in range(5):
+            limiter.acquire()
+            limiter._last_decrease = 0
+            limiter.release(1, overloaded=True)
+        assert limiter.limit == 1
+
+    def test_waits_for_slot(self):
+        limiter = AdaptiveLimiter(initial=1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def other():
+            limiter.acquire()
+            acquired.set()
+        threading.Thread(target=other, daemon=True).start()
+        wait_for(lambda: limiter.throttled == 1)
+        assert not acquired.is_set()
+        limiter.release(0.01)
+        assert acquired.wait(1)
+
+    def test_deadline(self):
+        limiter = AdaptiveLimiter(initial=1)
+        limiter.acquire()
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.02):
+                limiter.acquire()
+        assert limiter.in_flight == 1
+
+
+class TestLimitedConnector:
+
+    def test_server_errors_back_off(self):
+        def handler(method, params):
+            raise ServerError(-32000, "busy")
+        limiter = AdaptiveLimiter(initial=8)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        with pytest.raises(ServerError):
+            connector.invoke(request())
+        assert limiter.limit == 6
+        assert limiter.in_flight == 0
+
+    def test_timeouts_back_off(self):
+        def handler(method, params):
+            raise socket.timeout()
+        limiter = AdaptiveLimiter(initial=8)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        with pytest.raises(socket.timeout):
+            connector.invoke(request())
+        assert limiter.limit == 6
+
+    def test_deadlines_dont(self):
+        def slow(method, params):
+            time.sleep(0.002)
+            remaining()
+
+        def timeout(method, params):
+            time.sleep(0.002)
+            raise socket.timeout()
+        for handler in (slow, timeout):
+            limiter = AdaptiveLimiter(initial=32)
+            connector = LimitedConnector(DummyConnector(handler), limiter)
+            for i in range(20):
+                with pytest.raises(socket.timeout):
+                    with deadline(0.001):
+                        connector.invoke(request())
+            assert limiter.limit == 32
+            assert limiter.in_flight == 0
+
+    def test_other_errors_dont(self):
+        def handler(method, params):
+            raise MethodNotFound(-32601, "not found")
+        limiter = AdaptiveLimiter(initial=8)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        with pytest.raises(MethodNotFound):
+            connector.invoke(request())
+        assert limiter.limit == 8
+
+    def test_batch_errors(self):
+        def handler(method, params):
+            if method == "eth_busy":
+                raise ServerError(-32005, "limit exceeded")
+            return method
+        limiter = AdaptiveLimiter(initial=8)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        results = connector.invoke_batch([request(), request("eth_busy")])
+        assert results[0] == "eth_getBalance"
+        assert limiter.limit == 6
+
+    def test_batches_not_timed(self):
+        def handler(method, params):
+            if method == "eth_busy":
+                time.sleep(0.0005)
+            return method
+        limiter = AdaptiveLimiter(initial=16)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        for i in range(50):
+            connector.invoke(request())
+        limit, decreases = limiter.limit, limiter.decreases
+        for i in range(20):
+            connector.invoke_batch([request("eth_busy")] * 100)
+        assert limiter.limit == limit
+        assert limiter.decreases == decreases
+
+    def test_errors_not_timed(self):
+        def handler(method, params):
+            if method == "eth_unknown":
+                raise MethodNotFound(-32601, "not found")
+            time.sleep(0.002)
+            return method
+        limiter = AdaptiveLimiter(initial=8)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        connector.invoke(request())
+        baseline = limiter.baseline
+        for i in range(5):
+            with pytest.raises(MethodNotFound):
+                connector.invoke(request("eth_unknown"))
+        assert limiter.baseline == baseline
+        connector.invoke(request())
+        assert limiter.decreases == 0
+
+    def test_rates(self):
+        connector = LimitedConnector(DummyConnector(echo),
+                                     rates={"eth_getLogs": 100})
+        began = time.monotonic()
+        connector.invoke_batch([request("eth_getLogs")] * 110)
+        connector.invoke(request())
+        assert time.monotonic() - began < 0.05
+        connector.invoke(request("eth_getLogs"))
+        assert time.monotonic() - began >= 0.1
+
+    def test_limits_concurrency(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def handler(method, params):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+            return method
+        limiter = AdaptiveLimiter(initial=2, max_limit=2)
+        connector = LimitedConnector(DummyConnector(handler), limiter)
+        threads = [threading.Thread(target=connector.invoke,
+                                    args=(request(),)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+    def test_api(self):
+        api = DummyAPI(echo, limit=True, rate_limits={"eth_getLogs": 5})
+        assert isinstance(api.connector, LimitedConnector)
+        assert api.eth("getBalance", "0x1") == ["eth_getBalance", ["0x1"]]
+        assert api.connector.limiter.in_flight == 0
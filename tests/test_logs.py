@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_logs
+----------------------------------
+
+Tests for `empyrean.logs` module.
+"""
+
+import time
+import socket
+import threading
+
+import pytest
+
+from empyrean.deadlines import deadline, DeadlineExceeded
+from empyrean.exceptions import ServerError, InvalidParams
+from empyrean.logs import LogFetcher, too_large
+
+from .dummy import DummyAPI
+
+
+class Node(object):
+    """ one log per block below `dense_from`, `dense` logs per block from
+        there on. Rejects queries returning more than `limit` logs """
+
+    def __init__(self, limit=100, dense_from=None, dense=50):
+        self.limit = limit
+        self.dense_from = dense_from
+        self.dense = dense
+        self.ranges = []
+        self.lock = threading.Lock()
+
+    def logs(self, number):
+        count = 1
+        if self.dense_from is not None and number >= self.dense_from:
+            count = self.dense
+        return [dict(blockNumber=hex(number), logIndex=hex(i))
+                for i in range(count)]
+
+    def __call__(self, method, params):
+        f = params[0]
+        start, end = int(f["fromBlock"], 16), int(f["toBlock"], 16)
+        with self.lock:
+            self.ranges.append((start, end))
+        logs = []
+        for n in range(start, end + 1):
+            logs.extend(self.logs(n))
+        if len(logs) > self.limit:
+            raise ServerError(-32005, "query returned more than {0} results"
+                              .format(self.limit))
+        return logs
+
+
+def numbers(logs):
+    return [int(log["blockNumber"], 16) for log in logs]
+
+
+class TestTooLarge:
+
+    def test_messages(self):
+        assert too_large(ServerError(-32005, "query returned more than "
+                                             "10000 results"))
+        assert too_large(ServerError(-32000, "Log response size exceeded"))
+        assert not too_large(InvalidParams(-32602, "invalid argument"))
+
+    def test_timeout(self):
+        assert too_large(socket.timeout())
+        assert not too_large(DeadlineExceeded())
+
+
+class TestLogFetcher:
+
+    def test_order(self):
+        api = DummyAPI(Node())
+        logs = list(api.eth.iter_logs({"address": "0x1"}, 0, 999,
+                                      chunk_size=10, workers=4))
+        assert numbers(logs) == list(range(1000))
+
+    def test_grows(self):
+        node = Node(limit=10 ** 6)
+        api = DummyAPI(node)
+        list(api.eth.iter_logs({}, 0, 9999, chunk_size=10, workers=1,
+                               target_results=10 ** 6))
+        sizes = [end - start + 1 for start, end in node.ranges]
+        assert sizes[:4] == [10, 20, 40, 80]
+
+    def test_splits(self):
+        node = Node(limit=100, dense_from=500)
+        api = DummyAPI(node)
+        fetcher = LogFetcher(api, {}, 0, 999, chunk_size=200, workers=2)
+        logs = list(fetcher)
+        assert len(logs) == 500 + 500 * 50
+        assert numbers(logs) == sorted(numbers(logs))
+        assert fetcher.chunk_size <= 4
+
+    def test_single_block_too_large(self):
+        api = DummyAPI(Node(limit=10, dense_from=0))
+        with pytest.raises(ServerError):
+            list(api.eth.iter_logs({}, 0, 10, chunk_size=4))
+
+    def test_other_errors(self):
+        def handler(method, params):
+            raise InvalidParams(-32602, "invalid argument")
+        api = DummyAPI(handler)
+        with pytest.raises(InvalidParams):
+            list(api.eth.iter_logs({}, 0, 10, chunk_size=4))
+
+    def test_no_splits_past_deadline(self):
+        def handler(method, params):
+            time.sleep(0.03)
+            raise socket.timeout()
+        api = DummyAPI(handler)
+        fetcher = LogFetcher(api, {}, 0, 100)
+        with pytest.raises(socket.timeout):
+            with deadline(0.02):
+                fetcher.fetch(0, 100)
+        assert len(api.connector.calls) == 1
+
+    def test_filter_range_ignored(self):
+        node = Node()
+        api = DummyAPI(node)
+        list(api.eth.iter_logs({"fromBlock": "0x100"}, 0, 3))
+        assert node.ranges == [(0, 3)]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_nonces
+----------------------------------
+
+Tests for `empyrean.nonces` module.
+"""
+
+import socket
+import threading
+
+import pytest
+
+from empyrean.exceptions import ServerError
+from empyrean.nonces import NonceManager, nonce_taken
+
+from .dummy import DummyAPI
+
+ADDRESS = "0xAbC"
+
+
+class Node(object):
+    """ accepts transactions with unused nonces """
+
+    def __init__(self, count=5):
+        self.nonces = set(range(count))
+        self.fail = None
+        self.lock = threading.Lock()
+
+    def __call__(self, method, params):
+        if method == "eth_getTransactionCount":
+            assert params[1] == "pending"
+            count = 0
+            while count in self.nonces:
+                count += 1
+            return hex(count)
+        if method == "eth_sendTransaction":
+            nonce = int(params[0]["nonce"], 16)
+            if self.fail is not None:
+                fail, self.fail = self.fail, None
+                raise fail
+            with self.lock:
+                if nonce in self.nonces:
+                    raise ServerError(-32000, "nonce too low")
+                self.nonces.add(nonce)
+            return "0x{0}".format(nonce)
+        raise AssertionError(method)
+
+
+class TestNonceManager:
+
+    def test_seed(self):
+        manager = NonceManager(DummyAPI(Node(5)))
+        assert manager.next_nonce(ADDRESS) == 5
+        assert manager.next_nonce(ADDRESS) == 6
+        assert manager.next_nonce(ADDRESS.lower()) == 7
+
+    def test_seeded_once(self):
+        api = DummyAPI(Node())
+        manager = NonceManager(api)
+        for i in range(3):
+            manager.sendTransaction(ADDRESS, to="0x1")
+        assert [m for m, p in api.connector.calls].count(
+            "eth_getTransactionCount") == 1
+
+    def test_concurrent(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node))
+        threads = [threading.Thread(target=manager.sendTransaction,
+                                    args=(ADDRESS,), kwargs=dict(to="0x1"))
+                   for i in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert node.nonces == set(range(50))
+
+    def test_release_reuses(self):
+        manager = NonceManager(DummyAPI(Node(0)))
+        first = manager.next_nonce(ADDRESS)
+        manager.next_nonce(ADDRESS)
+        manager.release(ADDRESS, first)
+        assert manager.gaps(ADDRESS) == [0]
+        assert manager.next_nonce(ADDRESS) == 0
+        assert manager.next_nonce(ADDRESS) == 2
+
+    def test_rejected_releases(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node))
+        node.fail = ServerError(-32000, "insufficient funds")
+        with pytest.raises(ServerError):
+            manager.sendTransaction(ADDRESS, to="0x1")
+        assert manager.sendTransaction(ADDRESS, to="0x1") == "0x0"
+
+    def test_nonce_too_low_resyncs(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node))
+        manager.sendTransaction(ADDRESS, to="0x1")
+        # someone else sent two transactions from the account
+        node.nonces.update([1, 2])
+        assert manager.sendTransaction(ADDRESS, to="0x1") == "0x3"
+        assert manager.resyncs == 1
+
+    def test_gives_up(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node), retries=1)
+
+        def send(nonce):
+            raise ServerError(-32000, "replacement transaction underpriced")
+
+        with pytest.raises(ServerError):
+            manager.send(ADDRESS, send)
+        assert manager.resyncs == 1
+
+    def test_timeout_resets(self):
+        node = Node(0)
+        api = DummyAPI(node)
+        manager = NonceManager(api)
+        node.fail = socket.timeout()
+        with pytest.raises(socket.timeout):
+            manager.sendTransaction(ADDRESS, to="0x1")
+        # not handed out again without asking the node
+        assert manager.gaps(ADDRESS) == []
+        manager.sendTransaction(ADDRESS, to="0x1")
+        assert [m for m, p in api.connector.calls].count(
+            "eth_getTransactionCount") == 2
+
+    def test_dropped_become_gaps(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node))
+        for i in range(4):
+            manager.sendTransaction(ADDRESS, to="0x1")
+        # the node lost the last two
+        node.nonces -= {2, 3}
+        assert manager.resync(ADDRESS) == 2
+        assert manager.gaps(ADDRESS) == [2, 3]
+        assert manager.sendTransaction(ADDRESS, to="0x1") == "0x2"
+
+    def test_node_ahead(self):
+        node = Node(0)
+        manager = NonceManager(DummyAPI(node))
+        manager.next_nonce(ADDRESS)
+        node.nonces.update(range(10))
+        manager.resync(ADDRESS)
+        assert manager.next_nonce(ADDRESS) == 10
+
+    def test_nonce_taken(self):
+        assert nonce_taken(ServerError(-32000, "Nonce too low"))
+        assert not nonce_taken(ServerError(-32000, "already known"))
+        assert not nonce_taken(ValueError("nonce too low"))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_receipts
+----------------------------------
+
+Tests for `empyrean.receipts` module.
+"""
+
+import pytest
+
+from empyrean.exceptions import ServerError
+from empyrean.receipts import ReceiptWaiter, ReceiptTimeout
+
+from .dummy import DummyAPI, wait_for
+
+
+class Chain(object):
+    """ mined maps tx hashes to the block they're in """
+
+    def __init__(self, head=10):
+        self.head = head
+        self.mined = {}
+        self.broken = set()
+
+    def __call__(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            return dict(number=hex(number), hash=hex(number),
+                        timestamp="0x0")
+        if method == "eth_getTransactionReceipt":
+            if params[0] in self.broken:
+                raise ServerError(-32000, "boom")
+            number = self.mined.get(params[0])
+            if number is None or number > self.head:
+                return None
+            return dict(transactionHash=params[0], blockNumber=hex(number))
+        raise AssertionError(method)
+
+
+class TestReceiptWaiter:
+
+    def test_resolve(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain))
+        a, b = waiter.add_many(["0xa", "0xb"])
+        chain.mined["0xa"] = 10
+        assert waiter.check(10) == 1
+        assert a.result(0)["transactionHash"] == "0xa"
+        assert not b.done()
+        assert len(waiter) == 1
+
+    def test_one_batch_per_check(self):
+        chain = Chain()
+        api = DummyAPI(chain)
+        waiter = ReceiptWaiter(api, batch_size=40)
+        waiter.add_many(["0x{0:x}".format(i) for i in range(100)])
+        waiter.check(10)
+        assert len(api.connector.batches) == 3
+        assert api.connector.invocations == []
+
+    def test_confirmations(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain), confirmations=2)
+        future = waiter.add("0xa")
+        chain.mined["0xa"] = 10
+        waiter.check(10)
+        waiter.check(11)
+        assert not future.done()
+        waiter.check(12)
+        assert future.done()
+
+    def test_reorged_out(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain), confirmations=2)
+        future = waiter.add("0xa")
+        chain.mined["0xa"] = 10
+        waiter.check(10)
+        # the block was replaced, the tx is in a later one now
+        chain.mined["0xa"] = 11
+        chain.head = 13
+        waiter.check(12)
+        assert not future.done()
+        waiter.check(13)
+        assert future.result(0)["blockNumber"] == "0xb"
+
+    def test_per_tx_confirmations(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain), confirmations=5)
+        fast = waiter.add("0xa", confirmations=0)
+        slow = waiter.add("0xb")
+        chain.mined.update({"0xa": 10, "0xb": 10})
+        waiter.check(10)
+        assert fast.done() and not slow.done()
+
+    def test_errors_retried(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain))
+        future = waiter.add("0xa")
+        chain.mined["0xa"] = 10
+        chain.broken.add("0xa")
+        waiter.check(10)
+        assert not future.done()
+        chain.broken.clear()
+        waiter.check(10)
+        assert future.done()
+
+    def test_timeout(self):
+        waiter = ReceiptWaiter(DummyAPI(Chain()), timeout=0)
+        future = waiter.add("0xa", timeout=-1)
+        waiter.check(10)
+        with pytest.raises(ReceiptTimeout):
+            future.result(0)
+        assert len(waiter) == 0
+
+    def test_expire(self):
+        waiter = ReceiptWaiter(DummyAPI(Chain()))
+        future = waiter.add("0xa", timeout=-1)
+        other = waiter.add("0xb")
+        waiter.expire()
+        assert isinstance(future.exception(0), ReceiptTimeout)
+        assert not other.done()
+
+    def test_callback(self):
+        chain = Chain()
+        waiter = ReceiptWaiter(DummyAPI(chain))
+        seen = []
+        waiter.add("0xa", callback=lambda f: seen.append(f.result()))
+        chain.mined["0xa"] = 10
+        waiter.check(10)
+        assert seen == [dict(transactionHash="0xa", blockNumber="0xa")]
+
+    def test_add_twice(self):
+        waiter = ReceiptWaiter(DummyAPI(Chain()))
+        assert waiter.add("0xa") is waiter.add("0xa")
+        assert len(waiter) == 1
+
+    def test_run(self):
+        chain = Chain()
+        api = DummyAPI(chain)
+        api.track_head(min_interval=0.001, block_time=0.001)
+        waiter = ReceiptWaiter(api, poll_interval=0.01).start()
+        try:
+            future = waiter.add("0xa")
+            chain.mined["0xa"] = 11
+            chain.head = 11
+            assert future.result(2)["blockNumber"] == "0xb"
+            wait_for(lambda: len(waiter) == 0)
+        finally:
+            waiter.stop()
+            api.head_tracker.stop()
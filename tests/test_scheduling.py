@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduling
+----------------------------------
+
+Tests for `empyrean.scheduling` module.
+"""
+
+import time
+import threading
+
+import pytest
+
+from empyrean.batching import MicroBatcher
+from empyrean.deadlines import deadline, DeadlineExceeded
+from empyrean.scheduling import HIGH, NORMAL, LOW, Scheduler
+from empyrean.scheduling import PriorityConnector, priority, current_priority
+
+from .dummy import DummyAPI, DummyConnector, echo, wait_for
+
+
+def request(method="eth_getBalance"):
+    return dict(jsonrpc="2.0", id=1, method=method, params=[])
+
+
+def queue_up(scheduler, levels, order):
+    """ start a thread waiting for a slot per level, each noting its
+        level in `order` once it has one """
+    threads = []
+    for level in levels:
+        def run(level=level):
+            scheduler.acquire(level)
+            order.append(level)
+            scheduler.release()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+        # keep the order the threads queue up in
+        wait_for(lambda: scheduler.waiting() == len(threads))
+    return threads
+
+
+class TestPriority:
+
+    def test_context(self):
+        assert current_priority() == NORMAL
+        with priority(LOW):
+            assert current_priority() == LOW
+            with priority(None):
+                assert current_priority() == LOW
+            with priority(HIGH):
+                assert current_priority() == HIGH
+            assert current_priority() == LOW
+        assert current_priority() == NORMAL
+
+
+class TestScheduler:
+
+    def test_free_slots(self):
+        scheduler = Scheduler(slots=4)
+        for i in range(3):
+            scheduler.acquire(LOW)
+        assert scheduler.in_use == 3
+        for i in range(3):
+            scheduler.release()
+        assert scheduler.in_use == 0
+
+    def test_reserved(self):
+        scheduler = Scheduler(slots=4, reserved=0.25)
+        for i in range(3):
+            scheduler.acquire(LOW)
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.02):
+                scheduler.acquire(NORMAL)
+        assert scheduler.waiting() == 0
+        # the last slot is HIGH's
+        with deadline(0.02):
+            scheduler.acquire(HIGH)
+        assert scheduler.in_use == 4
+
+    def test_high_first(self):
+        scheduler = Scheduler(slots=2, reserved=0)
+        scheduler.acquire(LOW)
+        scheduler.acquire(LOW)
+        order = []
+        threads = queue_up(scheduler, [LOW, LOW, HIGH], order)
+        scheduler.release()
+        wait_for(lambda: order)
+        assert order[0] == HIGH
+        scheduler.release()
+        for thread in threads:
+            thread.join(1)
+        assert sorted(order) == [HIGH, LOW, LOW]
+
+    def test_weighted(self):
+        scheduler = Scheduler(slots=1, reserved=0,
+                              weights={HIGH: 3, LOW: 1})
+        scheduler.acquire(HIGH)
+        order = []
+        threads = queue_up(scheduler, [LOW] * 4 + [HIGH] * 12, order)
+        scheduler.release()
+        for thread in threads:
+            thread.join(1)
+        # low isn't starved, but gets a quarter of the turns
+        first = order[:8]
+        assert first.count(LOW) == 2
+        assert first.count(HIGH) == 6
+
+    def test_idle_class_no_credit(self):
+        scheduler = Scheduler(slots=1, reserved=0,
+                              weights={HIGH: 1, LOW: 1})
+        for i in range(10):
+            scheduler.acquire(HIGH)
+            scheduler.release()
+        scheduler.acquire(HIGH)
+        order = []
+        threads = queue_up(scheduler, [LOW] * 4 + [HIGH] * 4, order)
+        scheduler.release()
+        for thread in threads:
+            thread.join(1)
+        # low takes turns, it doesn't get the 10 it missed in one go
+        assert order[:4].count(HIGH) == 2
+
+    def test_deadline(self):
+        scheduler = Scheduler(slots=1, reserved=0)
+        scheduler.acquire()
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.02):
+                scheduler.acquire()
+        assert scheduler.waiting() == 0
+        scheduler.release()
+        assert scheduler.in_use == 0
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            Scheduler().acquire(7)
+        with pytest.raises(ValueError):
+            Scheduler(slots=1, reserved=1)
+
+
+class TestPriorityConnector:
+
+    def test_batch_chunks(self):
+        dummy = DummyConnector(echo)
+        connector = PriorityConnector(dummy, chunk_size=3)
+        batch = [request("eth_{0}".format(i)) for i in range(7)]
+        results = connector.invoke_batch(batch)
+        assert [r[0] for r in results] == \
+            ["eth_{0}".format(i) for i in range(7)]
+        assert [len(b) for b in dummy.batches] == [3, 3, 1]
+
+    def test_interactive_overtakes_backfill(self):
+        seen = []
+
+        def handler(method, params):
+            seen.append(method)
+            time.sleep(0.002)
+            return method
+        scheduler = Scheduler(slots=1, reserved=0)
+        connector = PriorityConnector(DummyConnector(handler), scheduler,
+                                      chunk_size=1)
+
+        def backfill():
+            with priority(LOW):
+                connector.invoke_batch([request("eth_getLogs")] * 200)
+        thread = threading.Thread(target=backfill, daemon=True)
+        thread.start()
+        wait_for(lambda: len(seen) > 5)
+        with priority(HIGH):
+            assert connector.invoke(request("eth_call")) == "eth_call"
+        thread.join(5)
+        assert seen.index("eth_call") < 50
+
+    def test_batcher_priority(self):
+        levels = []
+
+        def handler(method, params):
+            levels.append(current_priority())
+            return method
+        batcher = MicroBatcher(DummyConnector(handler), window=0.01)
+        with priority(LOW):
+            batcher.submit(request()).result()
+        assert levels == [LOW]
+        batcher.close()
+
+    def test_api(self):
+        api = DummyAPI(echo, scheduler=True)
+        assert isinstance(api.connector, PriorityConnector)
+        with priority(HIGH):
+            assert api.eth("call", {}) == ["eth_call", [{}]]
+        assert api.connector.scheduler.granted[HIGH] == 1
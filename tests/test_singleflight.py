@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_singleflight
+----------------------------------
+
+Tests for `empyrean.singleflight` module.
+"""
+
+import time
+import threading
+
+import pytest
+
+from empyrean.deadlines import deadline, remaining, DeadlineExceeded
+from empyrean.exceptions import ServerError
+from empyrean.methods import is_idempotent
+from empyrean.singleflight import SingleFlight
+
+from .dummy import DummyAPI
+
+
+class Gate(object):
+    """ a handler that blocks until released """
+
+    def __init__(self, result="0x1"):
+        self.result = result
+        self.event = threading.Event()
+
+    def __call__(self, method, params):
+        self.event.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def run(threads, target):
+    results = []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=worker) for i in range(threads)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+class TestSingleFlight:
+
+    def test_coalesce(self):
+        flight = SingleFlight()
+        gate = Gate()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            return gate(None, None)
+
+        threads, results = run(10, lambda: flight.do("k", fn))
+        while flight.coalesced < 9:
+            threading.Event().wait(0.001)
+        gate.event.set()
+        for t in threads:
+            t.join()
+        assert results == ["0x1"] * 10
+        assert calls == [1]
+        assert len(flight) == 0
+
+    def test_exception(self):
+        flight = SingleFlight()
+        gate = Gate(ServerError(-32000, "busy"))
+        threads, results = run(5, lambda: flight.do("k", lambda:
+                                                    gate(None, None)))
+        while flight.coalesced < 4:
+            threading.Event().wait(0.001)
+        gate.event.set()
+        for t in threads:
+            t.join()
+        assert len(results) == 5
+        assert all(isinstance(r, ServerError) for r in results)
+
+    def test_follower_deadline(self):
+        flight = SingleFlight()
+        gate = Gate()
+        threads, results = run(1, lambda: flight.do("k", lambda:
+                                                    gate(None, None)))
+        while not len(flight):
+            threading.Event().wait(0.001)
+        began = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            with deadline(0.01):
+                flight.do("k", lambda: "0x2")
+        assert time.monotonic() - began < 0.1
+        gate.event.set()
+        threads[0].join()
+        assert results == ["0x1"]
+
+    def test_leader_deadline(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.05)
+            remaining()
+            return "0x1"
+
+        def leader():
+            with deadline(0.02):
+                return flight.do("k", fn)
+        threads, results = run(1, leader)
+        while not len(flight):
+            threading.Event().wait(0.001)
+        # no deadline of its own, so it makes the call itself
+        assert flight.do("k", fn) == "0x1"
+        threads[0].join()
+        assert isinstance(results[0], DeadlineExceeded)
+        assert calls == [1, 1]
+
+    def test_sequential(self):
+        flight = SingleFlight()
+        calls = []
+        flight.do("k", lambda: calls.append(1))
+        flight.do("k", lambda: calls.append(1))
+        assert calls == [1, 1]
+
+
+class TestIdempotent:
+
+    @pytest.mark.parametrize("method,expect", [
+        ("eth_gasPrice", True),
+        ("eth_call", True),
+        ("eth_sendTransaction", False),
+        ("eth_getFilterChanges", False),
+        ("eth_getFilterLogs", False),
+        ("debug_setHead", False),
+        ("debug_traceTransaction", True),
+        ("personal_listAccounts", False),
+        ("miner_start", False),
+    ])
+    def test_methods(self, method, expect):
+        assert is_idempotent(method) is expect
+
+
+class TestAPICoalesce:
+
+    def test_reads(self):
+        gate = Gate()
+        api = DummyAPI(gate, coalesce=True)
+        threads, results = run(8, api.eth.gasPrice)
+        while api.singleflight.coalesced < 7:
+            threading.Event().wait(0.001)
+        gate.event.set()
+        for t in threads:
+            t.join()
+        assert results == ["0x1"] * 8
+        assert len(api.connector.calls) == 1
+
+    def test_writes(self):
+        gate = Gate()
+        gate.event.set()
+        api = DummyAPI(gate, coalesce=True)
+        threads, results = run(4, lambda: api.eth.sendTransaction("0x1"))
+        for t in threads:
+            t.join()
+        assert len(api.connector.calls) == 4
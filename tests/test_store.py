@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_store
+----------------------------------
+
+Tests for `empyrean.store` module.
+"""
+
+import sqlite3
+
+import pytest
+
+from empyrean.store import ChainStore
+
+from .dummy import DummyAPI
+
+
+def block(number, fork="a", parent_fork=None):
+    return {
+        "number": hex(number),
+        "hash": "0x{0}{1}".format(fork, number),
+        "parentHash": "0x{0}{1}".format(parent_fork or fork, number - 1),
+        "transactions": [],
+    }
+
+
+def receipt(tx, number, fork="a"):
+    return {
+        "transactionHash": tx,
+        "blockHash": "0x{0}{1}".format(fork, number),
+        "blockNumber": hex(number),
+    }
+
+
+@pytest.fixture
+def store(tmpdir):
+    return ChainStore(str(tmpdir.join("chain.db")), confirmations=2)
+
+
+class TestChainStore:
+
+    def test_by_hash(self, store):
+        store.add_block(block(1), canonical=False)
+        assert store.block_by_hash("0xa1") == block(1)
+        assert store.block_by_hash("0xa1", full=True) is None
+        assert store.canonical_hash(1) is None
+
+    def test_by_number_needs_confirmations(self, store):
+        store.add_block(block(1))
+        assert store.block_by_number(1) is None
+        store.new_head(3)
+        assert store.block_by_number(1) == block(1)
+
+    def test_head(self, store):
+        assert store.head is None
+        store.add_block(block(5))
+        store.new_head(4)
+        assert store.head == 5
+
+    def test_reorg_same_height(self, store):
+        for n in range(1, 5):
+            store.add_block(block(n))
+        store.add_block(block(3, "b", "a"))
+        assert store.canonical_hash(2) == "0xa2"
+        assert store.canonical_hash(3) == "0xb3"
+        assert store.canonical_hash(4) is None
+        assert store.reorgs == 1
+
+    def test_reorg_parent_mismatch(self, store):
+        for n in range(1, 4):
+            store.add_block(block(n))
+        store.add_block(block(4, "b"))
+        assert store.canonical_hash(1) == "0xa1"
+        assert store.canonical_hash(3) is None
+        assert store.canonical_hash(4) == "0xb4"
+
+    def test_reorg_child_mismatch(self, store):
+        store.add_block(block(5))
+        store.add_block(block(4, "b"))
+        assert store.canonical_hash(4) == "0xb4"
+        assert store.canonical_hash(5) is None
+
+    def test_receipts(self, store):
+        store.add_block(block(1))
+        store.add_receipt(receipt("0xt1", 1))
+        assert store.receipt("0xt1") == receipt("0xt1", 1)
+        store.add_block(block(1, "b"))
+        assert store.receipt("0xt1") is None
+
+    def test_receipt_unknown_block(self, store):
+        store.add_receipt(receipt("0xt1", 1))
+        assert store.receipt("0xt1") is None
+        store.new_head(10)
+        assert store.receipt("0xt1") == receipt("0xt1", 1)
+
+    def test_logs(self, store):
+        logs = [{"blockNumber": "0x2", "logIndex": "0x0"}]
+        log_filter = {"fromBlock": "0x1", "toBlock": "0x2", "address": "0xc"}
+        store.new_head(3)
+        store.add_logs(log_filter, logs)
+        assert store.logs(log_filter) is None
+        store.new_head(4)
+        store.add_logs(log_filter, logs)
+        assert store.logs(dict(log_filter)) == logs
+        assert store.logs(dict(log_filter, address="0xd")) is None
+        store.add_logs({"fromBlock": "0x1", "toBlock": "latest"}, logs)
+        assert store.logs({"fromBlock": "0x1", "toBlock": "latest"}) is None
+        store.rollback(2)
+        assert store.logs(log_filter) is None
+
+
+class Node(object):
+
+    def __call__(self, method, params):
+        if method == "eth_getBlockByNumber":
+            if params[0] == "latest":
+                return block(10)
+            return block(int(params[0], 16))
+        if method == "eth_getBlockByHash":
+            return block(int(params[0][3:]))
+        if method == "eth_getTransactionReceipt":
+            return receipt(params[0], 1)
+        if method == "eth_blockNumber":
+            return "0xa"
+        if method == "eth_getLogs":
+            return [{"blockNumber": params[0]["toBlock"]}]
+
+
+class TestReadThrough:
+
+    def test_blocks(self, store):
+        api = DummyAPI(Node(), store=store)
+        api._call("eth_blockNumber")
+        for i in range(2):
+            assert api._call("eth_getBlockByNumber", "0x1", False) == \
+                block(1)
+            assert api._call("eth_getBlockByHash", "0xa2", False) == \
+                block(2)
+        assert len(api.connector.calls) == 3
+
+    def test_latest(self, store):
+        api = DummyAPI(Node(), store=store)
+        api._call("eth_getBlockByNumber", "latest", False)
+        api._call("eth_getBlockByNumber", "latest", False)
+        assert len(api.connector.calls) == 2
+        assert store.head == 10
+
+    def test_receipts(self, store):
+        api = DummyAPI(Node(), store=store)
+        api._call("eth_getBlockByNumber", "0x1", False)
+        api._call("eth_getTransactionReceipt", "0xt1")
+        api._call("eth_getTransactionReceipt", "0xt1")
+        assert len(api.connector.calls) == 2
+
+    def test_persistent(self, tmpdir):
+        path = str(tmpdir.join("chain.db"))
+        api = DummyAPI(Node(), store=ChainStore(path))
+        api._call("eth_getBlockByHash", "0xa2", False)
+        api = DummyAPI(Node(), store=ChainStore(path))
+        api._call("eth_getBlockByHash", "0xa2", False)
+        assert api.connector.calls == []
+
+    def test_logs(self, store):
+        api = DummyAPI(Node(), store=store)
+        api._call("eth_blockNumber")
+        store.new_head(10)
+        for i in range(2):
+            api._call("eth_getLogs", {"fromBlock": "0x1", "toBlock": "0x8"})
+            api._call("eth_getLogs", {"fromBlock": "0x1", "toBlock": "0x9"})
+        assert len(api.connector.calls) == 4
+
+    def test_locked(self, store):
+        # another process holding the database doesn't fail calls
+        store.timeout = 0.01
+        store._local.pid = None
+        other = sqlite3.connect(store.path, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            api = DummyAPI(Node(), store=store)
+            assert api._call("eth_getBlockByHash", "0xa2", False) == block(2)
+            assert api._call("eth_getBlockByHash", "0xa2", False) == block(2)
+            assert len(api.connector.calls) == 2
+        finally:
+            other.rollback()
+        api._call("eth_getBlockByHash", "0xa2", False)
+        api._call("eth_getBlockByHash", "0xa2", False)
+        assert len(api.connector.calls) == 3
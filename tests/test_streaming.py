@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_streaming
+----------------------------------
+
+Tests for `empyrean.streaming` module.
+"""
+
+import json
+
+import pytest
+
+from empyrean.codecs import available_codecs
+from empyrean.connectors import Connector, IPCConnector
+from empyrean.exceptions import ServerError
+from empyrean.streaming import ResultStream
+
+from .servers import FakeIPCServer
+
+
+@pytest.fixture(params=available_codecs(), ids=lambda c: c.name)
+def codec(request):
+    return request.param
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def parse(codec, data, size):
+    stream = ResultStream(codec)
+    items = []
+    for chunk in chunked(data, size):
+        items.extend(stream.feed(chunk))
+    return items, stream
+
+
+LOGS = [
+    {"address": "0x01", "topics": ["0xaa", "0xbb"], "data": "0x"},
+    {"address": "0x02", "topics": [], "data": "0x\"quoted\\\" ]},["},
+    "a string with , and ]",
+    12,
+    None,
+    [1, [2, {"x": []}]],
+]
+
+
+class TestResultStream:
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+    def test_items(self, codec, size):
+        data = json.dumps(dict(jsonrpc="2.0", id=4, result=LOGS),
+                          indent=1).encode("utf8")
+        items, stream = parse(codec, data, size)
+        assert items == LOGS
+        assert stream.done
+        assert stream.streamed
+        assert stream.close() == dict(jsonrpc="2.0", id=4)
+
+    def test_numbers(self, codec):
+        numbers = [0, 0.5, 1e3, -1.25e-7, 10, 3.0, 2E+10, 123456789012]
+        data = json.dumps(dict(jsonrpc="2.0", id=1, result=numbers),
+                          separators=(",", ":")).encode("utf8")
+        # every split, including right after "0." or "1e"
+        for size in range(1, len(data) + 1):
+            items, stream = parse(codec, data, size)
+            assert items == numbers
+            assert stream.done
+        for split in range(1, len(data)):
+            stream = ResultStream(codec)
+            items = list(stream.feed(data[:split]))
+            items.extend(stream.feed(data[split:]))
+            assert items == numbers
+
+    @pytest.mark.parametrize("size", [1, 5, 100000])
+    def test_non_ascii(self, codec, size):
+        result = [{"a": "€"}, "ü", {"b": ["\\u20ac", "\\"]}]
+        data = json.dumps(dict(id=1, result=result),
+                          ensure_ascii=False).encode("utf8")
+        items, stream = parse(codec, data, size)
+        assert items == result
+
+    @pytest.mark.parametrize("size", [1, 7, 100000])
+    def test_large_items(self, codec, size):
+        stream = ResultStream(codec)
+        stream.fast_limit = 10
+        data = json.dumps(dict(id=1, result=LOGS)).encode("utf8")
+        items = []
+        for chunk in chunked(data, size):
+            items.extend(stream.feed(chunk))
+        assert items == LOGS
+
+    def test_invalid_item(self, codec):
+        with pytest.raises(ValueError):
+            ResultStream(codec).feed(b'{"id": 1, "result": [{"a": x}, 1]}')
+
+    def test_items_arrive_early(self, codec):
+        stream = ResultStream(codec)
+        assert stream.feed(b'{"id": 1, "result": [{"a": 1}, {"b"') == \
+            [{"a": 1}]
+        assert stream.feed(b': 2}]}') == [{"b": 2}]
+
+    def test_memory_is_released(self, codec):
+        stream = ResultStream(codec)
+        stream.feed(b'{"id": 1, "result": [')
+        for i in range(1000):
+            stream.feed(json.dumps({"i": i}).encode("utf8") + b",")
+        assert len(stream._buf) < 20
+
+    def test_empty_array(self, codec):
+        items, stream = parse(codec, b'{"id":1,"result":[]}', 3)
+        assert items == []
+        assert stream.streamed
+
+    def test_non_array(self, codec):
+        items, stream = parse(codec, b'{"id":1,"result":{"a":[1]}}', 3)
+        assert items == []
+        assert not stream.streamed
+        assert stream.close()["result"] == {"a": [1]}
+
+    def test_error(self, codec):
+        data = b'{"id":1,"error":{"code":-32000,"message":"x"}}'
+        items, stream = parse(codec, data, 5)
+        assert stream.close()["error"]["code"] == -32000
+
+    def test_incomplete(self, codec):
+        items, stream = parse(codec, b'{"id":1,"result":[1, 2', 5)
+        assert items == [1]
+        with pytest.raises(ValueError):
+            stream.close()
+
+    def test_batch(self, codec):
+        with pytest.raises(ValueError):
+            ResultStream(codec).feed(b'[{"id": 1}]')
+
+
+class TestIterResult:
+
+    def test_array(self):
+        data = b'{"id":1,"result":[1,2,3]}'
+        assert list(Connector().iter_result(chunked(data, 4))) == [1, 2, 3]
+
+    def test_single(self):
+        data = b'{"id":1,"result":"0x10"}'
+        assert list(Connector().iter_result(chunked(data, 4))) == ["0x10"]
+
+    def test_error(self):
+        data = b'{"id":1,"error":{"code":-32000,"message":"x"}}'
+        with pytest.raises(ServerError):
+            list(Connector().iter_result(chunked(data, 4)))
+
+
+class TestIPCStream:
+
+    def test_stream(self):
+        def handler(request):
+            return dict(jsonrpc="2.0", id=request["id"],
+                        result=[{"n": i} for i in range(5000)])
+        server = FakeIPCServer(handler)
+        try:
+            connector = IPCConnector(server.path, pool_size=1)
+            items = connector.invoke_stream(dict(jsonrpc="2.0", id=1,
+                                                 method="eth_getLogs",
+                                                 params=[]))
+            assert [i["n"] for i in items] == list(range(5000))
+            # the connection was returned in a usable state
+            assert connector.invoke(dict(jsonrpc="2.0", id=2, method="m",
+                                         params=[]))[0]["n"] == 0
+            assert connector.pool._opened == 1
+        finally:
+            server.close()
+
+    def test_abandoned(self):
+        def handler(request):
+            return dict(jsonrpc="2.0", id=request["id"],
+                        result=list(range(100000)))
+        server = FakeIPCServer(handler)
+        try:
+            connector = IPCConnector(server.path, pool_size=1)
+            items = connector.invoke_stream(dict(jsonrpc="2.0", id=1,
+                                                 method="m", params=[]))
+            assert next(items) == 0
+            items.close()
+            assert connector.pool._opened == 0
+        finally:
+            server.close()
+
+
+class TestSpill:
+
+    def handler(self, request):
+        if request["method"] == "fail":
+            return dict(jsonrpc="2.0", id=request["id"],
+                        error=dict(code=-32000, message="failed"))
+        return dict(jsonrpc="2.0", id=request["id"],
+                    result=[{"pc": i, "op": "PUSH1"} for i in range(10000)])
+
+    @pytest.fixture
+    def connector(self, request):
+        server = FakeIPCServer(self.handler)
+        request.addfinalizer(server.close)
+        return IPCConnector(server.path, pool_size=1)
+
+    def test_spill(self, connector):
+        with connector.invoke_to_file(dict(id=1, method="debug_trace",
+                                           params=[])) as response:
+            assert response.size > connector.spill_check_size
+            assert response.mmap()[:1] == b"{"
+            assert [i["pc"] for i in response.iter_result()] == \
+                list(range(10000))
+            assert len(response.result()) == 10000
+        # the connection is reusable
+        assert len(connector.invoke(dict(id=2, method="m", params=[]))) == \
+            10000
+
+    def test_spill_to_file(self, connector, tmpdir):
+        path = str(tmpdir.join("trace.json"))
+        with open(path, "w+b") as f:
+            response = connector.invoke_to_file(
+                dict(id=1, method="debug_trace", params=[]), file=f)
+            assert response.file is f
+        with open(path, "rb") as f:
+            assert len(json.loads(f.read().decode("utf8"))["result"]) == \
+                10000
+
+    def test_error(self, connector):
+        with pytest.raises(ServerError):
+            connector.invoke_to_file(dict(id=1, method="fail", params=[]))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_subscriptions
+----------------------------------
+
+Tests for `empyrean.subscriptions` and `empyrean.websocket` modules.
+"""
+
+import time
+import queue
+import socket
+import asyncio
+import threading
+
+import pytest
+
+from empyrean import websocket
+from empyrean.api import HTTPAPI
+from empyrean.connectors import IPCConnector, WebSocketConnector
+from empyrean.exceptions import MethodNotFound
+
+from .dummy import wait_for
+from .servers import FakeIPCServer, FakeWSServer
+
+
+def handler(request):
+    if request["method"] == "eth_unknown":
+        return dict(jsonrpc="2.0", id=request["id"],
+                    error=dict(code=-32601, message="not found"))
+    return dict(jsonrpc="2.0", id=request["id"],
+                result=[request["method"], request["params"]])
+
+
+@pytest.fixture(params=["ipc", "ws"])
+def node(request):
+    """ (server, connector) for both transports """
+    if request.param == "ipc":
+        server = FakeIPCServer(handler)
+        connector = IPCConnector(server.path)
+    else:
+        server = FakeWSServer(handler)
+        connector = WebSocketConnector(server.url, timeout=2)
+    request.addfinalizer(server.close)
+    return server, connector
+
+
+class TestWebSocket:
+
+    def test_frame_roundtrip(self):
+        for size in (0, 5, 200, 70000):
+            payload = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+            data = websocket.frame(websocket.TEXT, payload)
+            pos = [0]
+
+            def read(n):
+                pos[0] += n
+                return data[pos[0] - n:pos[0]]
+
+            assert websocket.read_frame(read) == (True, websocket.TEXT,
+                                                  payload)
+
+    def test_masked(self):
+        data = websocket.frame(websocket.TEXT, b"hello")
+        assert data[1] & 0x80
+        assert b"hello" not in data
+        assert websocket.frame(websocket.TEXT, b"hello",
+                               mask=False).endswith(b"hello")
+
+    def test_accept_key(self):
+        # the example from RFC 6455
+        assert websocket.accept_key(b"dGhlIHNhbXBsZSBub25jZQ==") == \
+            b"s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+    def test_bad_url(self):
+        with pytest.raises(ValueError):
+            websocket.WebSocket("http://localhost/")
+
+
+class TestWebSocketConnector:
+
+    def test_invoke(self):
+        server = FakeWSServer(handler)
+        try:
+            connector = WebSocketConnector(server.url)
+            assert connector.invoke(dict(id=7, method="a", params=[1])) == \
+                ["a", [1]]
+            with pytest.raises(MethodNotFound):
+                connector.invoke(dict(id=8, method="eth_unknown",
+                                      params=[]))
+            connector.close()
+        finally:
+            server.close()
+
+    def test_batch(self):
+        server = FakeWSServer(handler)
+        try:
+            connector = WebSocketConnector(server.url)
+            batch = [dict(id=1, method="a", params=[]),
+                     dict(id=2, method="eth_unknown", params=[])]
+            res = connector.invoke_batch(batch)
+            assert res[0] == ["a", []]
+            assert isinstance(res[1], MethodNotFound)
+            connector.close()
+        finally:
+            server.close()
+
+    def test_large_response(self):
+        def large(request):
+            return dict(jsonrpc="2.0", id=request["id"],
+                        result=["0x" + "ab" * 64] * 40000)
+        server = FakeWSServer(large)
+        try:
+            connector = WebSocketConnector(server.url)
+            began = time.monotonic()
+            res = connector.invoke(dict(id=1, method="a", params=[]))
+            assert len(res) == 40000
+            # about 5MB, read in linear time
+            assert time.monotonic() - began < 1
+            # and the connection carries on with small ones
+            assert connector.invoke(dict(id=2, method="a",
+                                         params=[])) == res
+            connector.close()
+        finally:
+            server.close()
+
+    def test_concurrent(self):
+        server = FakeWSServer(handler)
+        try:
+            connector = WebSocketConnector(server.url)
+            results = {}
+
+            def call(i):
+                results[i] = connector.invoke(dict(id=1, method="m",
+                                                   params=[i]))
+
+            threads = [threading.Thread(target=call, args=(i,))
+                       for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert results == dict((i, ["m", [i]]) for i in range(20))
+            # all over one connection
+            assert len(server.connections) == 1
+            connector.close()
+        finally:
+            server.close()
+
+    def test_timeout(self):
+        server = FakeWSServer(lambda request: None)
+        try:
+            connector = WebSocketConnector(server.url, timeout=0.05)
+            with pytest.raises(socket.timeout):
+                connector.invoke(dict(id=1, method="a", params=[]))
+            connector.close()
+        finally:
+            server.close()
+
+
+class TestSubscriptions:
+
+    def test_iterate(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads")
+        server.notify("newHeads", {"number": "0x1"})
+        server.notify("newHeads", {"number": "0x2"})
+        assert next(subscription) == {"number": "0x1"}
+        assert next(subscription) == {"number": "0x2"}
+
+    def test_params(self, node):
+        server, connector = node
+        connector.subscribe("logs", {"address": "0x1"})
+        assert server.requests[-1]["params"] == ["logs", {"address": "0x1"}]
+
+    def test_callback(self, node):
+        server, connector = node
+        seen = []
+        connector.subscribe("logs", callback=seen.append)
+        server.notify("logs", {"logIndex": "0x0"})
+        wait_for(lambda: seen)
+        assert seen == [{"logIndex": "0x0"}]
+
+    def test_callback_errors(self, node):
+        server, connector = node
+        seen = []
+
+        def callback(item):
+            seen.append(item)
+            if len(seen) == 1:
+                raise ValueError("bad log")
+        subscription = connector.subscribe("logs", callback=callback)
+        server.notify("logs", {"logIndex": "0x0"})
+        server.notify("logs", {"logIndex": "0x1"})
+        wait_for(lambda: len(seen) == 2)
+        assert subscription.callback_errors == 1
+
+    def test_routing(self, node):
+        server, connector = node
+        heads = connector.subscribe("newHeads")
+        pending = connector.subscribe("newPendingTransactions")
+        server.notify("newPendingTransactions", "0xabc")
+        assert pending.get(1) == "0xabc"
+        with pytest.raises(queue.Empty):
+            heads.get(0.05)
+
+    def test_unsubscribe(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads")
+        subscription.unsubscribe()
+        assert server.subscriptions == {}
+        assert list(subscription) == []
+        assert not subscription.active
+
+    def test_context_manager(self, node):
+        server, connector = node
+        with connector.subscribe("newHeads"):
+            assert len(server.subscriptions) == 1
+        assert server.subscriptions == {}
+
+    def test_drop_oldest(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads", maxsize=2,
+                                           overflow="drop")
+        for i in range(5):
+            server.notify("newHeads", i)
+        wait_for(lambda: subscription.dropped == 3)
+        assert [subscription.get(1), subscription.get(1)] == [3, 4]
+
+    def test_block_pushes_back(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads", maxsize=2)
+        for i in range(5):
+            server.notify("newHeads", i)
+        wait_for(lambda: len(subscription._items) == 2)
+        assert [subscription.get(1) for i in range(5)] == [0, 1, 2, 3, 4]
+        assert subscription.dropped == 0
+
+    def test_connection_lost(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads")
+        server.drop_connections()
+        with pytest.raises(ConnectionError):
+            next(subscription)
+        # a new subscription reconnects
+        connector.subscribe("newHeads")
+        assert len(server.subscriptions) == 2
+
+    def test_async(self, node):
+        server, connector = node
+        subscription = connector.subscribe("newHeads")
+        server.notify("newHeads", 1)
+        server.notify("newHeads", 2)
+
+        async def consume():
+            seen = []
+            async for head in subscription:
+                seen.append(head)
+                if len(seen) == 2:
+                    subscription.unsubscribe()
+            return seen
+
+        assert asyncio.run(consume()) == [1, 2]
+
+    def test_unknown_overflow(self, node):
+        server, connector = node
+        with pytest.raises(ValueError):
+            connector.subscribe("newHeads", overflow="spill")
+
+    def test_http_unsupported(self):
+        with pytest.raises(NotImplementedError):
+            HTTPAPI("http://localhost:8545").eth.subscribe("newHeads")
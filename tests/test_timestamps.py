@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_timestamps
+----------------------------------
+
+Tests for `empyrean.timestamps` module.
+"""
+
+import bisect
+import random
+
+from empyrean.timestamps import BlockTimeIndex
+
+from .dummy import DummyAPI
+
+
+class Chain(object):
+    """ irregular block times, including blocks with equal timestamps """
+
+    def __init__(self, size=100000, seed=1):
+        rnd = random.Random(seed)
+        self.times = [1500000000]
+        for i in range(size - 1):
+            self.times.append(self.times[-1] +
+                              rnd.choice([0, 1, 11, 12, 12, 13, 30]))
+
+    def first_at(self, timestamp):
+        return bisect.bisect_left(self.times, timestamp)
+
+    def __call__(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(len(self.times) - 1)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            if number >= len(self.times):
+                return None
+            return dict(number=params[0], timestamp=hex(self.times[number]))
+        raise AssertionError(method)
+
+
+class TestBlockTimeIndex:
+
+    def test_correct(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain))
+        rnd = random.Random(2)
+        for i in range(200):
+            t = rnd.randint(chain.times[0], chain.times[-1])
+            assert index.block_at(t) == chain.first_at(t)
+
+    def test_exact_and_equal_timestamps(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain))
+        for number in (1, 2, 500, 99998):
+            t = chain.times[number]
+            assert index.block_at(t) == chain.first_at(t)
+
+    def test_fewer_calls_than_bisection(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain))
+        rnd = random.Random(3)
+        for i in range(50):
+            index.block_at(rnd.randint(chain.times[0], chain.times[-1]))
+        # plain bisection over 100000 blocks takes 17 calls each
+        assert index.fetches < 50 * 10
+
+    def test_cached(self):
+        chain = Chain()
+        api = DummyAPI(chain)
+        index = BlockTimeIndex(api)
+        t = chain.times[5000] + 5
+        index.block_at(t)
+        calls = len(api.connector.calls)
+        assert index.block_at(t) == chain.first_at(t)
+        assert len(api.connector.calls) == calls
+
+    def test_nearby_is_cheaper(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain))
+        t = chain.times[50000]
+        index.block_at(t)
+        first = index.fetches
+        index.block_at(t + 3600)
+        assert index.fetches - first < first
+
+    def test_bounds(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain))
+        assert index.block_at(0) == 0
+        assert index.block_at(chain.times[0]) == 0
+        assert index.block_at(chain.times[-1] + 1) is None
+        assert index.block_at(chain.times[-1]) == chain.first_at(
+            chain.times[-1])
+
+    def test_thinning(self):
+        chain = Chain()
+        index = BlockTimeIndex(DummyAPI(chain), max_entries=8)
+        for number in range(20):
+            index.add(number, chain.times[number])
+        assert len(index) <= 8
+        assert index.block_at(chain.times[15]) == chain.first_at(
+            chain.times[15])
+
+    def test_namespace(self):
+        chain = Chain(1000)
+        api = DummyAPI(chain)
+        t = chain.times[400]
+        assert api.eth.block_at_time(t) == chain.first_at(t)
+        assert len(api.eth.time_index) > 0